@@ -0,0 +1,217 @@
+"""
+Admission control for agent turns: one turn at a time per session, a bounded number overall
+
+Nothing limited how many /agent/chat turns ran at once. A double-submitted
+recording started two turns for the same session that both read the history
+before either had queued its messages, so the second answer ignored the first
+and the stored history interleaved; a burst started every turn at once and
+overloaded STT, Gemini and Murf together, so all of them got slow. Now every
+turn is admitted first:
+
+- per session, turns run one after another in arrival order; at most
+  `max_session_queue` more may wait behind the running one, later ones get 429
+- overall, at most `max_concurrent` turns run; up to `max_queue` more wait
+  for a slot in arrival order, beyond that a turn gets 503 right away
+- a turn that would wait longer than `queue_timeout` in total gets 429 (its
+  session stayed busy) or 503 (no slot freed up)
+
+Rejections carry a Retry-After estimate from the recent turn duration and the
+queue ahead. The wait comes before the turn's time budget starts.
+"""
+import asyncio
+import collections
+import functools
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict
+
+from executor import env_float, env_int
+from metrics import ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """A turn that was not admitted: status_code 429 (session busy) or 503 (overloaded)"""
+
+    def __init__(self, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"turn rejected: {reason}")
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Session:
+    """Turn lock of one session, and how many turns hold or wait for it"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.turns = 0
+
+
+class Admission:
+    """An admitted turn; release() (idempotent) hands its session and slot to the next turn"""
+
+    def __init__(self, controller: "AdmissionController", session_id: str, waited_for_session: bool):
+        self._controller = controller
+        self.session_id = session_id
+        # Another turn of the session ran first, so anything read before admission is stale
+        self.waited_for_session = waited_for_session
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+
+class AdmissionController:
+    """
+    Serializes turns per session and bounds concurrent turns with a bounded wait queue
+
+    - **max_concurrent**: Turns running at once in this worker
+    - **max_queue**: Turns waiting for a slot before new ones are rejected with 503
+    - **queue_timeout**: Longest a turn waits (for its session, then for a slot)
+    - **max_session_queue**: Turns of one session waiting behind its running turn before 429
+    """
+
+    def __init__(self, max_concurrent: int = 16, max_queue: int = 32, queue_timeout: float = 10.0,
+                 max_session_queue: int = 1):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_session_queue = max_session_queue
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        self._sessions: Dict[str, _Session] = {}
+        # Moving average of how long an admitted turn holds its slot, for Retry-After
+        self.turn_seconds = 2.0
+        self.counters = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_session_busy": 0,
+            "rejected_queue_full": 0,
+            "rejected_queue_timeout": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Limits from AGENT_MAX_CONCURRENT_TURNS, AGENT_TURN_QUEUE_SIZE, AGENT_TURN_QUEUE_TIMEOUT_SECONDS, AGENT_SESSION_QUEUE_SIZE"""
+        return cls(
+            max_concurrent=env_int("AGENT_MAX_CONCURRENT_TURNS", 16),
+            max_queue=env_int("AGENT_TURN_QUEUE_SIZE", 32),
+            queue_timeout=env_float("AGENT_TURN_QUEUE_TIMEOUT_SECONDS", 10.0),
+            max_session_queue=env_int("AGENT_SESSION_QUEUE_SIZE", 1),
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _retry_after(self, turns_ahead: float) -> int:
+        return max(1, math.ceil(self.turn_seconds * turns_ahead))
+
+    def _reject(self, reason: str, status_code: int, turns_ahead: float) -> AdmissionRejected:
+        self.counters[f"rejected_{reason}"] += 1
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        logger.warning(f"🚦 Turn rejected ({reason}): {self.in_flight} running, {self.queued} queued")
+        return AdmissionRejected(reason, status_code, self._retry_after(turns_ahead))
+
+    async def acquire(self, session_id: str) -> Admission:
+        """
+        Wait for the session's previous turn and a free slot
+
+        Raises AdmissionRejected without waiting if the session's or the global queue is full,
+        or once queue_timeout has passed.
+        """
+        session = self._sessions.get(session_id)
+        if session is not None and session.turns > self.max_session_queue:
+            raise self._reject("session_busy", 429, session.turns)
+        if session is None:
+            session = self._sessions[session_id] = _Session()
+        session.turns += 1
+
+        start = time.monotonic()
+        waited_for_session = session.lock.locked()
+        try:
+            try:
+                await asyncio.wait_for(session.lock.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject("queue_timeout", 429, session.turns - 1) from None
+            try:
+                await self._acquire_slot(self.queue_timeout - (time.monotonic() - start))
+            except BaseException:
+                session.lock.release()
+                raise
+        except BaseException:
+            self._leave_session(session_id, session)
+            raise
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
+        self.counters["admitted"] += 1
+        return Admission(self, session_id, waited_for_session)
+
+    async def _acquire_slot(self, timeout: float) -> None:
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full", 503, (self.queued + self.in_flight) / self.max_concurrent)
+        self.counters["queued"] += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # A released slot is handed over by setting the result (in_flight stays the same)
+            await asyncio.wait_for(asyncio.shield(waiter), max(0.0, timeout))
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()  # the slot arrived as the wait ended - pass it on
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("queue_timeout", 503, (self.queued + self.in_flight) / self.max_concurrent) from None
+            raise
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _leave_session(self, session_id: str, session: _Session) -> None:
+        session.turns -= 1
+        if session.turns == 0:
+            del self._sessions[session_id]
+
+    def _release(self, admission: Admission) -> None:
+        self.turn_seconds = 0.8 * self.turn_seconds + 0.2 * (time.monotonic() - admission.started)
+        self._release_slot()
+        session = self._sessions[admission.session_id]
+        session.lock.release()
+        self._leave_session(admission.session_id, session)
+
+    def admitted(self, fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """Decorator admitting each call of an endpoint with a session_id parameter for its whole duration"""
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            admission = await self.acquire(kwargs["session_id"])
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                admission.release()
+        return wrapper
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "sessions": len(self._sessions),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "turn_seconds": round(self.turn_seconds, 3),
+        }
@@ -0,0 +1,266 @@
+"""
+Optional audio preprocessing in front of batch transcription (AUDIO_PREPROCESS=on)
+
+Browser recordings arrive at 44.1/48 kHz, sometimes in stereo, with the
+silence before and after the user spoke. AssemblyAI uploads, bills and
+transcribes all of it. `preprocess_audio()` turns an upload into what the STT
+actually needs:
+
+1. decode to PCM: WAV with the standard library, anything else (WebM/Opus,
+   OGG, MP3) through an `ffmpeg` binary if there is one on PATH; without it
+   those uploads are passed through untouched
+2. downmix to mono and resample to 16 kHz
+3. energy-based VAD: per-frame RMS level in dBFS against a threshold; the
+   frames before the first and after the last voiced frame are trimmed,
+   keeping some padding around the speech
+4. re-encode: 16-bit PCM WAV, or FLAC/Opus through ffmpeg
+
+A clip without enough voiced frames is reported as having no speech, so the
+caller can answer without paying for a transcription at all.
+
+All of this needs NumPy; without it every upload is passed through untouched,
+and importing this module never needs it.
+"""
+import io
+import logging
+import os
+import shutil
+import subprocess
+import wave
+from typing import BinaryIO, Optional, Tuple
+
+from executor import env_float, env_int
+from uploads import AudioUpload
+
+try:
+    import numpy as np
+except ImportError:  # optional: preprocessing is skipped
+    np = None
+
+logger = logging.getLogger(__name__)
+
+TARGET_SAMPLE_RATE = 16000
+CODECS = {"wav": "wav", "flac": "flac", "opus": "ogg"}  # codec -> container format
+
+
+class PreprocessConfig:
+    """
+    Thresholds of the preprocessing stage
+
+    - **threshold_db**: Frames quieter than this (dBFS RMS) count as silence
+    - **padding_ms**: Audio kept before the first and after the last voiced frame
+    - **frame_ms**: VAD frame length
+    - **min_speech_ms**: Voiced audio needed for a clip to count as speech
+    - **codec**: "wav", "flac" or "opus" (the last two need ffmpeg)
+    - **max_seconds**: Longer recordings are passed through, which bounds the decoded PCM in memory
+    """
+
+    def __init__(self, threshold_db: float = -45.0, padding_ms: int = 250, frame_ms: int = 30,
+                 min_speech_ms: int = 90, codec: str = "wav", max_seconds: int = 300,
+                 ffmpeg: Optional[str] = None):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec!r}, expected one of {', '.join(CODECS)}")
+        self.threshold_db = threshold_db
+        self.padding_ms = padding_ms
+        self.frame_ms = frame_ms
+        self.min_speech_ms = min_speech_ms
+        self.ffmpeg = ffmpeg
+        if codec != "wav" and ffmpeg is None:
+            logger.warning(f"⚠️ No ffmpeg found for AUDIO_PREPROCESS_CODEC={codec}, encoding WAV instead")
+            codec = "wav"
+        self.codec = codec
+        self.max_seconds = max_seconds
+
+    @classmethod
+    def from_env(cls) -> "PreprocessConfig":
+        """Defaults overridden by AUDIO_VAD_* / AUDIO_PREPROCESS_CODEC; ffmpeg looked up on PATH"""
+        if np is None:
+            logger.warning("⚠️ NumPy is not installed, uploads are transcribed without preprocessing")
+        codec = os.getenv("AUDIO_PREPROCESS_CODEC", "wav")
+        if codec not in CODECS:
+            logger.warning(f"⚠️ Ignoring invalid AUDIO_PREPROCESS_CODEC={codec!r}, using wav")
+            codec = "wav"
+        return cls(
+            threshold_db=env_float("AUDIO_VAD_THRESHOLD_DB", -45.0),
+            padding_ms=env_int("AUDIO_VAD_PADDING_MS", 250),
+            min_speech_ms=env_int("AUDIO_VAD_MIN_SPEECH_MS", 90),
+            max_seconds=env_int("AUDIO_PREPROCESS_MAX_SECONDS", 300),
+            codec=codec,
+            ffmpeg=shutil.which("ffmpeg"),
+        )
+
+
+class ProcessedAudio:
+    """
+    Result of preprocess_audio()
+
+    - **data**: Encoded audio to transcribe instead of the upload (empty without speech)
+    - **format**: Container of data ("wav", "flac" or "ogg")
+    - **original_seconds** / **seconds**: Duration before and after trimming
+    - **has_speech**: False if no part of the clip passed the VAD
+    """
+
+    def __init__(self, data: bytes, format: str, original_bytes: int, original_seconds: float,
+                 seconds: float, has_speech: bool):
+        self.data = data
+        self.format = format
+        self.original_bytes = original_bytes
+        self.original_seconds = original_seconds
+        self.seconds = seconds
+        self.has_speech = has_speech
+
+    @property
+    def improves_on_original(self) -> bool:
+        """Shorter or smaller than the upload (re-encoding a short, already-compact WebM can grow it)"""
+        return self.seconds < self.original_seconds or len(self.data) < self.original_bytes
+
+
+def _pcm_to_float(frames: bytes, sample_width: int, channels: int) -> "np.ndarray":
+    """Interleaved little-endian PCM to mono float32 in [-1, 1]"""
+    if sample_width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 2**15
+    elif sample_width == 3:
+        # Pad each 24-bit sample to 32 bits (low byte zero), keeping the sign in the top byte
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((len(raw), 4), dtype=np.uint8)
+        padded[:, 1:] = raw
+        samples = padded.view("<i4").reshape(-1).astype(np.float32) / 2**31
+    elif sample_width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2**31
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def _decode_wav(file: BinaryIO, max_seconds: int) -> Optional[Tuple["np.ndarray", int]]:
+    with wave.open(file, "rb") as reader:
+        rate = reader.getframerate()
+        if reader.getnframes() > max_seconds * rate:
+            return None
+        frames = reader.readframes(reader.getnframes())
+        return _pcm_to_float(frames, reader.getsampwidth(), reader.getnchannels()), rate
+
+
+def _decode_ffmpeg(file: BinaryIO, ffmpeg: str, max_seconds: int) -> Optional[Tuple["np.ndarray", int]]:
+    """Decode, downmix and resample any container ffmpeg knows to 16 kHz mono"""
+    limit = max_seconds * TARGET_SAMPLE_RATE * 2
+    # stdin=file uses its descriptor (a SpooledTemporaryFile rolls over to disk for this)
+    process = subprocess.Popen(
+        [ffmpeg, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "s16le", "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE), "pipe:1"],
+        stdin=file, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    pcm = b""
+    try:
+        pcm = process.stdout.read(limit + 1)
+    finally:
+        if len(pcm) > limit or process.poll() is None and not pcm:
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+    if len(pcm) > limit:
+        return None  # too long to be worth decoding in memory
+    if returncode != 0:
+        logger.warning(f"⚠️ ffmpeg could not decode the upload (exit code {returncode})")
+        return None
+    return _pcm_to_float(pcm, 2, 1), TARGET_SAMPLE_RATE
+
+
+def _decode(upload: AudioUpload, config: PreprocessConfig) -> Optional[Tuple["np.ndarray", int]]:
+    upload.file.seek(0)
+    if upload.format == "wav":
+        try:
+            return _decode_wav(upload.file, config.max_seconds)
+        except (wave.Error, EOFError, ValueError) as e:
+            # e.g. IEEE float or compressed WAV - ffmpeg can still read those
+            logger.debug(f"wave module can't decode the upload: {e}")
+            upload.file.seek(0)
+    if config.ffmpeg is None:
+        return None
+    return _decode_ffmpeg(upload.file, config.ffmpeg, config.max_seconds)
+
+
+def resample(samples: "np.ndarray", rate: int, target: int) -> "np.ndarray":
+    """
+    Resample in the frequency domain
+
+    Truncating the spectrum at the new Nyquist frequency is the anti-aliasing
+    low-pass; one FFT pair per clip is cheaper than a long FIR filter.
+    """
+    if rate == target or len(samples) == 0:
+        return samples
+    length = max(1, int(round(len(samples) * target / rate)))
+    # irfft crops (or zero-pads) the spectrum to length // 2 + 1 bins
+    return (np.fft.irfft(np.fft.rfft(samples), length) * (length / len(samples))).astype(np.float32)
+
+
+def speech_bounds(samples: "np.ndarray", rate: int, config: PreprocessConfig) -> Optional[Tuple[int, int]]:
+    """Sample range from the first to the last voiced frame plus padding, or None without speech"""
+    frame = max(1, rate * config.frame_ms // 1000)
+    count = len(samples) // frame
+    if count == 0:
+        return None
+    frames = samples[:count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    level_db = 20 * np.log10(np.maximum(rms, 1e-10))
+    voiced = np.flatnonzero(level_db > config.threshold_db)
+    if len(voiced) * config.frame_ms < config.min_speech_ms:
+        return None
+    padding = rate * config.padding_ms // 1000
+    return max(0, voiced[0] * frame - padding), min(len(samples), (voiced[-1] + 1) * frame + padding)
+
+
+def encode(samples: "np.ndarray", rate: int, codec: str, ffmpeg: Optional[str] = None) -> bytes:
+    """Mono float samples to a WAV, FLAC or Ogg/Opus file"""
+    pcm = (np.clip(samples, -1, 1) * (2**15 - 1)).astype("<i2").tobytes()
+    if codec == "wav":
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(rate)
+            writer.writeframes(pcm)
+        return buffer.getvalue()
+    codec_args = ["-c:a", "flac", "-f", "flac"] if codec == "flac" else \
+        ["-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg"]
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-loglevel", "error", "-f", "s16le", "-ac", "1", "-ar", str(rate),
+         "-i", "pipe:0", *codec_args, "pipe:1"],
+        input=pcm, capture_output=True, check=True,
+    )
+    return result.stdout
+
+
+def preprocess_audio(upload: AudioUpload, config: PreprocessConfig) -> Optional[ProcessedAudio]:
+    """
+    Decode, downmix, resample, trim and re-encode an upload (blocking; run it off the event loop)
+
+    Returns None when the upload can't be decoded here (no NumPy or ffmpeg, a
+    WAV encoding the wave module doesn't read, longer than max_seconds); the
+    caller then transcribes the upload as it is. upload.file is left at an
+    arbitrary position.
+    """
+    if np is None:
+        return None
+    decoded = _decode(upload, config)
+    if decoded is None:
+        return None
+
+    samples, rate = decoded
+    original_seconds = len(samples) / rate
+    target = min(rate, TARGET_SAMPLE_RATE)
+    samples = resample(samples, rate, target)
+
+    bounds = speech_bounds(samples, target, config)
+    if bounds is None:
+        return ProcessedAudio(b"", CODECS[config.codec], upload.size, original_seconds, 0.0, False)
+    start, end = bounds
+    samples = samples[start:end]
+    return ProcessedAudio(
+        encode(samples, target, config.codec, config.ffmpeg), CODECS[config.codec],
+        upload.size, original_seconds, len(samples) / target, True,
+    )
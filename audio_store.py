@@ -0,0 +1,300 @@
+"""
+Local store for synthesized speech, served from /api/audio/{audio_id}.mp3 (AUDIO_STORE=on)
+
+The agent used to hand the browser Murf's `audio_file` URL: a third-party
+link that expires after 72 hours, so old chat turns couldn't be replayed and
+delivery latency was out of our hands. With the store, Murf is asked for
+base64 output instead (nothing is retained on Murf's side) and the MP3 is
+written once under AUDIO_STORE_DIR, addressed by the same text + voice hash
+as the TTS cache:
+
+- `AudioStore.get_or_create()`: a stored file is a hit; concurrent requests
+  for the same missing audio share one generation
+- size-bounded: beyond `max_bytes`, the least recently served files are
+  deleted (recency survives restarts only as creation order)
+- `AudioFileResponse`: single-range `Range` requests (206/416), a strong
+  `ETag` with `If-None-Match` / `If-Range`, and immutable cache headers - an
+  audio ID always names the same bytes. The body goes out through the ASGI
+  zero-copy send extension (sendfile) when the server offers it, otherwise in
+  chunks read on a worker thread.
+"""
+import asyncio
+import base64
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from executor import env_int
+
+logger = logging.getLogger(__name__)
+
+AUDIO_ID = re.compile(r"^[0-9a-f]{64}$")
+EXTENSION = ".mp3"
+MEDIA_TYPE = "audio/mpeg"
+URL_PREFIX = "/api/audio/"
+CHUNK_SIZE = 64 * 1024
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class AudioStore:
+    """
+    Size-bounded directory of generated MP3 files
+
+    - **directory**: Where the files live (created if missing)
+    - **max_bytes**: Total size kept; least recently served files are evicted beyond it
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # audio_id -> size in bytes, least recently served first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "deduplicated": 0,
+            "stored": 0,
+            "evictions": 0,
+        }
+
+    @classmethod
+    def from_env(cls, default_directory: Path) -> "AudioStore":
+        """AUDIO_STORE_DIR (default: default_directory) bounded by AUDIO_STORE_MAX_MB"""
+        return cls(
+            Path(os.getenv("AUDIO_STORE_DIR") or default_directory),
+            max_bytes=env_int("AUDIO_STORE_MAX_MB", 512) * 1024 * 1024,
+        )
+
+    def load(self) -> None:
+        """
+        Index the files already on disk, oldest first, and evict down to max_bytes
+
+        Blocking (one stat per file) - run it off the event loop.
+        """
+        found = []
+        for path in self.directory.glob(f"*{EXTENSION}"):
+            if AUDIO_ID.match(path.stem):
+                stat = path.stat()
+                found.append((stat.st_mtime, path.stem, stat.st_size))
+        with self._lock:
+            for _, audio_id, size in sorted(found):
+                self._files[audio_id] = size
+                self.total_bytes += size
+        self._evict()
+        logger.info(f"🗄️ Audio store: {len(self._files)} files, {self.total_bytes / 1e6:.1f} MB in {self.directory}")
+
+    def path(self, audio_id: str) -> Path:
+        return self.directory / f"{audio_id}{EXTENSION}"
+
+    @staticmethod
+    def url(audio_id: str) -> str:
+        return f"{URL_PREFIX}{audio_id}{EXTENSION}"
+
+    def contains(self, audio_id: str) -> bool:
+        with self._lock:
+            return audio_id in self._files
+
+    def touch(self, audio_id: str) -> bool:
+        """Mark a file as just served; False if the store doesn't have it"""
+        with self._lock:
+            if audio_id not in self._files:
+                return False
+            self._files.move_to_end(audio_id)
+            return True
+
+    def put(self, audio_id: str, data: bytes) -> None:
+        """
+        Write a file atomically (temp file + rename) and evict beyond max_bytes
+
+        Blocking - run it off the event loop.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as temp:
+                temp.write(data)
+            os.replace(temp_path, self.path(audio_id))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        with self._lock:
+            self.total_bytes += len(data) - self._files.pop(audio_id, 0)
+            self._files[audio_id] = len(data)
+            self.counters["stored"] += 1
+        self._evict()
+
+    def put_base64(self, audio_id: str, encoded: str) -> None:
+        """put() for a base64 payload (Murf's encodeAsBase64 output)"""
+        self.put(audio_id, base64.b64decode(encoded))
+
+    def _evict(self) -> None:
+        while True:
+            with self._lock:
+                # Never evict the newest file, even if it alone exceeds max_bytes
+                if self.total_bytes <= self.max_bytes or len(self._files) <= 1:
+                    return
+                audio_id, size = self._files.popitem(last=False)
+                self.total_bytes -= size
+                self.counters["evictions"] += 1
+            try:
+                self.path(audio_id).unlink()
+            except FileNotFoundError:
+                pass
+
+    async def get_or_create(self, audio_id: str,
+                            generate: Callable[[], Awaitable[bool]]) -> Tuple[Optional[str], bool]:
+        """
+        URL of the stored audio, calling generate() to produce it on a miss
+
+        - **generate**: Async callable that stores the audio under audio_id (e.g. via
+          put_base64 on a worker thread) and returns False if there was none to store
+
+        Returns (URL or None, whether it was already stored). Exceptions propagate,
+        also to concurrent callers sharing the generation; if the generating caller
+        is cancelled, a waiting caller generates the audio itself.
+        """
+        while True:
+            if self.touch(audio_id):
+                self.counters["hits"] += 1
+                return self.url(audio_id), True
+
+            in_flight = self._in_flight.get(audio_id)
+            if in_flight is None:
+                break
+            self.counters["deduplicated"] += 1
+            try:
+                return await asyncio.shield(in_flight), False
+            except asyncio.CancelledError:
+                if not in_flight.cancelled():
+                    raise  # this caller was cancelled, not the one generating
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[audio_id] = future
+        try:
+            self.counters["misses"] += 1
+            url = self.url(audio_id) if await generate() else None
+            future.set_result(url)
+            return url, False
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved, so waiter-less failures don't log "never retrieved"
+            raise
+        except BaseException:
+            future.cancel()  # waiting callers take over rather than inherit the cancellation
+            raise
+        finally:
+            del self._in_flight[audio_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            files, total = len(self._files), self.total_bytes
+        return {**self.counters, "files": files, "bytes": total, "max_bytes": self.max_bytes}
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end inclusive) of a single `bytes=` range, None for the whole file
+
+    Raises ValueError for a range that can't be satisfied. Multiple ranges are
+    answered with the whole file, which RFC 9110 allows.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None  # multipart or another unit
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(f"range {header} outside {size} bytes")
+    return start, end
+
+
+class AudioFileResponse(Response):
+    """
+    A stored audio file with Range, ETag and immutable cache headers
+
+    The file is stat'ed up front; `range_header` / `if_none_match` / `if_range`
+    come from the request.
+    """
+
+    def __init__(self, path: Path, range_header: Optional[str] = None, if_none_match: Optional[str] = None,
+                 if_range: Optional[str] = None, media_type: str = MEDIA_TYPE):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        # Files are written once (atomic rename), so size + mtime identify the bytes
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        super().__init__(status_code=200, media_type=media_type, headers={
+            "ETag": etag,
+            "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+            "Cache-Control": CACHE_CONTROL,
+            "Accept-Ranges": "bytes",
+        })
+        self.start, self.end = 0, self.size - 1
+
+        if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match == "*":
+            self.status_code = 304
+            self.end = -1
+            return
+        if if_range and if_range != etag:
+            range_header = None  # the client's partial copy is of other bytes - send everything
+        try:
+            byte_range = parse_range(range_header, self.size)
+        except ValueError:
+            self.status_code = 416
+            self.headers["Content-Range"] = f"bytes */{self.size}"
+            self.end = -1
+            byte_range = None
+        if byte_range is not None:
+            self.status_code = 206
+            self.start, self.end = byte_range
+            self.headers["Content-Range"] = f"bytes {self.start}-{self.end}/{self.size}"
+        self.headers["Content-Length"] = str(self.end - self.start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1
+        if count <= 0 or scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        zero_copy = "http.response.zerocopysend" in scope.get("extensions", {})
+        async with await anyio.open_file(self.path, "rb") as file:
+            if zero_copy:
+                # The server sendfile()s straight from the descriptor
+                await send({"type": "http.response.zerocopysend", "file": file.wrapped.fileno(),
+                            "offset": self.start, "count": count})
+                return
+            await file.seek(self.start)
+            while count > 0:
+                chunk = await file.read(min(CHUNK_SIZE, count))
+                if not chunk:
+                    break
+                count -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+            if count > 0:
+                await send({"type": "http.response.body", "body": b""})  # truncated since the stat
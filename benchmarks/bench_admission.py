@@ -0,0 +1,103 @@
+"""
+Benchmark: /agent/chat under double submits and bursts, without vs with admission control
+
+- double-submit: --sessions sessions each send the same recording twice at
+  once (a double click). Reports how many second turns saw the first turn in
+  their history (chat_history_length 4 instead of 2).
+- burst: --burst turns of different sessions arrive together, with admission
+  limits of --max-concurrent running and --queue waiting. Reports latency of
+  the turns that ran, and how many were turned away, how fast and with what
+  Retry-After.
+
+`without` admits every turn at once, as before.
+
+Usage:
+    python benchmarks/bench_admission.py --sessions 20 --burst 80 --max-concurrent 8 --queue 16
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import statistics
+import time
+
+from stubs import StubGeminiClient, fake_webm, install_stubs, load_app, percentile
+
+
+class UnlimitedTurn:
+    waited_for_session = False
+
+    def release(self):
+        pass
+
+
+async def admit_everything(session_id):
+    """Admission as before: no per-session order, no limits"""
+    return UnlimitedTurn()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions double-submitting a turn")
+    parser.add_argument("--burst", type=int, default=80, help="Turns arriving together in the burst")
+    parser.add_argument("--max-concurrent", type=int, default=8, help="AGENT_MAX_CONCURRENT_TURNS")
+    parser.add_argument("--queue", type=int, default=16, help="AGENT_TURN_QUEUE_SIZE")
+    args = parser.parse_args()
+
+    main = load_app()
+    install_stubs(main)
+    # A different reply per turn, so the TTS store doesn't hide Murf calls
+    replies = itertools.count()
+    StubGeminiClient.reply = property(lambda self: f"Reply {next(replies)}: happy to help with that.")
+    controller = main.admission
+    controller.max_concurrent, controller.max_queue = args.max_concurrent, args.queue
+
+    async def run():
+        import httpx
+
+        results = {}
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+                async def turn(session_id):
+                    start = time.perf_counter()
+                    files = {"audio_file": ("recording.webm", fake_webm(), "audio/webm")}
+                    response = await http.post(f"/agent/chat/{session_id}", files=files)
+                    return response.status_code, response.json(), response.headers, time.perf_counter() - start
+
+                for mode in ("without", "with"):
+                    if mode == "without":
+                        controller.acquire = admit_everything
+                    else:
+                        del controller.acquire
+                    # Double submits
+                    pairs = await asyncio.gather(*(
+                        asyncio.gather(turn(f"{mode}-double-{i}"), turn(f"{mode}-double-{i}"))
+                        for i in range(args.sessions)))
+                    saw_first = sum(max(a[1].get("chat_history_length", 0), b[1].get("chat_history_length", 0)) == 4
+                                    for a, b in pairs)
+                    # Burst
+                    start = time.perf_counter()
+                    burst = await asyncio.gather(*(turn(f"{mode}-burst-{i}") for i in range(args.burst)))
+                    wall = time.perf_counter() - start
+                    results[mode] = (saw_first, burst, wall)
+        return results
+
+    results = asyncio.run(run())
+    print(f"{args.sessions} double-submitted sessions; burst of {args.burst} turns, "
+          f"limits {args.max_concurrent} running + {args.queue} queued")
+    for mode, (saw_first, burst, wall) in results.items():
+        ok = [seconds for status, _, _, seconds in burst if status == 200]
+        rejected = [(status, seconds, int(headers["retry-after"])) for status, _, headers, seconds in burst if status != 200]
+        statuses = collections.Counter(status for status, _, _, _ in burst)
+        line = (f"  {mode:<8} double-submit: {saw_first}/{args.sessions} second turns saw the first | "
+                f"burst {wall:5.2f}s {dict(sorted(statuses.items()))}  ran p50={statistics.median(ok):5.2f}s "
+                f"p99={percentile(ok, 99):5.2f}s")
+        if rejected:
+            line += (f"  rejected in p50={statistics.median(r[1] for r in rejected) * 1000:4.0f}ms "
+                     f"Retry-After {min(r[2] for r in rejected)}-{max(r[2] for r in rejected)}s")
+        print(line)
+
+
+if __name__ == "__main__":
+    main_cli()
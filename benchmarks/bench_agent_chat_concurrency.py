@@ -0,0 +1,96 @@
+"""
+Load benchmark: N concurrent /agent/chat/{session_id} turns against stub upstreams
+
+Compares the old behaviour (blocking SDK calls made directly on the event loop)
+with the execution layer (per-upstream bounded thread pools). With the pools,
+N concurrent turns should finish in roughly one turn's latency (max-latency),
+not N times it (sum-latency).
+
+Usage:
+    python benchmarks/bench_agent_chat_concurrency.py --turns 20
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from stubs import fake_webm, install_stubs, load_app
+
+
+class InlineExecutor:
+    """The pre-executor behaviour: run the blocking call right on the event loop"""
+    limits = {}
+
+    async def acquire(self, service, timeout=None):
+        pass
+
+    def submit(self, service, fn, *args, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def release(self, service):
+        pass
+
+    async def run(self, service, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+async def run_turns(main, turns: int, prefix: str) -> float:
+    import httpx
+
+    # ASGITransport doesn't run the lifespan (chat writer, client registry) - do it here
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+            async def one_turn(i: int):
+                files = {"audio_file": ("recording.webm", fake_webm(), "audio/webm")}
+                response = await http.post(f"/agent/chat/{prefix}_{i}", files=files)
+                body = response.json()
+                assert body.get("success"), body
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one_turn(i) for i in range(turns)))
+            elapsed = time.perf_counter() - start
+    # The lifespan flushed the write-behind queue on exit
+    persisted = [main.get_chat_history(f"{prefix}_{i}") for i in range(turns)]
+    assert all(len(history) == 2 for history in persisted), "chat turns were not persisted"
+    return elapsed
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=20, help="Concurrent turns to run")
+    args = parser.parse_args()
+
+    # Every turn is admitted at once - this compares the executors, not admission control
+    os.environ.setdefault("AGENT_MAX_CONCURRENT_TURNS", str(args.turns))
+    os.environ.setdefault("AGENT_TURN_QUEUE_TIMEOUT_SECONDS", "600")
+    main = load_app()
+    lat = install_stubs(main)
+    # STT + history read + LLM + TTS (the turn's single write happens behind the response)
+    single_turn = lat["stt"] + lat["llm"] + lat["tts"] + lat["mongodb"]
+
+    pooled = main.upstreams
+    results = {}
+    for index, (mode, executor) in enumerate((("inline (blocking)", InlineExecutor()), ("pooled", pooled))):
+        # Resilience.call runs on its own reference to the executor
+        main.upstreams = main.resilience.executor = executor
+        results[mode] = asyncio.run(run_turns(main, args.turns, f"bench{index}"))
+    main.upstreams = main.resilience.executor = pooled
+    pooled.shutdown()
+
+    print(f"turns={args.turns}  single-turn latency≈{single_turn:.2f}s  "
+          f"sum-latency≈{single_turn * args.turns:.2f}s  limits={pooled.limits}")
+    for mode, elapsed in results.items():
+        print(f"  {mode:<18} wall={elapsed:6.2f}s  ({elapsed / single_turn:5.1f}x single turn)")
+
+
+if __name__ == "__main__":
+    main_cli()
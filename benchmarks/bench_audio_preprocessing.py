@@ -0,0 +1,134 @@
+"""
+Benchmark: bytes sent to STT and /transcribe/file latency, with and without AUDIO_PREPROCESS
+
+The fixtures are synthetic browser-style recordings: 48 kHz stereo 16-bit WAV
+with room noise around a voiced, syllable-modulated "speech" section (and a
+short pause inside it, which must survive trimming). The stub transcriber
+costs its base latency, plus the upload at --uplink-mbps, plus
+--stt-realtime-factor x the audio duration, which is roughly how a hosted
+batch STT behaves.
+
+WebM/Opus fixtures would need ffmpeg to decode; without one on PATH those
+uploads are passed through unchanged, so only WAV is measured here.
+
+Usage:
+    python benchmarks/bench_audio_preprocessing.py --repeats 5
+"""
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import time
+import wave
+
+import numpy as np
+
+from stubs import StubTranscriber, asgi_post, install_stubs, load_app, wav_seconds
+
+RATE = 48000
+
+# name -> (leading silence, speech, trailing silence) in seconds
+FIXTURES = {
+    "short question": (1.0, 2.0, 1.2),
+    "hesitant start": (3.0, 3.5, 1.5),
+    "long answer": (0.5, 12.0, 2.0),
+    "no speech": (4.0, 0.0, 0.0),
+}
+
+
+def synthetic_recording(lead: float, speech: float, tail: float, seed: int = 0) -> bytes:
+    """Stereo 48 kHz WAV: room noise (~-65 dBFS), voiced speech (~-20 dBFS) with a 0.4 s pause in the middle"""
+    rng = np.random.default_rng(seed)
+    total = int((lead + speech + tail) * RATE)
+    audio = rng.normal(0, 10 ** (-65 / 20), total)
+    if speech:
+        t = np.arange(int(speech * RATE)) / RATE
+        f0 = 140 + 15 * np.sin(2 * np.pi * 0.7 * t)
+        phase = 2 * np.pi * np.cumsum(f0) / RATE
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+        syllables = np.abs(np.sin(2 * np.pi * 2.0 * t)) ** 0.5
+        pause = (t > speech / 2 - 0.2) & (t < speech / 2 + 0.2)
+        syllables[pause] = 0
+        voiced *= syllables * 10 ** (-20 / 20) / np.sqrt(np.mean(voiced ** 2))
+        start = int(lead * RATE)
+        audio[start:start + len(voiced)] += voiced
+    stereo = np.repeat((np.clip(audio, -1, 1) * 32767).astype("<i2")[:, None], 2, axis=1)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(2)
+        writer.setsampwidth(2)
+        writer.setframerate(RATE)
+        writer.writeframes(stereo.tobytes())
+    return buffer.getvalue()
+
+
+def record_stt_input():
+    """Wrap StubTranscriber.transcribe to record the bytes and audio seconds of every call"""
+    calls = []
+    transcribe = StubTranscriber.transcribe
+
+    def recording(self, data, config=None):
+        raw = data.getvalue() if isinstance(data, io.BytesIO) else None
+        if raw is None:
+            raw = data.read()
+            data.seek(0)
+        calls.append((len(raw), wav_seconds(raw[:64 * 1024])))
+        return transcribe(self, data, config)
+
+    StubTranscriber.transcribe = recording
+    return calls
+
+
+async def transcribe(main, audio: bytes) -> dict:
+    body = []
+    start = time.perf_counter()
+    await asgi_post(main.app, "/transcribe/file", {"audio_file": ("recording.wav", audio, "audio/wav")}, body.append)
+    return {"seconds": time.perf_counter() - start, "response": json.loads(b"".join(body))}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeats", type=int, default=5, help="Requests per fixture and mode")
+    parser.add_argument("--uplink-mbps", type=float, default=10.0, help="Upload bandwidth to the STT service")
+    parser.add_argument("--stt-realtime-factor", type=float, default=0.1,
+                        help="Batch STT seconds per second of audio, on top of its base latency")
+    args = parser.parse_args()
+
+    main = load_app()
+    install_stubs(main)
+    StubTranscriber.per_byte = 8 / (args.uplink_mbps * 1e6)
+    StubTranscriber.per_audio_second = args.stt_realtime_factor
+    calls = record_stt_input()
+    fixtures = {name: synthetic_recording(*spec) for name, spec in FIXTURES.items()}
+    modes = {"original": None, "preprocessed": main.PreprocessConfig()}
+
+    async def run():
+        results = {}
+        async with main.lifespan(main.app):
+            for mode, config in modes.items():
+                main.audio_preprocess = config
+                for name, audio in fixtures.items():
+                    samples = []
+                    for _ in range(args.repeats):
+                        calls.clear()
+                        result = await transcribe(main, audio)
+                        sent = calls[0] if calls else (0, 0.0)
+                        samples.append((result["seconds"], sent, result["response"].get("error")))
+                    results[mode, name] = samples
+        return results
+
+    results = asyncio.run(run())
+    print(f"stt={StubTranscriber.latency}s + upload at {args.uplink_mbps:g} Mbit/s "
+          f"+ {args.stt_realtime_factor}x audio; {args.repeats} requests per row")
+    print(f"  {'fixture':<15} {'mode':<13} {'upload':>9} {'sent to STT':>17} {'p50 latency':>12}  result")
+    for (mode, name), samples in results.items():
+        latency = statistics.median(s[0] for s in samples) * 1000
+        sent_bytes, sent_seconds = samples[0][1]
+        outcome = samples[0][2] or "transcribed"
+        print(f"  {name:<15} {mode:<13} {len(fixtures[name]) / 1024:7.0f}KB "
+              f"{sent_bytes / 1024:7.0f}KB {sent_seconds:6.1f}s {latency:9.0f}ms  {outcome}")
+
+
+if __name__ == "__main__":
+    main_cli()
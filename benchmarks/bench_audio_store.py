@@ -0,0 +1,132 @@
+"""
+Benchmark: serving synthesized audio from the local store (/api/audio/{id}.mp3)
+
+Synthesizes --replies distinct agent replies through /api/tts (stub
+Murf returns base64 MP3 bytes), then fetches each stored file the ways a
+browser audio element does:
+
+- full: first play, the whole file
+- seek: `Range: bytes=<middle>-` after the user scrubs (206, half the bytes)
+- replay: revalidation with `If-None-Match` (304, no body)
+- zerocopy: full fetch from a server offering `http.response.zerocopysend`
+  (the send is counted, not performed)
+
+Then fills a store capped at --max-mb with twice that much audio and reports
+what eviction kept.
+
+Usage:
+    python benchmarks/bench_audio_store.py --replies 50 --seconds 8
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from stubs import StubMurf, fake_mp3, install_stubs, load_app, percentile
+
+
+async def asgi_request(app, method: str, path: str, headers=None, body: bytes = b"", extensions=None):
+    """(status, headers dict, body bytes, zero-copy byte count) of one raw ASGI request"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "extensions": extensions or {},
+    }
+    response = {"status": None, "headers": {}, "body": [], "zero_copy": 0}
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode(): v.decode() for k, v in message["headers"]}
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+        elif message["type"] == "http.response.zerocopysend":
+            response["zero_copy"] += message["count"]
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], b"".join(response["body"]), response["zero_copy"]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--replies", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=8.0, help="Audio length per reply (128 kbit/s)")
+    parser.add_argument("--max-mb", type=float, default=2.0, help="Store bound for the eviction run")
+    args = parser.parse_args()
+
+    main = load_app()
+    install_stubs(main, {"tts": 0.0})
+    import stubs
+    stubs.fake_mp3 = lambda text="": fake_mp3(text, args.seconds)
+    from audio_store import AudioStore
+
+    async def timed(coro):
+        start = time.perf_counter()
+        result = await coro
+        return time.perf_counter() - start, result
+
+    async def run():
+        async with main.lifespan(main.app):
+            urls = []
+            for i in range(args.replies):
+                _, (status, _, body, _) = await timed(asgi_request(
+                    main.app, "POST", "/api/tts", {"content-type": "application/json"},
+                    json.dumps({"text": f"Reply number {i} from the agent.", "voice_id": "en-US-terrell"}).encode()))
+                urls.append(json.loads(body)["audio_file"])
+            murf_calls = StubMurf.calls
+            # Asking again is a store hit, not a Murf call
+            await asgi_request(main.app, "POST", "/api/tts", {"content-type": "application/json"},
+                               json.dumps({"text": "Reply number 0 from the agent.", "voice_id": "en-US-terrell"}).encode())
+
+            results = {}
+            for mode in ("full", "seek", "replay", "zerocopy"):
+                latencies, transferred, statuses = [], 0, set()
+                for url in urls:
+                    _, headers, _, _ = await asgi_request(main.app, "HEAD", url)
+                    size = int(headers["content-length"])
+                    request_headers, extensions = {}, None
+                    if mode == "seek":
+                        request_headers["range"] = f"bytes={size // 2}-"
+                    elif mode == "replay":
+                        request_headers["if-none-match"] = headers["etag"]
+                    elif mode == "zerocopy":
+                        extensions = {"http.response.zerocopysend": {}}
+                    seconds, (status, _, body, zero_copy) = await timed(
+                        asgi_request(main.app, "GET", url, request_headers, extensions=extensions))
+                    latencies.append(seconds)
+                    transferred += len(body) + zero_copy
+                    statuses.add(status)
+                results[mode] = (latencies, transferred, statuses)
+            return urls, murf_calls, results
+
+    urls, murf_calls, results = asyncio.run(run())
+    print(f"{args.replies} replies of {args.seconds:.0f}s audio ({len(fake_mp3('', args.seconds)) / 1024:.0f} KiB each), "
+          f"{murf_calls} Murf calls for {args.replies + 1} requests")
+    print(f"  audio URL: {urls[0]}")
+    for mode, (latencies, transferred, statuses) in results.items():
+        print(f"  {mode:<9} status {','.join(map(str, sorted(statuses)))}  p50={statistics.median(latencies) * 1000:6.2f}ms "
+              f"p99={percentile(latencies, 99) * 1000:6.2f}ms  {transferred / 1024 / len(latencies):7.1f} KiB/request")
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = AudioStore(Path(directory), max_bytes=int(args.max_mb * 1024 * 1024))
+        data = fake_mp3("", args.seconds)
+        count = int(2 * store.max_bytes / len(data)) + 1
+        for i in range(count):
+            store.put(f"{i:064x}", data)
+            store.touch(f"{0:064x}")  # the first reply keeps being replayed
+        on_disk = sum(path.stat().st_size for path in Path(directory).glob("*.mp3"))
+        print(f"  eviction: wrote {count} files ({count * len(data) / 1e6:.1f} MB) into a {args.max_mb:.0f} MiB store -> "
+              f"{store.stats()['files']} kept, {on_disk / 1e6:.2f} MB on disk, {store.counters['evictions']} evicted, "
+              f"replayed file kept: {store.contains(f'{0:064x}')}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,101 @@
+"""
+Benchmark: embedded vs bucketed chat storage at 10, 1k and 10k messages per session
+
+For each layout and session size it reports
+- write amplification: BSON bytes of the document(s) MongoDB rewrites to append
+  one turn (two messages), divided by the bytes of the two messages themselves
+- read latency: median time to fetch the last K messages and the total count
+
+Runs on mongomock by default. mongomock has no real indexes and copies every
+document it scans, so its read latencies only show in-process work; pass
+--mongodb-url to measure against a real mongod (uses and drops its own database).
+
+Usage:
+    python benchmarks/bench_chat_storage.py --sizes 10 1000 10000 --reads 50
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import bson
+
+from stubs import StubCollection
+
+BENCH_DB = "voiceforge_storage_bench"
+MESSAGE_TEXT = "This is a fairly typical assistant reply of a couple of sentences. " * 3
+
+
+def make_messages(count: int, start: datetime):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": MESSAGE_TEXT, "timestamp": start + timedelta(seconds=i)}
+        for i in range(count)
+    ]
+
+
+def open_db(url):
+    if url:
+        from pymongo import MongoClient
+        client = MongoClient(url)
+        client.drop_database(BENCH_DB)
+        db = client[BENCH_DB]
+        return db.chat_sessions, db.chat_buckets, lambda: client.drop_database(BENCH_DB)
+    import mongomock
+    db = mongomock.MongoClient()[BENCH_DB]
+    return StubCollection(db.chat_sessions), StubCollection(db.chat_buckets), lambda: None
+
+
+def rewritten_bytes(store, session_id: str) -> int:
+    """Size of the documents an append to session_id rewrites"""
+    if store.layout == "embedded":
+        return len(bson.encode(store.sessions.find_one({"session_id": session_id})))
+    bucket = store.buckets.find({"session_id": session_id}).sort("seq", -1).limit(1)[0]
+    index = store.sessions.find_one({"session_id": session_id})
+    return len(bson.encode(bucket)) + len(bson.encode(index))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--reads", type=int, default=50, help="Reads timed per configuration")
+    parser.add_argument("--limit", type=int, default=10, help="K, messages fetched per read")
+    parser.add_argument("--bucket-size", type=int, default=100)
+    parser.add_argument("--mongodb-url", default=None)
+    args = parser.parse_args()
+
+    from chat_store import BucketedChatStore, EmbeddedChatStore
+
+    turn = make_messages(2, datetime.utcnow())
+    turn_bytes = sum(len(bson.encode(message)) for message in turn)
+    print(f"backend={'mongod' if args.mongodb_url else 'mongomock'}  K={args.limit}  "
+          f"bucket_size={args.bucket_size}  turn={turn_bytes} bytes")
+    print(f"  {'layout':<9} {'messages':>8} {'rewritten/turn':>15} {'amplification':>14} {'read p50':>10}")
+
+    for size in args.sizes:
+        for layout in ("embedded", "bucketed"):
+            sessions, buckets, cleanup = open_db(args.mongodb_url)
+            if layout == "embedded":
+                store = EmbeddedChatStore(sessions)
+            else:
+                store = BucketedChatStore(sessions, buckets, args.bucket_size)
+            store.ensure_indexes()
+            session_id = f"{layout}_{size}"
+            store.append_many({session_id: make_messages(size, datetime(2024, 1, 1))})
+
+            store.append_many({session_id: make_messages(2, datetime.utcnow())})
+            rewritten = rewritten_bytes(store, session_id)
+
+            samples = []
+            for _ in range(args.reads):
+                start = time.perf_counter()
+                messages, total = store.recent(session_id, args.limit)
+                samples.append((time.perf_counter() - start) * 1000)
+            assert len(messages) == min(args.limit, size + 2) and total == size + 2, (len(messages), total)
+
+            print(f"  {layout:<9} {size:>8} {rewritten:>13,} B {rewritten / turn_bytes:>13.1f}x "
+                  f"{statistics.median(samples):>8.2f}ms")
+            cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()
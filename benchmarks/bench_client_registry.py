@@ -0,0 +1,108 @@
+"""
+Microbenchmark: per-turn client overhead, construct-per-call vs ClientRegistry
+
+Part 1 times building the Murf, Gemini and AssemblyAI SDK clients the way the
+endpoints used to (once per call) against a registry lookup. No network traffic.
+
+Part 2 measures connection reuse against a local keep-alive HTTP server: a new
+httpx client per request (new TCP connection every time, plus a TLS handshake
+against the real HTTPS upstreams) vs one pooled client.
+
+Usage:
+    python benchmarks/bench_client_registry.py --iterations 200
+"""
+import argparse
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from stubs import load_app
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers + body in one segment so delayed ACKs don't dominate the timings
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        body = b'{"audioFile": "https://stub.murf.local/a.mp3"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+def timed(fn, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), statistics.mean(samples)
+
+
+def report(label: str, median_ms: float, mean_ms: float):
+    print(f"  {label:<34} median={median_ms:8.3f}ms  mean={mean_ms:8.3f}ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    load_app()
+    import httpx
+    import assemblyai as aai
+    from google import genai
+    from murf import Murf
+    from clients import ClientRegistry, transcription_config
+
+    registry = ClientRegistry()
+
+    def construct_per_call():
+        Murf(api_key="bench-key")
+        genai.Client(api_key="bench-key")
+        aai.Transcriber(config=aai.TranscriptionConfig(**transcription_config()))
+
+    def registry_lookup():
+        registry.murf()
+        registry.gemini()
+        registry.transcriber()
+
+    print("Client acquisition per turn (Murf + Gemini + AssemblyAI):")
+    report("construct-per-call", *timed(construct_per_call, args.iterations))
+    report("registry lookup", *timed(registry_lookup, args.iterations))
+    registry.close()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/speech/generate"
+    payload = {"text": "Hello there", "voiceId": "en-US-terrell"}
+
+    def new_client_per_request():
+        with httpx.Client() as http:
+            http.post(url, json=payload)
+
+    pooled = httpx.Client(limits=registry._limits())
+
+    def pooled_request():
+        pooled.post(url, json=payload)
+
+    print("HTTP request to a local upstream (plain TCP; real upstreams add a TLS handshake per new client):")
+    report("new client per request", *timed(new_client_per_request, args.iterations))
+    report("pooled keep-alive client", *timed(pooled_request, args.iterations))
+    pooled.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,139 @@
+"""
+Benchmark: health probe latency and database load, per-request checks vs background checker
+
+`per-request` is the old /api/health: a MongoDB ping and a
+`count_documents({})` over chat_sessions on every probe. The others are the
+current endpoints, which read the HealthMonitor's cached results. Probes are
+sent --concurrency at a time, as several load balancers would.
+
+Then MongoDB goes down and comes back, and the readiness probe is sampled to
+show how quickly it follows (one check interval).
+
+Usage:
+    python benchmarks/bench_health_probes.py --sessions 20000 --probes 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from stubs import install_stubs, load_app, percentile
+
+
+async def asgi_get(app, path: str):
+    """(status, body) of a GET through raw ASGI calls"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1), "headers": [],
+    }
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response["body"]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=20000, help="Documents in chat_sessions")
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mongodb", type=float, default=0.005, help="Stub latency per MongoDB operation")
+    parser.add_argument("--interval", type=float, default=0.5, help="HEALTH_CHECK_INTERVAL_SECONDS")
+    args = parser.parse_args()
+
+    os.environ["HEALTH_CHECK_INTERVAL_SECONDS"] = str(args.interval)
+    main = load_app()
+    install_stubs(main, {"mongodb": args.mongodb})
+    sessions = main.chat_collection._target._collection
+    sessions.insert_many([{"session_id": f"s{i}", "messages": []} for i in range(args.sessions)])
+
+    operations = {"count": 0}
+    collection, ping = main.chat_collection, main.client.admin.command
+
+    def counted(fn):
+        def wrapper(*a, **k):
+            operations["count"] += 1
+            return fn(*a, **k)
+        return wrapper
+
+    main.client.admin.command = counted(ping)
+    main.chat_collection = type("Counted", (), {
+        "count_documents": staticmethod(counted(collection.count_documents)),
+        "estimated_document_count": staticmethod(counted(collection.estimated_document_count)),
+        "__getattr__": lambda self, name: getattr(collection, name),
+    })()
+
+    async def per_request_health():
+        await main.resilience.call("mongodb", main.client.admin.command, 'ping')
+        count = await main.resilience.call("mongodb", main.chat_collection.count_documents, {})
+        return {"status": "healthy", "document_count": count}
+
+    main.app.add_api_route("/bench/per-request-health", per_request_health)
+
+    async def probe_run(path):
+        latencies = []
+        operations["count"] = 0
+
+        async def probe():
+            t = time.perf_counter()
+            status, _ = await asgi_get(main.app, path)
+            latencies.append(time.perf_counter() - t)
+            return status
+
+        statuses = set()
+        for _ in range(args.probes // args.concurrency):
+            statuses.update(await asyncio.gather(*(probe() for _ in range(args.concurrency))))
+        return latencies, statuses, operations["count"] / len(latencies)
+
+    async def run():
+        async with main.lifespan(main.app):
+            # First round of background checks
+            while main.health.readiness()[1] == "starting":
+                await asyncio.sleep(0.01)
+            results = {}
+            for name, path in (("per-request", "/bench/per-request-health"), ("health", "/api/health"),
+                               ("live", "/api/health/live"), ("ready", "/api/health/ready")):
+                results[name] = await probe_run(path)
+
+            # MongoDB outage and recovery, as seen by the readiness probe
+            timeline = []
+            start = time.perf_counter()
+            outage = (0.5, 0.5 + 3 * args.interval)
+
+            def flaky_ping(*a, **k):
+                elapsed = time.perf_counter() - start
+                if outage[0] <= elapsed < outage[1]:
+                    raise ConnectionError("stub MongoDB is down")
+                return ping(*a, **k)
+
+            main.client.admin.command = flaky_ping
+            while time.perf_counter() - start < outage[1] + 2 * args.interval:
+                status, _ = await asgi_get(main.app, "/api/health/ready")
+                if not timeline or timeline[-1][1] != status:
+                    timeline.append((time.perf_counter() - start, status))
+                await asyncio.sleep(0.02)
+            return results, outage, timeline
+
+    results, outage, timeline = asyncio.run(run())
+    print(f"{args.sessions} sessions, stub MongoDB {args.mongodb * 1000:.0f}ms/op, {args.probes} probes "
+          f"{args.concurrency} at a time, background checks every {args.interval}s")
+    for name, (latencies, statuses, ops_per_probe) in results.items():
+        print(f"  {name:<12} status {','.join(map(str, sorted(statuses)))}  p50={statistics.median(latencies) * 1000:7.3f}ms "
+              f"p99={percentile(latencies, 99) * 1000:7.3f}ms  MongoDB ops/probe={ops_per_probe:5.2f}")
+    print(f"  outage {outage[0]:.1f}-{outage[1]:.1f}s, readiness: "
+          + ", ".join(f"{status} at {seconds:.2f}s" for seconds, status in timeline))
+
+
+if __name__ == "__main__":
+    main_cli()
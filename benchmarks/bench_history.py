@@ -0,0 +1,164 @@
+"""
+Benchmark: restoring and exporting a long session's history, whole read vs GET /agent/history
+
+For sessions of --sizes messages, in both storage layouts, reports latency,
+the BSON bytes read from MongoDB and the largest document read - what the app
+holds in memory at once - of:
+
+- whole: every message read and parsed into ChatMessage objects, the only way
+  to get at a session's history before the endpoint
+- page: GET /agent/history/{session_id} - the newest --limit messages
+- revalidate: the same request with If-None-Match of the previous response (304)
+- export: GET /agent/history/{session_id}?format=ndjson - the whole session streamed
+
+mongomock evaluates queries by copying whole documents, so latencies favour
+whole reads more than a mongod would; the bytes read are what a mongod would send.
+
+Usage:
+    python benchmarks/bench_history.py --sizes 100 2000 10000 --limit 50
+"""
+import argparse
+import asyncio
+import os
+import time
+import types
+from datetime import datetime, timedelta
+
+import bson
+
+from stubs import install_stubs, load_app
+
+
+class Reads:
+    """BSON bytes of every document a collection returned, and the largest one"""
+
+    def __init__(self):
+        self.bytes = 0
+        self.largest = 0
+
+    def count(self, document):
+        size = len(bson.encode(document))
+        self.bytes += size
+        self.largest = max(self.largest, size)
+        return document
+
+
+class CountingCursor:
+    def __init__(self, cursor, reads):
+        self._cursor = cursor
+        self._reads = reads
+
+    def __getattr__(self, name):
+        method = getattr(self._cursor, name)
+        return lambda *args, **kwargs: CountingCursor(method(*args, **kwargs), self._reads)
+
+    def __iter__(self):
+        return (self._reads.count(document) for document in self._cursor)
+
+
+class CountingCollection:
+    """Collection proxy recording what find / find_one / aggregate return"""
+
+    def __init__(self, collection, reads):
+        self._collection = collection
+        self._reads = reads
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def find(self, *args, **kwargs):
+        return CountingCursor(self._collection.find(*args, **kwargs), self._reads)
+
+    def find_one(self, *args, **kwargs):
+        document = self._collection.find_one(*args, **kwargs)
+        return None if document is None else self._reads.count(document)
+
+    def aggregate(self, *args, **kwargs):
+        return CountingCursor(self._collection.aggregate(*args, **kwargs), self._reads)
+
+
+async def measure(reads, fn):
+    """(seconds, bytes read, largest document, result) of one awaited call"""
+    reads.bytes = reads.largest = 0
+    start = time.perf_counter()
+    result = await fn()
+    return time.perf_counter() - start, reads.bytes, reads.largest, result
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 2000, 10000], help="Messages per session")
+    parser.add_argument("--limit", type=int, default=50, help="Messages per page")
+    parser.add_argument("--content-chars", type=int, default=300, help="Characters per message")
+    args = parser.parse_args()
+
+    os.environ["HISTORY_PAGE_MAX"] = "500"
+    main = load_app()
+    install_stubs(main, {"mongodb": 0.0})
+    from chat_store import build_chat_store
+
+    reads = Reads()
+    counted_db = types.SimpleNamespace(chat_sessions=CountingCollection(main.db.chat_sessions, reads),
+                                       chat_buckets=CountingCollection(main.db.chat_buckets, reads))
+
+    async def run():
+        import httpx
+
+        results = []
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+                for layout in ("embedded", "bucketed"):
+                    main.chat_store = build_chat_store(counted_db, layout=layout, bucket_size=100)
+                    main.chat_store.ensure_indexes()  # the lifespan ensured the embedded layout's only
+                    for size in args.sizes:
+                        session_id = f"{layout}-{size}"
+                        start = datetime.utcnow() - timedelta(seconds=size)
+                        main.chat_store.append_many({session_id: [
+                            {"role": "user" if i % 2 == 0 else "assistant",
+                             "content": f"Message {i} " + "x" * args.content_chars,
+                             "timestamp": start + timedelta(seconds=i)}
+                            for i in range(size)
+                        ]})
+
+                        async def whole():
+                            return main.get_chat_history(session_id, limit=size)
+
+                        async def page():
+                            return await http.get(f"/agent/history/{session_id}?limit={args.limit}")
+
+                        *whole_stats, history = await measure(reads, whole)
+                        assert len(history) == size
+                        *page_stats, response = await measure(reads, page)
+                        assert len(response.json()["messages"]) == min(size, args.limit)
+                        etag = response.headers["etag"]
+
+                        async def revalidate():
+                            return await http.get(f"/agent/history/{session_id}?limit={args.limit}",
+                                                  headers={"If-None-Match": etag})
+
+                        async def export():
+                            lines = 0
+                            async with http.stream("GET", f"/agent/history/{session_id}?format=ndjson") as r:
+                                async for _ in r.aiter_lines():
+                                    lines += 1
+                            return lines
+
+                        *revalidate_stats, response = await measure(reads, revalidate)
+                        assert response.status_code == 304
+                        *export_stats, lines = await measure(reads, export)
+                        assert lines == size
+                        results.append((layout, size, whole_stats, page_stats, revalidate_stats, export_stats))
+        return results
+
+    results = asyncio.run(run())
+    print(f"pages of {args.limit} messages, {args.content_chars} characters each; "
+          f"latency / MB read from MongoDB / largest document read")
+    for layout, size, *modes in results:
+        print(f"  {layout:<9} {size:6d} msgs  " + "  ".join(
+            f"{name} {seconds * 1000:7.1f}ms {read / 2**20:6.2f}MB {largest / 2**20:5.2f}MB"
+            for name, (seconds, read, largest) in zip(("whole", "page", "304", "export"), modes)))
+
+
+if __name__ == "__main__":
+    main_cli()
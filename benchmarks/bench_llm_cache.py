@@ -0,0 +1,106 @@
+"""
+Benchmark: Gemini calls and /agent/chat latency for session openers, LLM_CACHE off vs on
+
+Each simulated session opens with one short turn, drawn from a skewed mix of
+common openers in the spellings STT produces ("Hello.", "um hello", "What
+can you do?", "so what can you do") plus a share of one-off questions that
+should never hit. The same seeded sequence runs once without and once with
+the cache; the run fails if a one-off question is answered from the cache
+(e.g. "square root of 484222" from the entry of "square root of 90222").
+
+Usage:
+    python benchmarks/bench_llm_cache.py --sessions 200
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from stubs import StubGeminiClient, StubTranscriber, asgi_post, fake_webm, install_stubs, load_app
+
+# (weight, STT variants of the same opener)
+OPENERS = [
+    (30, ["Hello.", "hello", "Um, hello.", "Hello!"]),
+    (20, ["What can you do?", "what can you do", "So what can you do?", "What can you do, please?"]),
+    (10, ["How are you?", "how are you doing", "How are you today?"]),
+    (8, ["Tell me a joke.", "tell me a joke please", "Can you tell me a joke?"]),
+    (7, ["Who are you?", "who are you", "Who are you exactly?"]),
+]
+UNIQUE_SHARE = 0.25
+
+
+def opener_sequence(sessions: int, seed: int = 7):
+    """(query, whether it is a one-off question) per session"""
+    rng = random.Random(seed)
+    weights = [weight for weight, _ in OPENERS]
+    for i in range(sessions):
+        if rng.random() < UNIQUE_SHARE:
+            yield f"What is the square root of {rng.randint(100, 10 ** 6)}?", True
+        else:
+            variants = rng.choices(OPENERS, weights=weights)[0][1]
+            yield rng.choice(variants), False
+
+
+def count_llm_calls():
+    calls = []
+    generate_content = StubGeminiClient.generate_content
+
+    def counting(self, *args, **kwargs):
+        calls.append(1)
+        return generate_content(self, *args, **kwargs)
+
+    StubGeminiClient.generate_content = counting
+    return calls
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    args = parser.parse_args()
+
+    main = load_app()
+    install_stubs(main, {"llm": args.llm_latency})
+    calls = count_llm_calls()
+    queries = list(opener_sequence(args.sessions))
+    false_hits = []
+
+    async def run_mode(cache):
+        main.llm_cache = cache
+        calls.clear()
+        latencies = []
+        asked = set()
+        for i, (query, one_off) in enumerate(queries):
+            StubTranscriber.text = query
+            files = {"audio_file": ("recording.webm", fake_webm(), "audio/webm")}
+            hits = cache and cache.counters["exact_hits"] + cache.counters["semantic_hits"]
+            start = time.perf_counter()
+            await asgi_post(main.app, f"/agent/chat/cache_{cache is not None}_{i}", files, lambda chunk: None)
+            latencies.append(time.perf_counter() - start)
+            # A one-off question may only hit if the very same question was asked before
+            if cache and one_off and query not in asked and cache.counters["exact_hits"] + cache.counters["semantic_hits"] > hits:
+                false_hits.append(query)
+            asked.add(query)
+        return latencies, len(calls)
+
+    async def run():
+        async with main.lifespan(main.app):
+            off = await run_mode(None)
+            cache = main.LLMResponseCache()
+            on = await run_mode(cache)
+        return {"off": off, "on": on}, cache.stats()
+
+    results, stats = asyncio.run(run())
+    print(f"{args.sessions} session openers, {UNIQUE_SHARE:.0%} one-off questions, LLM {args.llm_latency}s")
+    for mode, (latencies, llm_calls) in results.items():
+        print(f"  cache {mode:<3}  gemini calls={llm_calls:4d}  turn p50={statistics.median(latencies) * 1000:5.0f}ms "
+              f"mean={statistics.mean(latencies) * 1000:5.0f}ms")
+    print(f"  hit rate {stats['hit_rate']:.0%} (exact {stats['exact_hits']}, semantic {stats['semantic_hits']}, "
+          f"misses {stats['misses']}), LLM time saved {stats['saved_seconds']:.1f}s")
+    if false_hits:
+        raise SystemExit(f"{len(false_hits)} one-off questions answered from the cache, e.g. {false_hits[0]!r}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,124 @@
+"""
+Benchmark: prompt size and LLM latency over a long session, flat history prompt vs token-budgeted context
+
+`flat` rebuilds the old format_chat_history_for_llm prompt: the last 10
+messages concatenated into one string, whatever their length. `budgeted` is
+the current pipeline: ContextBuilder contents within LLM_CONTEXT_TOKENS plus
+the session's rolling summary, updated in the background.
+
+One session runs --turns sequential /agent/chat turns. The user's first message
+carries a fact ("My name is Ada...") and every --long-every'th assistant reply is
+--long-chars long. The stub Gemini costs its base latency plus
+--per-prompt-char per prompt character. Its summarization calls return the
+previous summary plus the new user messages, which is crude but enough to see
+whether old facts survive.
+
+Usage:
+    python benchmarks/bench_llm_context.py --turns 60
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import types
+
+from stubs import StubGeminiClient, StubTranscriber, asgi_post, fake_webm, install_stubs, load_app, prompt_chars
+
+FIRST_MESSAGE = "My name is Ada and I live in Lisbon."
+
+
+def flat_prompt(chat_history, user_message: str) -> str:
+    """The pre-budget format_chat_history_for_llm + user message"""
+    if not chat_history:
+        return user_message
+    formatted_history = "Previous conversation:\n"
+    for message in chat_history[-10:]:
+        role = "Human" if message.role == "user" else "Assistant"
+        formatted_history += f"{role}: {message.content}\n"
+    formatted_history += "\nCurrent message:\n"
+    return formatted_history + user_message
+
+
+def stub_summary(prompt: str) -> str:
+    previous = prompt.split("Current summary:\n", 1)[1].split("\n\nNew messages:", 1)[0]
+    messages = prompt.split("New messages:\n", 1)[1].split("\n\nUpdated summary:", 1)[0]
+    said = [line[len("User: "):][:80] for line in messages.splitlines() if line.startswith("User: ")]
+    return " ".join(([] if previous == "(none yet)" else [previous]) + [f"The user said: {text}" for text in said])
+
+
+def record_llm_calls():
+    """Wrap the stub Gemini to record agent prompts and answer summarization prompts"""
+    calls = []
+    generate_content = StubGeminiClient.generate_content
+
+    def recording(self, model=None, contents=None, config=None):
+        if isinstance(contents, str) and contents.startswith("You keep a running summary"):
+            time.sleep(self._latency(contents, config))
+            calls.append(("summary", prompt_chars(contents), contents))
+            return types.SimpleNamespace(text=stub_summary(contents))
+        start = time.perf_counter()
+        response = generate_content(self, model=model, contents=contents, config=config)
+        prompt = contents if isinstance(contents, str) else \
+            " ".join(part["text"] for content in contents for part in content["parts"])
+        prompt += (config or {}).get("system_instruction", "")
+        calls.append(("turn", prompt_chars(contents, config), prompt, time.perf_counter() - start))
+        return response
+
+    StubGeminiClient.generate_content = recording
+    return calls
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--long-every", type=int, default=10, help="Every n-th reply is long")
+    parser.add_argument("--long-chars", type=int, default=12000)
+    parser.add_argument("--per-prompt-char", type=float, default=0.00005, help="Stub LLM seconds per prompt character")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Seconds between turns")
+    args = parser.parse_args()
+
+    main = load_app()
+    install_stubs(main)
+    StubGeminiClient.per_prompt_char = args.per_prompt_char
+    calls = record_llm_calls()
+    short_reply = StubGeminiClient.reply
+    long_reply = " ".join(["This is a very detailed answer."] * (args.long_chars // 32))
+    budgeted_context = main.build_llm_context
+
+    async def run_mode(mode: str):
+        calls.clear()
+        if mode == "flat":
+            main.build_llm_context = lambda history, message, summary: main.LLMContext(
+                flat_prompt(history, message), None, 0, len(history))
+            main.summarizer.window = 10 ** 9
+        else:
+            main.build_llm_context = budgeted_context
+            main.summarizer.window = main.HISTORY_CONTEXT_MESSAGES
+        for turn in range(args.turns):
+            StubTranscriber.text = FIRST_MESSAGE if turn == 0 else f"Question number {turn}, tell me more."
+            StubGeminiClient.reply = long_reply if turn % args.long_every == args.long_every - 1 else short_reply
+            files = {"audio_file": ("recording.webm", fake_webm(), "audio/webm")}
+            await asgi_post(main.app, f"/agent/chat/ctx_{mode}", files, lambda chunk: None)
+            await asyncio.sleep(args.think_time)
+        return [call for call in calls if call[0] == "turn"], [call for call in calls if call[0] == "summary"]
+
+    async def run():
+        async with main.lifespan(main.app):
+            return {mode: await run_mode(mode) for mode in ("flat", "budgeted")}
+
+    results = asyncio.run(run())
+    print(f"{args.turns} turns, every {args.long_every}th reply {args.long_chars} chars, "
+          f"LLM {StubGeminiClient.latency}s + {args.per_prompt_char * 1e6:g}ms per 1k prompt chars")
+    for mode, (turns, summaries) in results.items():
+        tokens = [chars / 4 for _, chars, _, _ in turns]
+        latency = [seconds * 1000 for _, _, _, seconds in turns]
+        remembers = "Ada" in turns[-1][2]
+        summary_note = f", {len(summaries)} summary calls (avg {statistics.mean(c[1] for c in summaries) / 4:.0f} tokens)" \
+            if summaries else ""
+        print(f"  {mode:<9} prompt tokens p50={statistics.median(tokens):6.0f} max={max(tokens):6.0f}  "
+              f"LLM p50={statistics.median(latency):5.0f}ms max={max(latency):5.0f}ms  "
+              f"turn-1 fact in last prompt: {'yes' if remembers else 'no'}{summary_note}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,99 @@
+"""
+Benchmark: save_chat_message latency under concurrency against a local mongod
+
+Compares the legacy connection profile (maxPoolSize=1 plus a ping before every
+write) with the production profile from database.py, and reports p50/p99 per
+save with W concurrent writers (the "mongodb" upstream pool).
+
+Requires a running mongod; the benchmark uses (and drops) its own database.
+
+Usage:
+    MONGODB_BENCH_URL=mongodb://localhost:27017 python benchmarks/bench_mongo_save_latency.py --workers 16 --ops 2000
+"""
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from stubs import load_app, percentile
+
+BENCH_DB = "voiceforge_bench"
+
+
+def legacy_save(client, collection, session_id: str, role: str, content: str) -> bool:
+    """save_chat_message as it was: ping preflight, then the upsert"""
+    client.admin.command('ping')
+    collection.update_one(
+        {"session_id": session_id},
+        {
+            "$push": {"chats": {"role": role, "content": content, "timestamp": datetime.utcnow()}},
+            "$set": {"updated_at": datetime.utcnow()},
+            "$setOnInsert": {"created_at": datetime.utcnow()}
+        },
+        upsert=True
+    )
+    return True
+
+
+def run(save, workers: int, ops: int, sessions: int):
+    def timed_save(i: int) -> float:
+        start = time.perf_counter()
+        save(f"bench_{i % sessions}", "user" if i % 2 == 0 else "assistant", f"message {i}")
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        samples = list(pool.map(timed_save, range(ops)))
+    return samples, time.perf_counter() - start
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent writers")
+    parser.add_argument("--ops", type=int, default=2000, help="Total saves per profile")
+    parser.add_argument("--sessions", type=int, default=100, help="Distinct session ids written to")
+    args = parser.parse_args()
+
+    url = os.getenv("MONGODB_BENCH_URL", "mongodb://localhost:27017")
+    main = load_app()
+    from pymongo import MongoClient
+    from database import connection_options
+
+    probe = MongoClient(url, serverSelectionTimeoutMS=2000)
+    try:
+        probe.admin.command('ping')
+    except Exception as e:
+        raise SystemExit(f"❌ No mongod reachable at {url}: {type(e).__name__}: {e}")
+    probe.drop_database(BENCH_DB)
+    probe.close()
+
+    legacy_client = MongoClient(url, maxPoolSize=1, waitQueueTimeoutMS=10000, retryWrites=True)
+    legacy_collection = legacy_client[BENCH_DB].chat_sessions
+
+    options = connection_options()
+    options["maxPoolSize"] = max(options["maxPoolSize"], args.workers)
+    main.client = MongoClient(url, **options)
+    main.db = main.client[BENCH_DB]
+    main.chat_collection = main.db.chat_sessions
+    main.chat_store = main.build_chat_store(main.db, layout=main.CHAT_STORAGE_LAYOUT, bucket_size=main.CHAT_BUCKET_SIZE)
+    main.client.admin.command('ping')
+
+    profiles = {
+        "legacy (pool=1, ping)": lambda *a: legacy_save(legacy_client, legacy_collection, *a),
+        f"production (pool={options['maxPoolSize']})": main.save_chat_message,
+    }
+    print(f"workers={args.workers}  ops={args.ops}  sessions={args.sessions}")
+    for label, save in profiles.items():
+        samples, elapsed = run(save, args.workers, args.ops, args.sessions)
+        print(f"  {label:<26} p50={percentile(samples, 50):7.2f}ms  p99={percentile(samples, 99):7.2f}ms  "
+              f"mean={statistics.mean(samples):7.2f}ms  throughput={args.ops / elapsed:8.1f} saves/s")
+
+    main.client.drop_database(BENCH_DB)
+    legacy_client.close()
+    main.client.close()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,147 @@
+"""
+Simulation: voice agent turns while bulk TTS saturates the Murf pool and quota
+
+--turns /agent/chat turns (short replies, new session each) start every
+--interval seconds. Meanwhile --bulk-clients clients keep posting long texts
+(--bulk-chars characters, a different one each time) to /api/tts, half as
+"manual" and half as "bulk". The stub Murf takes --latency seconds plus
+--per-char per character, TTS_MAX_CONCURRENCY is --tts-pool, the Murf quota is
+--quota calls per second and TTS_TIMEOUT_SECONDS is --tts-timeout - shorter than
+the bulk calls' queue wait, which must not count against the Murf breaker.
+
+- idle: agent turns alone
+- fifo: with the bulk traffic, every call in one class - first come, first
+  served, as before the scheduler
+- priority: with the bulk traffic, agent turns interactive (the default now)
+
+Reports agent turn latency, TTS time (queue + Murf) per class, and the Murf
+calls per second the bulk traffic got. Fails if, with the priority scheduler,
+the agent turn p99 is over --p99-bound, a turn got no audio, or the TTS
+circuit breaker opened.
+
+Usage:
+    python benchmarks/bench_priority_scheduler.py --turns 40 --bulk-clients 24
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import os
+import statistics
+import time
+
+from stubs import StubGeminiClient, StubMurf, fake_webm, install_stubs, load_app, percentile
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--interval", type=float, default=0.2, help="Seconds between agent turns")
+    parser.add_argument("--bulk-clients", type=int, default=24)
+    parser.add_argument("--bulk-chars", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub Murf seconds per call")
+    parser.add_argument("--per-char", type=float, default=0.0002, help="Stub Murf seconds per character")
+    parser.add_argument("--tts-pool", type=int, default=8, help="TTS_MAX_CONCURRENCY")
+    parser.add_argument("--quota", type=float, default=12.0, help="TTS_RATE_PER_SECOND")
+    parser.add_argument("--tts-timeout", type=float, default=2.0, help="TTS_TIMEOUT_SECONDS")
+    parser.add_argument("--p99-bound", type=float, default=2.0, help="Agent turn p99 allowed under bulk load (seconds)")
+    args = parser.parse_args()
+
+    os.environ["TTS_MAX_CONCURRENCY"] = str(args.tts_pool)
+    os.environ["TTS_RATE_PER_SECOND"] = str(args.quota)
+    os.environ["TTS_TIMEOUT_SECONDS"] = str(args.tts_timeout)
+    # Only the bulk traffic's share of the agent pipeline is measured, not admission
+    os.environ["AGENT_MAX_CONCURRENT_TURNS"] = "1000"
+    main = load_app()
+    install_stubs(main, {"tts": args.latency, "stt": 0.1, "llm": 0.2})
+    StubMurf.per_char = args.per_char
+    # Different texts everywhere, so the audio store never answers for Murf
+    counter = itertools.count()
+    StubGeminiClient.reply = property(lambda self: f"Reply {next(counter)}: sure, let me help.")
+    import executor
+    from scheduler import current_priority
+
+    # TTS time per class as the caller sees it
+    tts_seconds = collections.defaultdict(list)
+    synthesize_speech = main.synthesize_speech
+
+    async def timed_synthesize_speech(*a, **k):
+        priority = current_priority()
+        start = time.perf_counter()
+        try:
+            return await synthesize_speech(*a, **k)
+        finally:
+            tts_seconds[priority].append(time.perf_counter() - start)
+
+    main.synthesize_speech = timed_synthesize_speech
+
+    async def run():
+        import httpx
+
+        results = {}
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+                async def agent_turn(mode, i):
+                    start = time.perf_counter()
+                    files = {"audio_file": ("recording.webm", fake_webm(), "audio/webm")}
+                    response = await http.post(f"/agent/chat/{mode}-{i}", files=files)
+                    return time.perf_counter() - start, bool(response.json().get("audio_file"))
+
+                async def bulk_client(j, stop, done):
+                    priority = "manual" if j % 2 else "bulk"
+                    while not stop.is_set():
+                        n = next(counter)
+                        text = (f"Bulk text {n}. " + "Long narration sentence for the TTS page. " * 100)[:args.bulk_chars]
+                        await http.post("/api/tts", json={"text": text, "priority": priority})
+                        done[priority] += 1
+
+                for mode in ("idle", "fifo", "priority"):
+                    executor.current_priority = (lambda: "manual") if mode == "fifo" else current_priority
+                    main.resilience.breakers["tts"].record_success()
+                    opened_before = main.resilience.breakers["tts"].times_opened
+                    tts_seconds.clear()
+                    stop, done = asyncio.Event(), {"manual": 0, "bulk": 0}
+                    clients = [] if mode == "idle" else [
+                        asyncio.create_task(bulk_client(j, stop, done)) for j in range(args.bulk_clients)]
+                    await asyncio.sleep(0 if mode == "idle" else 2.0)  # let the bulk traffic fill the queue
+                    started = time.perf_counter()
+                    turns = []
+                    for i in range(args.turns):
+                        turns.append(asyncio.create_task(agent_turn(mode, i)))
+                        await asyncio.sleep(args.interval)
+                    outcomes = await asyncio.gather(*turns)
+                    elapsed = time.perf_counter() - started
+                    stop.set()
+                    await asyncio.gather(*clients)
+                    results[mode] = ([seconds for seconds, _ in outcomes], dict(tts_seconds),
+                                     {k: v / elapsed for k, v in done.items()},
+                                     sum(not audio for _, audio in outcomes),
+                                     main.resilience.breakers["tts"].times_opened - opened_before)
+        return results
+
+    results = asyncio.run(run())
+    print(f"{args.turns} agent turns every {args.interval}s; {args.bulk_clients} clients posting {args.bulk_chars}-char "
+          f"texts; stub Murf {args.latency * 1000:.0f}ms + {args.per_char * 1000:.1f}ms/char, "
+          f"TTS pool {args.tts_pool}, quota {args.quota:g}/s, TTS timeout {args.tts_timeout:g}s")
+    for mode, (latencies, tts, rates, no_audio, opened) in results.items():
+        tts_text = "  ".join(f"{p} {statistics.median(s):4.2f}/{percentile(s, 99):4.2f}s" for p, s in sorted(tts.items()))
+        print(f"  {mode:<9} agent turn p50={statistics.median(latencies):5.2f}s p99={percentile(latencies, 99):5.2f}s  "
+              f"TTS p50/p99: {tts_text:<50} bulk traffic {rates['manual'] + rates['bulk']:4.1f} Murf calls/s  "
+              f"turns without audio {no_audio}  TTS breaker opened {opened}x")
+
+    latencies, _, _, no_audio, opened = results["priority"]
+    failures = []
+    if percentile(latencies, 99) > args.p99_bound:
+        failures.append(f"agent turn p99 {percentile(latencies, 99):.2f}s over the {args.p99_bound:g}s bound")
+    if no_audio:
+        failures.append(f"{no_audio} agent turns without audio")
+    if opened:
+        failures.append(f"TTS circuit breaker opened {opened}x")
+    if failures:
+        raise SystemExit("priority scheduling under bulk load: " + "; ".join(failures))
+    print(f"priority: agent turn p99 within {args.p99_bound:g}s, every turn voiced, TTS breaker closed")
+
+
+if __name__ == "__main__":
+    main_cli()
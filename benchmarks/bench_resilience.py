@@ -0,0 +1,165 @@
+"""
+Benchmark: /agent/chat tail latency with degraded upstreams, unprotected vs resilience layer
+
+Each scenario runs the same turns twice, in waves of --concurrency parallel
+sessions. `unprotected` has no timeouts, breakers, budget or hedging, like the
+pipeline before resilience.py; `protected` uses the settings shown.
+
+- tts-tail: Murf takes --tts-latency, but 4% of calls take 3s (hedging on)
+- llm-hang: every Gemini call hangs for 8s (2s timeouts, breaker after 3 failures)
+- llm-errors: every Gemini call fails after 1.5s (breaker after 3 failures)
+- slow-all: STT 1s, Gemini 6s (3s turn budget, default per-call timeouts)
+
+Fails if a protected run's p99 turn latency is over the scenario's bound
+(--slack seconds of headroom are added for a loaded machine).
+
+Usage:
+    python benchmarks/bench_resilience.py --concurrency 8
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import statistics
+import time
+import types
+
+from stubs import (StubGeminiClient, StubMurf, StubTranscriber, asgi_post, fake_mp3, fake_webm, install_stubs, load_app,
+                   percentile)
+
+UNPROTECTED = dict(timeout=1e9, failure_threshold=10 ** 9, turn_budget=1e9, hedge=())
+
+
+def configure(resilience, timeout=None, failure_threshold=5, turn_budget=45.0, hedge=(), hedge_min_seconds=0.3):
+    """Reconfigure main.resilience in place (agent_chat's @resilience.budgeted holds on to the instance)"""
+    from resilience import DEFAULT_TIMEOUTS, CircuitBreaker
+
+    resilience.timeouts = {service: timeout or DEFAULT_TIMEOUTS[service] for service in DEFAULT_TIMEOUTS}
+    resilience.turn_budget = turn_budget
+    resilience.hedge = frozenset(hedge)
+    resilience.hedge_min_seconds = hedge_min_seconds
+    resilience.breakers = {service: CircuitBreaker(service, failure_threshold, 30.0) for service in DEFAULT_TIMEOUTS}
+
+
+def patch_stubs(rng):
+    """Route the stub Murf/Gemini calls through the scenario's fault functions"""
+    faults = {"tts": lambda: StubMurf.latency, "llm": lambda: StubGeminiClient.latency}
+
+    def murf_generate(self, text=None, voice_id=None, encode_as_base_64=False, **kwargs):
+        StubMurf.calls += 1
+        time.sleep(faults["tts"]())
+        if encode_as_base_64:
+            return types.SimpleNamespace(audio_file=None, encoded_audio=base64.b64encode(fake_mp3(text)).decode())
+        return types.SimpleNamespace(audio_file=f"https://stub.murf.local/{abs(hash((text, voice_id)))}.mp3")
+
+    def gemini_generate(self, model=None, contents=None, config=None):
+        time.sleep(faults["llm"]())
+        if faults.get("llm_error"):
+            raise ConnectionError("stub Gemini is down")
+        # A different reply per turn, so the TTS cache doesn't hide the upstream
+        return types.SimpleNamespace(text=f"{self.reply} ({rng.random():.6f})")
+
+    StubMurf.generate = murf_generate
+    StubGeminiClient.generate_content = gemini_generate
+    return faults
+
+
+# name -> (fault injection, protected settings, p99 bound of a protected turn in seconds)
+SCENARIOS = {
+    "tts-tail": (
+        lambda faults, rng, args: faults.update(tts=lambda: 3.0 if rng.random() < 0.04 else args.tts_latency),
+        dict(hedge=("tts",)),
+        # a hedge replaces the 3s Murf call after at most the recent p95
+        1.5,
+    ),
+    "llm-hang": (
+        lambda faults, rng, args: faults.update(llm=lambda: 8.0),
+        dict(timeout=2.0, failure_threshold=3),
+        # STT + the 2s Gemini timeout + TTS of the fallback message
+        2.5,
+    ),
+    "llm-errors": (
+        lambda faults, rng, args: faults.update(llm=lambda: 1.5, llm_error=True),
+        dict(failure_threshold=3),
+        # the first wave waits for the failing calls, later ones fail fast
+        2.0,
+    ),
+    "slow-all": (
+        lambda faults, rng, args: faults.update(llm=lambda: 6.0, stt=1.0),
+        dict(turn_budget=3.0),
+        # the turn budget, then a text-only reply
+        3.0,
+    ),
+}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--waves", type=int, default=5)
+    parser.add_argument("--tail-waves", type=int, default=25, help="Waves for tts-tail (needs more samples for a p99)")
+    parser.add_argument("--tts-latency", type=float, default=0.2)
+    parser.add_argument("--scenario", choices=list(SCENARIOS), action="append")
+    parser.add_argument("--slack", type=float, default=0.5, help="Seconds allowed over each p99 bound")
+    args = parser.parse_args()
+
+    main = load_app()
+    from metrics import HEDGED_REQUESTS
+
+    install_stubs(main, {"stt": 0.1, "llm": 0.3, "tts": args.tts_latency})
+    rng = random.Random(11)
+    faults = patch_stubs(rng)
+    base_faults = dict(faults)
+    failures = []
+
+    async def turn(session_id: str):
+        chunks = []
+        files = {"audio_file": ("recording.webm", fake_webm(), "audio/webm")}
+        start = time.perf_counter()
+        await asgi_post(main.app, f"/agent/chat/{session_id}", files, chunks.append)
+        response = json.loads(b"".join(chunks))
+        degraded = response.get("complete_response", {}).get("text") == main.AGENT_FALLBACK_MESSAGE \
+            or not response.get("audio_file")
+        return time.perf_counter() - start, degraded
+
+    async def run_scenario(name, mode):
+        inject, protected, bound = SCENARIOS[name]
+        faults.clear()
+        faults.update(base_faults)
+        StubTranscriber.latency = 0.1
+        inject(faults, rng, args)
+        StubTranscriber.latency = faults.pop("stt", StubTranscriber.latency)
+        configure(main.resilience, **(UNPROTECTED if mode == "unprotected" else protected))
+        waves = args.tail_waves if name == "tts-tail" else args.waves
+        hedges_before = HEDGED_REQUESTS.value(upstream="tts", event="sent")
+        results = []
+        for wave in range(waves):
+            results += await asyncio.gather(*(turn(f"{name}_{mode}_{wave}_{i}") for i in range(args.concurrency)))
+        latencies = [seconds for seconds, _ in results]
+        p99 = percentile(latencies, 99)
+        hedges = HEDGED_REQUESTS.value(upstream="tts", event="sent") - hedges_before
+        opened = sum(breaker.times_opened for breaker in main.resilience.breakers.values())
+        print(f"  {name:<10} {mode:<11} p50={statistics.median(latencies):5.2f}s p99={p99:5.2f}s "
+              f"max={max(latencies):5.2f}s  degraded {sum(d for _, d in results):3d}/{len(results)}"
+              f"  breaker opened {opened}x  hedges {hedges:.0f}")
+        if mode == "protected" and p99 > bound + args.slack:
+            failures.append(f"{name}: protected p99 {p99:.2f}s over the {bound:.1f}s bound (+{args.slack:.1f}s slack)")
+        if mode == "protected" and name == "llm-hang":
+            await asyncio.sleep(8.0)  # let the abandoned Gemini calls free their workers
+
+    async def run():
+        async with main.lifespan(main.app):
+            for name in args.scenario or SCENARIOS:
+                for mode in ("unprotected", "protected"):
+                    await run_scenario(name, mode)
+
+    print(f"{args.concurrency} concurrent sessions per wave, {args.waves} waves ({args.tail_waves} for tts-tail)")
+    asyncio.run(run())
+    if failures:
+        raise SystemExit("tail-latency bound exceeded:\n  " + "\n  ".join(failures))
+    print("protected p99 within every bound")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,123 @@
+"""
+Benchmark: /agent/chat stage timeline, history read after STT vs during STT
+
+Records when each stage of a turn starts and ends (relative to the request):
+the upload transcription, the history read, the Gemini call and the Murf
+call. `sequential` holds the history read back until transcription has
+finished, as agent_chat used to; `overlapped` is the current pipeline. Chat
+persistence is write-behind in both modes and never on the response path.
+
+Turns run one after another, so the timeline of each is undisturbed.
+
+Usage:
+    python benchmarks/bench_stage_overlap.py --turns 20 --mongodb 0.25
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from stubs import StubGeminiClient, StubMurf, StubTranscriber, asgi_post, fake_webm, install_stubs, load_app
+
+STAGES = ("stt", "history", "llm", "tts")
+
+
+class Timeline:
+    """(stage, start, end) offsets from the start of the current turn"""
+
+    def __init__(self):
+        self.turn_start = 0.0
+        self.spans = []
+
+    def record(self, stage, start, end):
+        self.spans.append((stage, start - self.turn_start, end - self.turn_start))
+
+    def wrap_async(self, stage, fn):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.record(stage, start, time.perf_counter())
+        return wrapper
+
+    def wrap_blocking(self, stage, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, start, time.perf_counter())
+        return wrapper
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--stt", type=float, default=0.5)
+    parser.add_argument("--llm", type=float, default=0.6)
+    parser.add_argument("--tts", type=float, default=0.4)
+    parser.add_argument("--mongodb", type=float, default=0.25, help="Stub latency per MongoDB operation")
+    args = parser.parse_args()
+
+    main = load_app()
+    install_stubs(main, {"stt": args.stt, "llm": args.llm, "tts": args.tts, "mongodb": args.mongodb})
+    timeline = Timeline()
+    StubTranscriber.transcribe = timeline.wrap_blocking("stt", StubTranscriber.transcribe)
+    StubGeminiClient.generate_content = timeline.wrap_blocking("llm", StubGeminiClient.generate_content)
+    StubMurf.generate = timeline.wrap_blocking("tts", StubMurf.generate)
+    transcribe_upload = main.transcribe_upload
+    retrieve_chat_context = timeline.wrap_async("history", main.retrieve_chat_context)
+    reply = StubGeminiClient.reply
+
+    async def run_mode(mode: str):
+        transcribed = asyncio.Event()
+
+        async def transcribe_then_release(request):
+            try:
+                return await transcribe_upload(request)
+            finally:
+                transcribed.set()
+
+        async def history_after_stt(session_id):
+            await transcribed.wait()
+            return await retrieve_chat_context(session_id)
+
+        main.transcribe_upload = transcribe_then_release
+        main.retrieve_chat_context = history_after_stt if mode == "sequential" else retrieve_chat_context
+        turns = []
+        for turn in range(args.turns):
+            transcribed.clear()
+            timeline.spans = []
+            # A new reply every turn, so the TTS cache doesn't skip Murf
+            StubGeminiClient.reply = f"{reply} Turn {turn} ({mode})."
+            files = {"audio_file": ("recording.webm", fake_webm(), "audio/webm")}
+            timeline.turn_start = time.perf_counter()
+            await asgi_post(main.app, f"/agent/chat/overlap_{mode}", files, lambda chunk: None)
+            turns.append((time.perf_counter() - timeline.turn_start, list(timeline.spans)))
+        return turns
+
+    async def run():
+        async with main.lifespan(main.app):
+            return {mode: await run_mode(mode) for mode in ("sequential", "overlapped")}
+
+    results = asyncio.run(run())
+    print(f"{args.turns} turns, stub stt={args.stt}s history=mongodb {args.mongodb}s/op llm={args.llm}s tts={args.tts}s "
+          f"(p50 start-end per stage)")
+    for mode, turns in results.items():
+        timeline_text = []
+        durations = {}
+        for stage in STAGES:
+            spans = [span for _, spans in turns for span in spans if span[0] == stage]
+            start = statistics.median(s for _, s, _ in spans) * 1000
+            end = statistics.median(e for _, _, e in spans) * 1000
+            durations[stage] = end - start
+            timeline_text.append(f"{stage} {start:4.0f}-{end:4.0f}")
+        turn_ms = statistics.median(seconds for seconds, _ in turns) * 1000
+        critical = durations["stt"] + durations["llm"] + durations["tts"]
+        print(f"  {mode:<10} {'  '.join(timeline_text)}ms  turn p50={turn_ms:5.0f}ms  "
+              f"(stt+llm+tts={critical:.0f}ms, +history={critical + durations['history']:.0f}ms)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,132 @@
+"""
+Benchmark: worker cold start - import time, time to first response, time to ready
+
+Starts --workers uvicorn worker processes at once (as gunicorn/uvicorn
+--workers would) and reports per worker:
+
+- import: seconds to import main.py
+- first response: process start until /api/health/live answers
+- ready: process start until /api/health/ready answers 200
+
+Workers use a stub MongoDB and the real SDK clients (building them makes no
+network calls). `eager-sdks` imports the Murf, AssemblyAI and Gemini SDKs
+together with main.py, like the import path used to; `lazy-sdks` is the
+current path, where the lifespan builds the clients in the background before
+readiness. `unreachable-mongodb` runs the real MongoDB client against a
+MONGODB_URL whose SRV lookup fails: the worker still serves, and readiness
+reports why it isn't ready.
+
+Usage:
+    python benchmarks/bench_startup.py --workers 4
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+
+
+def serve(port: int, mode: str) -> None:
+    """Worker process: import the app (timed), then run uvicorn on port"""
+    from stubs import install_stubs, load_app
+
+    start = time.perf_counter()
+    if mode == "eager-sdks":
+        import assemblyai  # noqa: F401
+        import murf  # noqa: F401
+        from google import genai  # noqa: F401
+    main = load_app()
+    print(json.dumps({"import": time.perf_counter() - start}), flush=True)
+    if mode != "unreachable-mongodb":
+        install_stubs(main)
+        main.upstream_clients = None  # the lifespan builds the real registry
+
+    import uvicorn
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="critical")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(port: int, path: str):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+    except OSError:
+        return None, None
+
+
+def start_workers(count: int, mode: str, ready_timeout: float):
+    env = dict(os.environ, LOG_LEVEL="CRITICAL", HEALTH_CHECK_INTERVAL_SECONDS="1")
+    if mode == "unreachable-mongodb":
+        env["MONGODB_URL"] = "mongodb+srv://voiceforge.nonexistent.invalid/"
+    workers = []
+    for _ in range(count):
+        port = free_port()
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, __file__, "--serve", str(port), "--mode", mode],
+                                   cwd=HERE, env=env, stdout=subprocess.PIPE, text=True)
+        workers.append({"port": port, "process": process, "started": started})
+
+    def watch(worker):
+        worker["import"] = json.loads(worker["process"].stdout.readline())["import"]
+        deadline = worker["started"] + ready_timeout
+        while time.perf_counter() < deadline:
+            if "live" not in worker and get(worker["port"], "/api/health/live")[0] == 200:
+                worker["live"] = time.perf_counter() - worker["started"]
+            if "live" in worker:
+                status, body = get(worker["port"], "/api/health/ready")
+                worker["ready_reason"] = body and body.get("reason")
+                if status == 200:
+                    worker["ready"] = time.perf_counter() - worker["started"]
+                    return
+            time.sleep(0.01)
+
+    # One poller per worker, so a worker that is slow to answer doesn't delay the others' timings
+    with ThreadPoolExecutor(len(workers)) as pool:
+        list(pool.map(watch, workers))
+    for worker in workers:
+        worker["process"].terminate()
+        worker["process"].wait()
+    return workers
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--ready-timeout", type=float, default=8.0)
+    parser.add_argument("--mode", choices=["eager-sdks", "lazy-sdks", "unreachable-mongodb"], action="append")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.serve, args.mode[0])
+
+    print(f"{args.workers} workers started together")
+    for mode in args.mode or ("eager-sdks", "lazy-sdks", "unreachable-mongodb"):
+        workers = start_workers(args.workers, mode, args.ready_timeout)
+        imports = [w["import"] for w in workers]
+        live = [w["live"] for w in workers if "live" in w]
+        ready = [w["ready"] for w in workers if "ready" in w]
+        reasons = {w.get("ready_reason") for w in workers if "ready" not in w}
+        print(f"  {mode:<20} import p50={statistics.median(imports):5.2f}s max={max(imports):5.2f}s  "
+              f"first response p50={statistics.median(live):5.2f}s  "
+              + (f"ready p50={statistics.median(ready):5.2f}s max={max(ready):5.2f}s" if len(ready) == len(workers)
+                 else f"ready {len(ready)}/{len(workers)} after {args.ready_timeout:.0f}s ({', '.join(map(str, reasons))})"))
+
+
+if __name__ == "__main__":
+    main_cli()
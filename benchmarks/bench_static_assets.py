@@ -0,0 +1,149 @@
+"""
+Benchmark: page loads, plain StaticFiles + per-request Jinja2 vs precompressed fingerprinted assets
+
+A page load is GET / plus every stylesheet and script the HTML links, as a
+browser sends them (Accept-Encoding: gzip, deflate, br).
+
+- cold: empty browser cache
+- warm: reload with the responses of the cold load cached - immutable
+  responses are not requested again, responses with an ETag / Last-Modified
+  are revalidated, the rest are fetched again
+
+`before` is the original setup rebuilt in a separate app (StaticFiles mount,
+index.html rendered on every request); `after` is main.app. Reports page
+loads and HTTP requests per second over --loads page loads, and bytes on the
+wire (headers + bodies) per page load.
+
+Usage:
+    python benchmarks/bench_static_assets.py --loads 300
+"""
+import argparse
+import asyncio
+import re
+import time
+
+from stubs import install_stubs, load_app
+
+ACCEPT_ENCODING = "gzip, deflate, br"
+LINKED = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+
+
+async def asgi_get(app, path: str, headers: dict):
+    """(status, headers dict, body, bytes on the wire) of one raw ASGI GET"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+    }
+    response = {"status": None, "headers": {}, "body": b"", "wire": 0}
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()  # no disconnect during the benchmark
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode().lower(): v.decode() for k, v in message.get("headers", [])}
+            response["wire"] += sum(len(k) + len(v) + 4 for k, v in message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+            response["wire"] += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["body"], response["wire"]
+
+
+def decoded(headers: dict, body: bytes) -> str:
+    if headers.get("content-encoding") == "gzip":
+        import gzip
+        body = gzip.decompress(body)
+    elif headers.get("content-encoding") == "br":
+        import brotli
+        body = brotli.decompress(body)
+    return body.decode()
+
+
+async def page_load(app, cache: dict):
+    """One page load through a browser cache {path: headers}; returns (requests, bytes on the wire)"""
+    requests = wire = 0
+
+    async def fetch(path):
+        nonlocal requests, wire
+        cached = cache.get(path)
+        if cached is not None and "immutable" in cached.get("cache-control", ""):
+            return None
+        headers = {"accept-encoding": ACCEPT_ENCODING}
+        if cached is not None and "etag" in cached:
+            headers["if-none-match"] = cached["etag"]
+        if cached is not None and "last-modified" in cached:
+            headers["if-modified-since"] = cached["last-modified"]
+        status, response_headers, body, size = await asgi_get(app, path, headers)
+        requests += 1
+        wire += size
+        if status == 200:
+            cache[path] = dict(response_headers, body=body)
+        return cache[path]
+
+    index = await fetch("/")
+    html = decoded(index, index["body"])
+    for path in LINKED.findall(html):
+        await fetch(path)
+    return requests, wire
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--loads", type=int, default=300, help="Page loads per measurement")
+    args = parser.parse_args()
+
+    main = load_app()
+    install_stubs(main)
+    from fastapi import FastAPI, Request
+    from fastapi.responses import HTMLResponse
+    from fastapi.staticfiles import StaticFiles
+    from fastapi.templating import Jinja2Templates
+
+    before = FastAPI()
+    before.mount("/static", StaticFiles(directory="static"), name="static")
+    legacy_templates = Jinja2Templates(directory="templates")
+    legacy_templates.env.globals["asset"] = lambda name: f"/static/{name}"
+
+    @before.get("/", response_class=HTMLResponse)
+    async def read_root(request: Request):
+        # What TemplateResponse did per request: load (cached) and render the template
+        return HTMLResponse(legacy_templates.get_template("index.html").render(request=request))
+
+    async def run():
+        results = {}
+        async with main.lifespan(main.app):
+            for name, app in (("before", before), ("after", main.app)):
+                for mode in ("cold", "warm"):
+                    warm_cache = {}
+                    await page_load(app, warm_cache)
+                    requests = wire = 0
+                    start = time.perf_counter()
+                    for _ in range(args.loads):
+                        cache = dict(warm_cache) if mode == "warm" else {}
+                        r, w = await page_load(app, cache)
+                        requests += r
+                        wire += w
+                    seconds = time.perf_counter() - start
+                    results[name, mode] = (args.loads / seconds, requests / seconds, requests / args.loads,
+                                           wire / args.loads)
+        return results
+
+    results = asyncio.run(run())
+    print(f"{args.loads} page loads (/, style.css, script.js), Accept-Encoding: {ACCEPT_ENCODING}")
+    for (name, mode), (loads_per_s, requests_per_s, requests, wire) in results.items():
+        print(f"  {name:<7}{mode:<5} {loads_per_s:7.1f} loads/s  {requests_per_s:7.1f} requests/s  "
+              f"{requests:3.1f} requests and {wire / 1024:6.1f} KB per page load")
+
+
+if __name__ == "__main__":
+    main_cli()
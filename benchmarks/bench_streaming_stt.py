@@ -0,0 +1,121 @@
+"""
+Benchmark: end of speech to first audio, multipart upload vs /ws/agent/{session_id}
+
+With the multipart endpoint, batch transcription of the whole clip only starts
+once the user has stopped talking, and it takes longer the longer they talked.
+Over the WebSocket, audio is transcribed while it is being recorded, so after
+the user stops only a short finalization remains.
+
+A simulated speaker sends 100 ms of 16 kHz PCM every 100 ms for --speech
+seconds. The stub batch transcriber costs its base latency plus
+--stt-realtime-factor x the audio duration; the stub streaming transcriber
+finalizes in --finalize-latency seconds.
+
+Usage:
+    python benchmarks/bench_streaming_stt.py --turns 5 --speech 4
+"""
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import time
+import wave
+
+from stubs import ASGIWebSocket, StubTranscriber, asgi_post, install_stubs, load_app, stub_streaming_stt
+
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 0.1
+CHUNK = b"\x00\x00" * int(SAMPLE_RATE * CHUNK_SECONDS)
+
+
+def wav_file(pcm: bytes) -> bytes:
+    """What the page would upload for the same audio: 16 kHz mono PCM in a WAV container"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(SAMPLE_RATE)
+        writer.writeframes(pcm)
+    return buffer.getvalue()
+
+
+async def multipart_turn(main, session_id: str, speech: float) -> dict:
+    await asyncio.sleep(speech)  # the user talks while MediaRecorder records
+    audio = wav_file(CHUNK * int(speech / CHUNK_SECONDS))
+    start = time.perf_counter()
+    marks = {}
+    buffer = b""
+
+    def on_chunk(chunk: bytes):
+        nonlocal buffer
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            event = json.loads(line)
+            if event["type"] == "transcription":
+                marks.setdefault("transcription", time.perf_counter() - start)
+            elif event["type"] == "segment" and event["audio_file"]:
+                marks.setdefault("first_audio", time.perf_counter() - start)
+
+    files = {"audio_file": ("recording.wav", audio, "audio/wav")}
+    await asgi_post(main.app, f"/agent/chat/{session_id}/stream", files, on_chunk)
+    return marks
+
+
+async def websocket_turn(main, session_id: str, speech: float) -> dict:
+    ws = ASGIWebSocket(main.app, f"/ws/agent/{session_id}")
+    ws.send_json({"type": "start", "format": "pcm16", "sample_rate": SAMPLE_RATE})
+    assert (await ws.receive_json())["type"] == "ready"
+    for _ in range(int(speech / CHUNK_SECONDS)):
+        ws.send_bytes(CHUNK)
+        await asyncio.sleep(CHUNK_SECONDS)
+    start = time.perf_counter()
+    ws.send_json({"type": "end"})
+    marks = {}
+    while True:
+        event = await ws.receive_json()
+        if event["type"] == "transcription":
+            marks.setdefault("transcription", time.perf_counter() - start)
+        elif event["type"] == "segment" and event["audio_file"]:
+            marks.setdefault("first_audio", time.perf_counter() - start)
+        elif event["type"] in ("done", "error"):
+            assert event["type"] == "done", event
+            break
+    await ws.close()
+    return marks
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=5, help="Sequential turns per transport")
+    parser.add_argument("--speech", type=float, default=4.0, help="Seconds the simulated user talks")
+    parser.add_argument("--stt-realtime-factor", type=float, default=0.25,
+                        help="Batch STT seconds per second of audio, on top of its base latency")
+    parser.add_argument("--finalize-latency", type=float, default=0.15)
+    args = parser.parse_args()
+
+    main = load_app()
+    lat = install_stubs(main)
+    StubTranscriber.per_byte = args.stt_realtime_factor / (2 * SAMPLE_RATE)
+    main.open_streaming_transcription = stub_streaming_stt(args.finalize_latency)
+
+    async def run():
+        results = {}
+        async with main.lifespan(main.app):
+            for name, turn in (("multipart upload", multipart_turn), ("websocket", websocket_turn)):
+                results[name] = [await turn(main, f"stt_{name[:2]}_{i}", args.speech) for i in range(args.turns)]
+        return results
+
+    results = asyncio.run(run())
+    print(f"speech={args.speech}s  batch stt={lat['stt']}s + {args.stt_realtime_factor}x audio  "
+          f"streaming finalize={args.finalize_latency}s")
+    print("  measured from the moment the user stops talking")
+    for name, samples in results.items():
+        transcription = statistics.median(s["transcription"] for s in samples) * 1000
+        first_audio = statistics.median(s["first_audio"] for s in samples) * 1000
+        print(f"  {name:<17} transcript p50={transcription:6.0f}ms  first audio p50={first_audio:6.0f}ms")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,94 @@
+"""
+Benchmark: time to first audio, /agent/chat vs /agent/chat/{session_id}/stream
+
+/agent/chat waits for the whole Gemini response, then sends it to Murf in one
+request, so the first audio is ready after STT + LLM + TTS(all of it). The
+streaming endpoint sends each sentence to Murf as soon as it is complete, so
+the first audio is ready after STT + LLM(first sentence) + TTS(first sentence).
+
+The stub LLM streams a multi-sentence reply spread over its latency. The app is
+driven through raw ASGI calls so each chunk of the streamed body is timed as it
+is sent.
+
+Usage:
+    python benchmarks/bench_time_to_first_audio.py --turns 10 --llm-latency 2.0
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from stubs import StubGeminiClient, StubMurf, asgi_post, fake_webm, install_stubs, load_app
+
+LONG_REPLY = (
+    "Sure, here is a quick overview of how the voice agent works. "
+    "Your recording is transcribed by AssemblyAI first. "
+    "The transcript and the recent conversation go to Gemini, which writes the reply. "
+    "Murf then turns each sentence of the reply into speech. "
+    "Finally the browser plays the audio and starts listening again."
+)
+
+
+async def first_audio_latency(main, path: str, streaming: bool) -> float:
+    start = time.perf_counter()
+    first = None
+    buffer = b""
+
+    def on_chunk(chunk: bytes):
+        nonlocal first, buffer
+        buffer += chunk
+        if first is not None:
+            return
+        if not streaming:
+            first = time.perf_counter() - start
+            return
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            event = json.loads(line)
+            if event["type"] == "segment" and event["audio_file"]:
+                first = time.perf_counter() - start
+                return
+
+    files = {"audio_file": ("recording.webm", fake_webm(), "audio/webm")}
+    await asgi_post(main.app, path, files, on_chunk)
+    assert first is not None, f"no audio from {path}"
+    return first
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=10, help="Sequential turns per endpoint")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Seconds the stub LLM takes for the full reply")
+    parser.add_argument("--tts-per-char", type=float, default=0.002, help="Extra stub TTS seconds per character")
+    args = parser.parse_args()
+
+    main = load_app()
+    lat = install_stubs(main)
+    StubGeminiClient.latency = args.llm_latency
+    StubGeminiClient.reply = LONG_REPLY
+    StubMurf.per_char = args.tts_per_char
+
+    async def run():
+        results = {}
+        async with main.lifespan(main.app):
+            for name, path, streaming in (("/agent/chat", "/agent/chat/ttfa_full_{i}", False),
+                                          ("/agent/chat/{id}/stream", "/agent/chat/ttfa_stream_{i}/stream", True)):
+                samples = []
+                for i in range(args.turns):
+                    # Fresh text per turn so the TTS cache can't answer
+                    StubGeminiClient.reply = f"{LONG_REPLY} Turn {name} {i}."
+                    samples.append(await first_audio_latency(main, path.format(i=i), streaming))
+                results[name] = samples
+        return results
+
+    results = asyncio.run(run())
+    print(f"stub latencies: stt={lat['stt']}s llm={args.llm_latency}s (streamed) "
+          f"tts={lat['tts']}s + {args.tts_per_char * 1000:g}ms/char")
+    for name, samples in results.items():
+        print(f"  {name:<26} time to first audio p50={statistics.median(samples) * 1000:7.0f}ms "
+              f"max={max(samples) * 1000:7.0f}ms")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,159 @@
+"""
+Benchmark: bulk narration, one /api/tts call per chunk vs /api/tts/batch
+
+The workload is a long document (--sentences sentences, a chapter) plus an
+IVR prompt set of --prompts items in which each of --unique prompts repeats.
+The stub Murf takes --latency seconds plus --per-char seconds per character.
+
+- sequential: the client splits the document itself (the same sentence
+  chunker, since /api/tts caps a text at 5000 characters) and posts every
+  chunk and prompt to /api/tts, one after the other
+- batch: one POST /api/tts/batch with the document and the prompts
+- batch job: the same with wait=false, polling /api/tts/batch/{job_id}
+- batch rate-limited: the batch with the "tts" quota (TTS_RATE_PER_SECOND) at --rate
+
+Every mode uses its own voice, so none is served from another's stored audio.
+
+Usage:
+    python benchmarks/bench_tts_batch.py --sentences 60 --prompts 30 --unique 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+from stubs import StubMurf, install_stubs, load_app
+
+WORDS = ("voice", "forge", "narrates", "every", "chapter", "quietly", "while", "the", "listener",
+         "follows", "along", "with", "patience", "and", "curiosity")
+
+
+def sentence(i: int) -> str:
+    words = [WORDS[(i * 7 + k * 3) % len(WORDS)] for k in range(14)]
+    return f"Sentence {i} says that {' '.join(words)}."
+
+
+async def asgi_json(app, method: str, path: str, payload=None):
+    """(status, JSON body) of one raw ASGI request"""
+    body = json.dumps(payload).encode() if payload is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1),
+        "headers": [(b"content-type", b"application/json")],
+    }
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], json.loads(response["body"])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sentences", type=int, default=60, help="Sentences in the document")
+    parser.add_argument("--prompts", type=int, default=30, help="IVR prompts in the batch")
+    parser.add_argument("--unique", type=int, default=10, help="Distinct prompts among them")
+    parser.add_argument("--latency", type=float, default=0.15, help="Stub Murf seconds per call")
+    parser.add_argument("--per-char", type=float, default=0.0002, help="Stub Murf seconds per character")
+    parser.add_argument("--concurrency", type=int, default=4, help="TTS_BATCH_CONCURRENCY")
+    parser.add_argument("--chunk-chars", type=int, default=1000, help="TTS_BATCH_CHUNK_CHARS")
+    parser.add_argument("--rate", type=float, default=5.0, help="TTS_RATE_PER_SECOND for the rate-limited run")
+    args = parser.parse_args()
+
+    os.environ["TTS_BATCH_CONCURRENCY"] = str(args.concurrency)
+    os.environ["TTS_BATCH_CHUNK_CHARS"] = str(args.chunk_chars)
+    main = load_app()
+    install_stubs(main, {"tts": args.latency})
+    StubMurf.per_char = args.per_char
+    from text_processing import chunk_text_for_tts
+    from scheduler import TokenBucket
+
+    document = " ".join(sentence(i) for i in range(args.sentences))
+    prompts = [f"Prompt {i % args.unique}: please hold while we connect your call." for i in range(args.prompts)]
+
+    # Murf calls in flight, sampled by the stub itself
+    in_flight = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+    generate = StubMurf.generate
+
+    def counted_generate(self, *a, **k):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        try:
+            return generate(self, *a, **k)
+        finally:
+            with lock:
+                in_flight["now"] -= 1
+
+    StubMurf.generate = counted_generate
+
+    async def sequential(voice):
+        ok = 0
+        for text in chunk_text_for_tts(document, args.chunk_chars) + prompts:
+            _, body = await asgi_json(main.app, "POST", "/api/tts", {"text": text, "voice_id": voice})
+            ok += bool(body.get("success"))
+        return ok
+
+    def batch_payload(voice, wait=True):
+        return {"text": document, "items": [{"id": f"prompt-{i}", "text": p} for i, p in enumerate(prompts)],
+                "voice_id": voice, "wait": wait}
+
+    def segments_ok(body):
+        return sum(bool(s["audio_file"]) for item in body["items"] for s in item["segments"])
+
+    async def batch(voice):
+        _, body = await asgi_json(main.app, "POST", "/api/tts/batch", batch_payload(voice))
+        return segments_ok(body)
+
+    async def batch_job(voice):
+        _, body = await asgi_json(main.app, "POST", "/api/tts/batch", batch_payload(voice, wait=False))
+        while body["status"] not in ("done", "failed"):
+            await asyncio.sleep(0.05)
+            _, body = await asgi_json(main.app, "GET", body.get("status_url") or f"/api/tts/batch/{body['job_id']}")
+        return segments_ok(body)
+
+    async def batch_rate_limited(voice):
+        tts = main.upstreams.scheduler.services["tts"]
+        unlimited, tts.bucket = tts.bucket, TokenBucket(args.rate, burst=tts.limit)
+        try:
+            return await batch(voice)
+        finally:
+            tts.bucket = unlimited
+
+    async def run():
+        results = {}
+        async with main.lifespan(main.app):
+            for name, mode in (("sequential", sequential), ("batch", batch), ("batch job", batch_job),
+                               (f"batch @{args.rate:g}/s", batch_rate_limited)):
+                StubMurf.calls, in_flight["peak"] = 0, 0
+                start = time.perf_counter()
+                ok = await mode(f"en-US-bench-{len(results)}")
+                results[name] = (time.perf_counter() - start, ok, StubMurf.calls, in_flight["peak"])
+        return results
+
+    results = asyncio.run(run())
+    chunks = len(chunk_text_for_tts(document, args.chunk_chars))
+    print(f"document: {len(document)} chars in {chunks} chunks of <= {args.chunk_chars}; {args.prompts} prompts "
+          f"({args.unique} distinct); stub Murf {args.latency * 1000:.0f}ms + {args.per_char * 1000:.2f}ms/char, "
+          f"batch concurrency {args.concurrency}")
+    baseline = results["sequential"][0]
+    for name, (seconds, ok, calls, peak) in results.items():
+        print(f"  {name:<16} {seconds:6.2f}s  {(chunks + args.prompts) / seconds:6.1f} segments/s  "
+              f"{ok}/{chunks + args.prompts} ok  Murf calls {calls:3d}  peak in flight {peak}  "
+              f"speedup x{baseline / seconds:4.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,146 @@
+"""
+Benchmark: peak worker RSS with N concurrent audio uploads, read() vs streamed uploads
+
+`legacy` reproduces the old handling: an `UploadFile` parameter, then
+`await audio_file.read()` and the bytes handed to the transcriber, so every
+in-flight upload holds a full copy in memory. `streamed` is the current
+/transcribe/file: the body is parsed as it arrives into a spooled temp file
+and the transcriber reads that file in chunks.
+
+Each mode runs in its own subprocess so the peaks don't mix. Request bodies
+are generated chunk by chunk and fed through raw ASGI calls, so the client
+side holds no upload in memory.
+
+Usage:
+    python benchmarks/bench_upload_memory.py --uploads 50 --size-mb 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+CHUNK = 64 * 1024
+BOUNDARY = "benchboundary7f3a"
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def multipart_chunks(size: int):
+    """A multipart body with one WebM-looking audio_file part of `size` bytes, in CHUNK pieces"""
+    yield (f"--{BOUNDARY}\r\n"
+           f'Content-Disposition: form-data; name="audio_file"; filename="recording.webm"\r\n'
+           f"Content-Type: audio/webm\r\n\r\n").encode() + b"\x1a\x45\xdf\xa3"
+    remaining = size - 4
+    zeros = b"\x00" * CHUNK
+    while remaining > 0:
+        yield zeros[:min(CHUNK, remaining)]
+        remaining -= CHUNK
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def body_length(size: int) -> int:
+    return sum(len(chunk) for chunk in multipart_chunks(0)) + size
+
+
+async def upload(app, path: str, size: int) -> dict:
+    chunks = multipart_chunks(size)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1),
+        "headers": [
+            (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+            (b"content-length", str(body_length(size)).encode()),
+        ],
+    }
+    body = []
+    pending = next(chunks)
+
+    async def receive():
+        nonlocal pending
+        await asyncio.sleep(0)  # interleave the uploads like concurrent connections
+        chunk, pending = pending, next(chunks, None)
+        return {"type": "http.request", "body": chunk, "more_body": pending is not None}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return json.loads(b"".join(body))
+
+
+def legacy_app(main):
+    """The pre-streaming /transcribe/file core: UploadFile + read() into memory"""
+    from fastapi import FastAPI, File, UploadFile
+
+    legacy = FastAPI()
+
+    @legacy.post("/transcribe/file")
+    async def transcribe_file(audio_file: UploadFile = File(...)):
+        audio_data = await audio_file.read()
+        transcriber = main.upstream_clients.transcriber()
+        transcript = await main.upstreams.run("stt", transcriber.transcribe, audio_data)
+        return {"success": True, "transcription": transcript.text}
+
+    return legacy
+
+
+def run_child(mode: str, uploads: int, size: int) -> None:
+    from stubs import install_stubs, load_app
+
+    main = load_app()
+    install_stubs(main)
+    app = legacy_app(main) if mode == "legacy" else main.app
+    baseline = current_rss_mb()
+
+    async def run():
+        async with main.lifespan(main.app):
+            start = time.perf_counter()
+            results = await asyncio.gather(*(upload(app, "/transcribe/file", size) for _ in range(uploads)))
+            elapsed = time.perf_counter() - start
+        assert all(result.get("success") for result in results), results[:3]
+        return elapsed
+
+    elapsed = asyncio.run(run())
+    print(json.dumps({"mode": mode, "baseline_mb": baseline, "peak_mb": peak_rss_mb(), "seconds": elapsed}))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uploads", type=int, default=50, help="Concurrent uploads")
+    parser.add_argument("--size-mb", type=float, default=20, help="Size of each upload")
+    parser.add_argument("--child", choices=("legacy", "streamed"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = int(args.size_mb * 2**20)
+
+    if args.child:
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        run_child(args.child, args.uploads, size)
+        return
+
+    print(f"{args.uploads} concurrent uploads of {args.size_mb:g} MB "
+          f"({args.uploads * args.size_mb:g} MB in flight)")
+    for mode in ("legacy", "streamed"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", mode, "--uploads", str(args.uploads), "--size-mb", str(args.size_mb)],
+            check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        print(f"  {mode:<9} peak RSS {result['peak_mb']:7.0f} MB  (+{result['peak_mb'] - result['baseline_mb']:6.0f} MB "
+              f"over baseline)  wall {result['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,399 @@
+"""
+Load test: a mix of /agent/chat, /transcribe/file and /api/tts traffic against local upstreams
+
+Starts the app in-process (its lifespan included) with the stub Murf,
+AssemblyAI and Gemini from stubs.py and mongomock, or a local mongod with
+--mongodb-url. Every upstream takes a lognormal latency given by its median
+and p99 and fails a share of its calls (--stt/--llm/--tts/--mongodb
+"median:p99:error_rate" in seconds).
+
+Requests arrive as a Poisson process at --rate per second for --duration
+seconds, each one picked by the --mix weights:
+
+- agent_chat: a WebM recording posted to /agent/chat/{session_id}, the
+  session drawn from --sessions (so some sessions get overlapping turns)
+- transcribe: a speech-like WAV fixture of 2, 5 or 12 seconds posted to /transcribe/file
+- tts: /api/tts with a short, medium or long text; --tts-repeat of them are
+  popular phrases the cache or audio store can answer
+
+Requests that start during the first --warmup seconds are not measured.
+Every response is classified as ok, degraded (200 with success false or no
+audio), rejected (429/503) or error (other statuses, exceptions).
+
+The report (--output, JSON) holds the commit, the settings, throughput,
+per-endpoint outcome counts and latency percentiles, event-loop lag (sampled
+by a task oversleeping --lag-interval), RSS and the upstream calls and
+injected errors. --compare BASELINE.json prints the change of each metric
+against an earlier report; with two files it only compares them.
+
+Usage:
+    python benchmarks/loadtest.py --duration 30 --rate 20 --output loadtest.json
+    python benchmarks/loadtest.py --tts 0.2:2.0:0.02 --compare loadtest.json
+    python benchmarks/loadtest.py --compare before.json after.json
+"""
+import argparse
+import array
+import asyncio
+import collections
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import time
+import wave
+from datetime import datetime, timezone
+
+from stubs import (DEFAULT_LATENCIES, REPO_ROOT, LatencyModel, StubGeminiClient, StubMurf, fake_webm, install_stubs,
+                   load_app, percentile)
+
+REPORT_VERSION = 1
+ENDPOINTS = ("agent_chat", "transcribe", "tts")
+WAV_SECONDS = (2, 5, 12)
+TTS_POPULAR = (
+    "Welcome back! How can I help you today?",
+    "Please hold while we connect your call.",
+    "Thanks for calling. Goodbye!",
+)
+WORDS = ("voice", "forge", "reads", "every", "line", "clearly", "while", "the", "listener", "follows",
+         "along", "with", "patience", "and", "curiosity", "today")
+
+
+def speech_wav(seconds: float, rate: int = 16000, seed: int = 0) -> bytes:
+    """Mono 16-bit WAV: a voiced tone with a syllable envelope over faint noise"""
+    rng = random.Random(seed)
+    samples = array.array("h")
+    for n in range(int(seconds * rate)):
+        t = n / rate
+        f0 = 140 + 15 * math.sin(2 * math.pi * 0.7 * t)
+        envelope = abs(math.sin(2 * math.pi * 2.0 * t)) ** 0.5
+        voiced = sum(math.sin(2 * math.pi * k * f0 * t) / k for k in range(1, 5)) * envelope * 0.1
+        samples.append(int(max(-1.0, min(1.0, voiced + rng.gauss(0, 0.0006))) * 32767))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def tts_text(rng: random.Random, serial: int, repeat: float) -> str:
+    """A popular phrase (share `repeat`), else a new text of one to three dozen words or a paragraph"""
+    if rng.random() < repeat:
+        return rng.choice(TTS_POPULAR)
+    words = rng.choice((8, 30, 120))
+    return f"Text {serial}: " + " ".join(rng.choice(WORDS) for _ in range(words)) + "."
+
+
+def parse_mix(spec: str):
+    weights = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r} (choose from {', '.join(ENDPOINTS)})")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def classify(status: int, body) -> str:
+    if status in (429, 503):
+        return "rejected"
+    if status != 200:
+        return "error"
+    if not isinstance(body, dict) or body.get("success") is False or ("audio_file" in body and not body["audio_file"]):
+        return "degraded"
+    return "ok"
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def git_commit() -> dict:
+    def git(*args):
+        result = subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "subject": git("log", "-1", "--format=%s"),
+            "dirty": bool(status) if status is not None else None}
+
+
+def summarize(samples_ms):
+    if not samples_ms:
+        return {"count": 0}
+    return {
+        "count": len(samples_ms),
+        "mean": round(statistics.fmean(samples_ms), 2),
+        "p50": round(percentile(samples_ms, 50), 2),
+        "p90": round(percentile(samples_ms, 90), 2),
+        "p99": round(percentile(samples_ms, 99), 2),
+        "max": round(max(samples_ms), 2),
+    }
+
+
+class Sampler:
+    """Event-loop lag (how late a sleeping task wakes up) and RSS, every `interval` seconds"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lag_ms = []
+        self.rss_mb = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag_ms.append(max(0.0, (time.perf_counter() - start - self.interval) * 1000))
+            self.rss_mb.append(current_rss_mb())
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def run_load(main, args, models):
+    import httpx
+
+    rng = random.Random(args.seed)
+    fixtures = {seconds: speech_wav(seconds, seed=seconds) for seconds in WAV_SECONDS}
+    recording = fake_webm(48 * 1024)
+    serials = itertools.count()
+    latencies = collections.defaultdict(list)
+    outcomes = {endpoint: collections.Counter() for endpoint in ENDPOINTS}
+    statuses = {endpoint: collections.Counter() for endpoint in ENDPOINTS}
+    endpoints, weights = zip(*args.mix.items())
+    sampler = Sampler(args.lag_interval)
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as http:
+            if args.mongodb_url:
+                while (await http.get("/api/health/ready")).status_code != 200:
+                    await asyncio.sleep(0.2)
+
+            async def request(endpoint, measured):
+                serial = next(serials)
+                start = time.perf_counter()
+                try:
+                    if endpoint == "agent_chat":
+                        files = {"audio_file": ("recording.webm", recording, "audio/webm")}
+                        response = await http.post(f"/agent/chat/load-{rng.randrange(args.sessions)}", files=files)
+                    elif endpoint == "transcribe":
+                        seconds = rng.choice(WAV_SECONDS)
+                        files = {"audio_file": (f"speech-{seconds}s.wav", fixtures[seconds], "audio/wav")}
+                        response = await http.post("/transcribe/file", files=files)
+                    else:
+                        response = await http.post("/api/tts", json={"text": tts_text(rng, serial, args.tts_repeat)})
+                    status = response.status_code
+                    try:
+                        body = response.json()
+                    except ValueError:
+                        body = None
+                    outcome = classify(status, body)
+                except Exception:
+                    status, outcome = "exception", "error"
+                if measured:
+                    latencies[endpoint].append((time.perf_counter() - start) * 1000)
+                    outcomes[endpoint][outcome] += 1
+                    statuses[endpoint][str(status)] += 1
+
+            in_flight = set()
+            dropped = 0
+            sampler.start()
+            started = time.perf_counter()
+            measure_from = started + args.warmup
+            deadline = measure_from + args.duration
+            next_arrival = started
+            while True:
+                next_arrival += rng.expovariate(args.rate)
+                if next_arrival >= deadline:
+                    break
+                await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+                if len(in_flight) >= args.max_in_flight:
+                    dropped += 1
+                    continue
+                endpoint = rng.choices(endpoints, weights)[0]
+                task = asyncio.create_task(request(endpoint, time.perf_counter() >= measure_from))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            sent = time.perf_counter()
+            if in_flight:
+                await asyncio.wait(in_flight, timeout=args.drain_timeout)
+            unfinished = len(in_flight)
+            elapsed = time.perf_counter() - measure_from
+            await sampler.stop()
+            for task in list(in_flight):
+                task.cancel()
+
+    measured = sum(sum(counts.values()) for counts in outcomes.values())
+    return {
+        "report_version": REPORT_VERSION,
+        "label": args.label,
+        **git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            "duration": args.duration, "warmup": args.warmup, "rate": args.rate, "mix": args.mix,
+            "sessions": args.sessions, "tts_repeat": args.tts_repeat, "seed": args.seed,
+            "mongodb": "mongod" if args.mongodb_url else "mongomock",
+            "upstreams": {service: {k: v for k, v in model.to_dict().items() if k not in ("calls", "errors")}
+                          for service, model in models.items()},
+        },
+        "requests": measured,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(measured / elapsed, 2),
+        "arrival_seconds": round(sent - started, 2),
+        "dropped": dropped,
+        "unfinished": unfinished,
+        "endpoints": {
+            endpoint: {
+                **{outcome: outcomes[endpoint][outcome] for outcome in ("ok", "degraded", "rejected", "error")},
+                "statuses": dict(sorted(statuses[endpoint].items())),
+                "throughput_rps": round(sum(outcomes[endpoint].values()) / elapsed, 2),
+                "latency_ms": summarize(latencies[endpoint]),
+            }
+            for endpoint in args.mix
+        },
+        "event_loop_lag_ms": summarize(sampler.lag_ms),
+        "rss_mb": {
+            "start": round(sampler.rss_mb[0], 1) if sampler.rss_mb else None,
+            "end": round(sampler.rss_mb[-1], 1) if sampler.rss_mb else None,
+            "max_sampled": round(max(sampler.rss_mb), 1) if sampler.rss_mb else None,
+            "peak": round(peak_rss_mb(), 1),
+        },
+        "upstreams": {service: {"calls": model.calls, "errors": model.errors} for service, model in models.items()},
+    }
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['seconds']}s = {report['throughput_rps']} req/s "
+          f"(dropped {report['dropped']}, unfinished {report['unfinished']})  commit {(report['commit'] or '?')[:10]}"
+          f"{' (dirty)' if report['dirty'] else ''}")
+    for endpoint, stats in report["endpoints"].items():
+        lat = stats["latency_ms"]
+        timings = (f"p50={lat['p50']:7.1f}ms p90={lat['p90']:7.1f}ms p99={lat['p99']:7.1f}ms max={lat['max']:7.1f}ms"
+                   if lat["count"] else "no requests")
+        print(f"  {endpoint:<11} {stats['throughput_rps']:5.1f} req/s  ok {stats['ok']:4d} degraded {stats['degraded']:3d} "
+              f"rejected {stats['rejected']:3d} error {stats['error']:3d}  {timings}")
+    lag = report["event_loop_lag_ms"]
+    if lag["count"]:
+        print(f"  event-loop lag p50={lag['p50']:.1f}ms p99={lag['p99']:.1f}ms max={lag['max']:.1f}ms")
+    rss = report["rss_mb"]
+    print(f"  RSS {rss['start']} -> {rss['end']} MB (peak {rss['peak']} MB)")
+    print("  upstream calls: " + ", ".join(f"{service} {u['calls']} ({u['errors']} errors)"
+                                            for service, u in report["upstreams"].items()))
+
+
+def comparable_metrics(report):
+    """Flat {name: (value, higher_is_better)} of the headline numbers of a report"""
+    metrics = {"throughput_rps": (report["throughput_rps"], True)}
+    for endpoint, stats in report["endpoints"].items():
+        total = sum(stats[outcome] for outcome in ("ok", "degraded", "rejected", "error"))
+        if total:
+            metrics[f"{endpoint}.ok_share"] = (round(stats["ok"] / total, 4), True)
+        for q in ("p50", "p90", "p99"):
+            if q in stats["latency_ms"]:
+                metrics[f"{endpoint}.{q}_ms"] = (stats["latency_ms"][q], False)
+    for q in ("p50", "p99", "max"):
+        if q in report["event_loop_lag_ms"]:
+            metrics[f"event_loop_lag.{q}_ms"] = (report["event_loop_lag_ms"][q], False)
+    metrics["rss.peak_mb"] = (report["rss_mb"]["peak"], False)
+    return metrics
+
+
+def compare(baseline, report):
+    def name(r):
+        return f"{(r.get('commit') or '?')[:10]}{' (dirty)' if r.get('dirty') else ''} {r.get('label') or ''}".strip()
+
+    if baseline["settings"] != report["settings"]:
+        print("⚠️ the reports were taken with different settings")
+    print(f"{'metric':<26} {name(baseline):>22} {name(report):>22} {'change':>9}")
+    old, new = comparable_metrics(baseline), comparable_metrics(report)
+    for metric, (value, higher_is_better) in new.items():
+        if metric not in old:
+            continue
+        before = old[metric][0]
+        change = (value - before) / before * 100 if before else 0.0
+        better = change > 0 if higher_is_better else change < 0
+        flag = "" if abs(change) < 5 else (" better" if better else " worse")
+        print(f"{metric:<26} {before:>22} {value:>22} {change:+8.1f}%{flag}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds of traffic")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of traffic before measuring")
+    parser.add_argument("--rate", type=float, default=10.0, help="Requests per second (Poisson arrivals)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("agent_chat=4,transcribe=2,tts=4"),
+                        help="Endpoint weights, e.g. agent_chat=4,transcribe=2,tts=4")
+    parser.add_argument("--sessions", type=int, default=200, help="Distinct sessions the agent turns are spread over")
+    parser.add_argument("--tts-repeat", type=float, default=0.3, help="Share of /api/tts requests for popular phrases")
+    for service, default in DEFAULT_LATENCIES.items():
+        parser.add_argument(f"--{service}", default=f"{default}:{default * 4:g}:0",
+                            help=f"Stub {service} latency and errors: median:p99:error_rate (seconds)")
+    parser.add_argument("--mongodb-url", help="Use this mongod instead of mongomock (--mongodb latency is then ignored)")
+    parser.add_argument("--max-in-flight", type=int, default=2000, help="Arrivals beyond this many open requests are dropped")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="Seconds to wait for open requests at the end")
+    parser.add_argument("--lag-interval", type=float, default=0.05, help="Event-loop lag sampling interval (seconds)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", help="Free-form name stored in the report")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", nargs="+", metavar="REPORT",
+                        help="Baseline report to compare with; with two reports, compare them without running")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            compare(json.load(old), json.load(new))
+        return
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes one or two reports")
+
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+    main = load_app()
+    models = {service: LatencyModel.parse(getattr(args, service), seed=args.seed + i)
+              for i, service in enumerate(DEFAULT_LATENCIES)}
+    if args.mongodb_url:
+        models.pop("mongodb")
+    install_stubs(main, models, mongodb=not args.mongodb_url)
+    # A different reply per turn, as with real users, so caches answer only for the popular TTS phrases
+    replies = itertools.count()
+    StubGeminiClient.reply = property(lambda self: f"Reply {next(replies)}: sure, here is what I found for you.")
+    StubMurf.calls = 0
+
+    report = asyncio.run(run_load(main, args, models))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(report, out, indent=2)
+        print(f"report written to {args.output}")
+    if args.compare:
+        with open(args.compare[0]) as old:
+            print()
+            compare(json.load(old), report)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,440 @@
+"""
+Local stand-ins for the upstream services used by main.py
+
+The stubs are deliberately *blocking* (time.sleep), just like the real SDKs, so
+they reproduce the event-loop stalls the execution layer is meant to remove.
+
+Benchmark-only dependencies: httpx (ASGI client) and mongomock.
+"""
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+# Make the app modules (main, chat_store, ...) importable from the benchmarks
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+# Default simulated upstream latencies in seconds
+DEFAULT_LATENCIES = {
+    "stt": 0.30,
+    "llm": 0.30,
+    "tts": 0.20,
+    "mongodb": 0.02,
+}
+
+
+class StubUpstreamError(ConnectionError):
+    """An error injected by a LatencyModel, raised where the real SDK would raise a network error"""
+
+
+class LatencyModel:
+    """
+    Latency and error distribution of one stub upstream
+
+    Use it anywhere a fixed latency in seconds is accepted (install_stubs' latencies).
+
+    - **median**: Median seconds per call
+    - **p99**: 99th percentile seconds - calls follow a lognormal distribution with
+      this tail; None: every call takes `median`
+    - **error_rate**: Share of calls that raise StubUpstreamError once their latency has passed
+    """
+
+    def __init__(self, median: float, p99: float = None, error_rate: float = 0.0, seed: int = None):
+        self.median = median
+        self.p99 = p99
+        self.error_rate = error_rate
+        # 2.326 is the standard normal's 99th percentile
+        self._sigma = math.log(p99 / median) / 2.326 if p99 and median > 0 and p99 > median else 0.0
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    @classmethod
+    def parse(cls, spec: str, seed: int = None) -> "LatencyModel":
+        """From "median[:p99[:error_rate]]" in seconds, e.g. 0.2:1.5:0.01"""
+        values = [float(v) if v else None for v in spec.split(":")]
+        return cls(values[0], *values[1:3], seed=seed)
+
+    def sample(self) -> float:
+        self.calls += 1
+        if self._sigma:
+            return self._rng.lognormvariate(math.log(self.median), self._sigma)
+        return self.median
+
+    def fails(self) -> bool:
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    def to_dict(self):
+        return {"median": self.median, "p99": self.p99, "error_rate": self.error_rate,
+                "calls": self.calls, "errors": self.errors}
+
+
+def upstream_call(service: str, latency, extra: float = 0.0) -> None:
+    """Block like one upstream call: a fixed latency or a LatencyModel sample, plus `extra`; maybe raise its error"""
+    if isinstance(latency, LatencyModel):
+        time.sleep(latency.sample() + extra)
+        if latency.fails():
+            raise StubUpstreamError(f"stub {service} failed")
+    else:
+        time.sleep(latency + extra)
+
+
+def load_app():
+    """
+    Import main.py without a real MongoDB/Atlas cluster
+
+    Points MONGODB_URL at a local address that is never dialled (install_stubs
+    provides the client before the lifespan would create one).
+    """
+    os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("MURF_API_KEY", "stub-murf-key")
+    os.environ.setdefault("GEMINI_API_KEY", "stub-gemini-key")
+    os.environ.setdefault("ASSEMBLYAI_API_KEY", "stub-assemblyai-key")
+    # Keep stored TTS audio out of the repository's uploads/
+    os.environ.setdefault("AUDIO_STORE_DIR", tempfile.mkdtemp(prefix="voiceforge-audio-"))
+    # StaticFiles/Jinja2 resolve their directories relative to the CWD
+    os.chdir(REPO_ROOT)
+    import main
+    return main
+
+
+class LatencyProxy:
+    """Wrap an object so every method call blocks for `delay` seconds (or a LatencyModel sample) first"""
+
+    def __init__(self, target, delay):
+        self._target = target
+        self._delay = delay
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            upstream_call("mongodb", self._delay)
+            return attr(*args, **kwargs)
+
+        return call
+
+
+class StubTranscript:
+    def __init__(self, text: str):
+        self.status = "completed"
+        self.error = None
+        self.text = text
+        self.confidence = 0.99
+        self.language_code = "en"
+        self.audio_duration = 1.0
+
+
+class StubTranscriber:
+    """Mimics aai.Transcriber: blocking transcribe() returning a completed transcript"""
+    latency = DEFAULT_LATENCIES["stt"]
+    # Batch transcription time grows with the audio; 0 keeps every call at `latency`
+    per_byte = 0.0
+    # Per second of WAV audio (other formats aren't decoded, so they cost nothing here)
+    per_audio_second = 0.0
+    text = "Hello there, what can you do?"
+
+    def __init__(self, config=None):
+        self.config = config
+
+    def transcribe(self, data, config=None):
+        if hasattr(data, "read"):
+            # A file object: stream it like the SDK's upload does
+            head = data.read(64 * 1024)
+            size = len(head)
+            while chunk := data.read(64 * 1024):
+                size += len(chunk)
+        else:
+            head = data or b""
+            size = len(head)
+        upstream_call("stt", self.latency, self.per_byte * size + self.per_audio_second * wav_seconds(head))
+        return StubTranscript(self.text)
+
+
+def wav_seconds(head: bytes) -> float:
+    """Duration declared by a WAV header (0 for anything else)"""
+    import io
+    import wave
+
+    if head[:4] != b"RIFF":
+        return 0.0
+    try:
+        with wave.open(io.BytesIO(head)) as reader:
+            return reader.getnframes() / reader.getframerate()
+    except (wave.Error, EOFError):
+        return 0.0
+
+
+def stub_streaming_stt(finalize_latency: float = 0.15, partial_every: int = 5):
+    """
+    Replacement for main.open_streaming_transcription
+
+    Emits a partial transcript every `partial_every` chunks and the final one
+    `finalize_latency` seconds after end_utterance(), however long the utterance was.
+    """
+    from speech_stream import StreamingTranscription
+
+    class StubStreamingTranscription(StreamingTranscription):
+        def __init__(self):
+            super().__init__()
+            self._chunks = 0
+
+        async def send_audio(self, chunk):
+            self._chunks += 1
+            if self._chunks % partial_every == 0:
+                words = StubTranscriber.text.split()
+                self._emit(" ".join(words[:min(len(words), self._chunks // partial_every)]))
+
+        async def end_utterance(self):
+            self._chunks = 0
+            self._loop.call_later(finalize_latency, self._emit, StubTranscriber.text, True)
+
+    return lambda audio_format, sample_rate: StubStreamingTranscription()
+
+
+class StubGeminiClient:
+    """Mimics genai.Client: client.models.generate_content[_stream](model=..., contents=...)"""
+    latency = DEFAULT_LATENCIES["llm"]
+    reply = "I can answer questions and chat with you. What would you like to talk about?"
+    first_chunk_fraction = 0.3
+    # Prompt processing time per character of contents + system instruction; 0 ignores prompt size
+    per_prompt_char = 0.0
+
+    def __init__(self, api_key=None, **kwargs):
+        self.models = self
+
+    def _latency(self, contents, config) -> float:
+        latency = self.latency.sample() if isinstance(self.latency, LatencyModel) else self.latency
+        return latency + self.per_prompt_char * prompt_chars(contents, config)
+
+    def _fail(self) -> None:
+        if isinstance(self.latency, LatencyModel) and self.latency.fails():
+            raise StubUpstreamError("stub llm failed")
+
+    def generate_content(self, model=None, contents=None, config=None):
+        time.sleep(self._latency(contents, config))
+        self._fail()
+        return types.SimpleNamespace(text=self.reply)
+
+    def generate_content_stream(self, model=None, contents=None, config=None):
+        # Same total latency, with the first chunk arriving after a fraction of it
+        latency = self._latency(contents, config)
+        words = self.reply.split(" ")
+        time.sleep(latency * self.first_chunk_fraction)
+        self._fail()
+        step = latency * (1 - self.first_chunk_fraction) / max(1, len(words) - 1)
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(step)
+            yield types.SimpleNamespace(text=word if i == 0 else " " + word)
+
+
+def prompt_chars(contents, config=None) -> int:
+    """Characters of a generate_content prompt: a string or structured contents, plus the system instruction"""
+    if isinstance(contents, str):
+        chars = len(contents)
+    else:
+        chars = sum(len(part.get("text", "")) for content in contents or [] for part in content["parts"])
+    return chars + len((config or {}).get("system_instruction") or "")
+
+
+class StubMurf:
+    """Mimics murf.Murf: client.text_to_speech.generate(text=..., voice_id=...)"""
+    latency = DEFAULT_LATENCIES["tts"]
+    # Synthesis time grows with the text; 0 keeps every call at `latency`
+    per_char = 0.0
+    calls = 0
+
+    def __init__(self, api_key=None, **kwargs):
+        self.text_to_speech = self
+
+    def generate(self, text=None, voice_id=None, encode_as_base_64=False, **kwargs):
+        StubMurf.calls += 1
+        upstream_call("tts", self.latency, self.per_char * len(text or ""))
+        if encode_as_base_64:
+            return types.SimpleNamespace(audio_file=None, encoded_audio=base64.b64encode(fake_mp3(text)).decode())
+        return types.SimpleNamespace(audio_file=f"https://stub.murf.local/{abs(hash((text, voice_id)))}.mp3")
+
+
+class StubMongoClient:
+    """Only what main.py touches on the client itself: client.admin.command('ping')"""
+
+    def __init__(self, delay: float):
+        self.admin = LatencyProxy(types.SimpleNamespace(command=lambda *a, **k: {"ok": 1.0}), delay)
+
+
+class StubCollection:
+    """
+    mongomock collection whose bulk_write applies UpdateOne requests one by one
+
+    mongomock's own bulk_write rejects the UpdateOne objects of newer pymongo releases.
+    Duplicate key errors are reported like a server's bulk_write: BulkWriteError
+    listing them, after every request (unordered) or the first failed one (ordered).
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def bulk_write(self, requests, ordered=True):
+        from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+        errors = []
+        for index, request in enumerate(requests):
+            try:
+                self._collection.update_one(request._filter, request._doc, upsert=request._upsert)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+def stub_registry_class():
+    """ClientRegistry subclass whose builders return the stubs instead of real SDK clients"""
+    from clients import ClientRegistry
+
+    class StubClientRegistry(ClientRegistry):
+        def _build_murf(self, api_key):
+            return StubMurf(api_key=api_key), lambda: None
+
+        def _build_gemini(self, api_key):
+            return StubGeminiClient(api_key=api_key), lambda: None
+
+        def _build_transcriber(self, api_key):
+            return StubTranscriber(), lambda: None
+
+    return StubClientRegistry
+
+
+def install_stubs(main, latencies=None, mongodb: bool = True):
+    """
+    Point main.py's upstream call sites at the local stubs
+
+    - **main**: The imported main module
+    - **latencies**: Optional overrides for DEFAULT_LATENCIES (seconds or LatencyModel)
+    - **mongodb**: Also replace MongoDB with mongomock; False leaves it to the lifespan (MONGODB_URL)
+    """
+    lat = dict(DEFAULT_LATENCIES, **(latencies or {}))
+    StubTranscriber.latency = lat["stt"]
+    StubGeminiClient.latency = lat["llm"]
+    StubMurf.latency = lat["tts"]
+
+    main.upstream_clients = stub_registry_class()()
+    if not mongodb:
+        return lat
+
+    import mongomock
+
+    db = mongomock.MongoClient().voiceforge_chat_history
+    main.client = StubMongoClient(lat["mongodb"])
+    main.chat_collection = LatencyProxy(StubCollection(db.chat_sessions), lat["mongodb"])
+    stub_db = types.SimpleNamespace(
+        chat_sessions=main.chat_collection,
+        chat_buckets=LatencyProxy(StubCollection(db.chat_buckets), lat["mongodb"]),
+    )
+    main.db = stub_db
+    main.chat_store = main.build_chat_store(stub_db, layout=main.CHAT_STORAGE_LAYOUT, bucket_size=main.CHAT_BUCKET_SIZE)
+    return lat
+
+
+def percentile(samples, q: float) -> float:
+    """Nearest-rank percentile (q in 0-100) of a non-empty list of samples"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def fake_webm(size: int = 4096) -> bytes:
+    """A tiny payload with a WebM/EBML header; the stub transcriber never decodes it"""
+    return b"\x1a\x45\xdf\xa3" + b"\x00" * (size - 4)
+
+
+def fake_mp3(text: str = "", seconds: float = 2.0) -> bytes:
+    """MP3-sized bytes for a reply (128 kbit/s), distinct per text; nothing decodes them"""
+    size = int(seconds * 16000)
+    return b"ID3" + (text or "").encode()[:64].ljust(64, b"\x00") + b"\xff" * (size - 67)
+
+
+async def asgi_post(app, path: str, files: dict, on_chunk) -> None:
+    """
+    POST multipart files to path through raw ASGI calls
+
+    Calls on_chunk(bytes) for every body chunk as the app sends it (httpx's
+    ASGITransport buffers the whole response, hiding streaming).
+    """
+    import httpx
+
+    request = httpx.Request("POST", f"http://bench{path}", files=files)
+    body = request.read()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in request.headers.items()],
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # no disconnect during the benchmark
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            on_chunk(message["body"])
+
+    await app(scope, receive, send)
+
+
+class ASGIWebSocket:
+    """Minimal in-process WebSocket client speaking raw ASGI to the app"""
+
+    def __init__(self, app, path: str):
+        self._inbox = asyncio.Queue()
+        self._outbox = asyncio.Queue()
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "scheme": "ws", "path": path, "raw_path": path.encode(), "query_string": b"",
+            "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1),
+            "headers": [], "subprotocols": [],
+        }
+        self._inbox.put_nowait({"type": "websocket.connect"})
+        self.task = asyncio.ensure_future(app(scope, self._inbox.get, self._outbox.put))
+
+    async def receive_json(self):
+        while True:
+            message = await self._outbox.get()
+            if message["type"] == "websocket.send":
+                return json.loads(message["text"])
+            if message["type"] == "websocket.close":
+                raise ConnectionError("server closed the WebSocket")
+
+    def send_json(self, data):
+        self._inbox.put_nowait({"type": "websocket.receive", "text": json.dumps(data)})
+
+    def send_bytes(self, data: bytes):
+        self._inbox.put_nowait({"type": "websocket.receive", "bytes": data})
+
+    async def close(self):
+        self._inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        await self.task
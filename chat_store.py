@@ -0,0 +1,592 @@
+"""
+Chat history storage layouts
+
+`embedded` (the original layout): one `chat_sessions` document per session,
+every message `$push`ed onto its `chats` array. Heavy sessions grow toward the
+16 MB BSON limit and every append rewrites the whole, ever larger, document.
+
+`bucketed`: `chat_sessions` becomes a small session index (timestamps, the
+open bucket) and the messages live in `chat_buckets` documents holding about
+`bucket_size` messages each. An append rewrites one bounded bucket, and reading
+the last K messages touches only the newest ceil(K / bucket_size) + 1 buckets.
+Buckets are numbered 0, 1, ... per session (`seq`, unique per session) and read
+in that order; the session index keeps the number and start position of the
+bucket taking appends (`bucket_seq`, `bucket_start`), which moves on only once
+that bucket is full. Each bucket records the position of its first message
+(`start`), fixed when it is opened, so a session's message count is its newest
+bucket's `start` + `count` - there is no separate counter to fall out of step.
+
+Both stores expose the same blocking interface (run them on the "mongodb"
+upstream pool):
+
+- `recent(session_id, limit)` -> (last `limit` message documents, total count)
+- `append_many({session_id: [messages]}, retried)` -> one batched write for many
+  sessions; for the sessions in `retried` (an earlier write may have stored
+  part of their messages) messages whose `message_id` is already stored are
+  skipped, so retrying a write never duplicates messages
+- `recent_with_summary(session_id, limit)` -> same as `recent` plus the
+  session's rolling summary (see llm_context.py), read in the same query
+- `set_summary(session_id, text, covers)`
+- `version(session_id)` -> (total count, updated_at) - what the history API's ETag is made of
+- `page(session_id, start, limit, fields)` -> (up to `limit` messages from
+  position `start`, oldest first, with only `fields`, total count)
+- `ensure_indexes()`
+
+A message's position in its session (0 = first) never changes - history is
+append-only - so positions serve as pagination cursors.
+
+The rolling summary lives on the chat_sessions document in both layouts:
+`{"summary": {"text": ..., "covers": <messages folded in>, "updated_at": ...}}`.
+
+Migrating from embedded to bucketed happens lazily (a legacy session is moved
+into buckets the first time it is read or written) or in bulk with:
+
+    python chat_store.py migrate
+
+Chat turns the write-behind queue gave up on (see persistence.py) are written
+again, skipping messages that did get stored, with:
+
+    python chat_store.py replay uploads/chat_dead_letters.jsonl
+"""
+import logging
+import math
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Collection, Dict, List, Optional, Set, Tuple
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from database import ensure_indexes as ensure_session_index
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, Any]
+
+LAYOUTS = ("embedded", "bucketed")
+DEFAULT_BUCKET_SIZE = 100
+DUPLICATE_KEY = 11000
+
+
+def _message_window(array: str, start: int, count: int, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """$project expression for `count` (> 0) messages of an array field from `start`, keeping only `fields`"""
+    window = {"$slice": [{"$ifNull": [f"${array}", []]}, start, count]}
+    if fields is None:
+        return window
+    return {"$map": {"input": window, "as": "message", "in": {field: f"$$message.{field}" for field in fields}}}
+
+
+class _SessionSummary:
+    """Rolling summary stored on the chat_sessions document (shared by both layouts)"""
+
+    sessions: Any
+
+    def recent(self, session_id: str, limit: int) -> Tuple[List[Message], int]:
+        messages, total, _ = self.recent_with_summary(session_id, limit)
+        return messages, total
+
+    def recent_with_summary(self, session_id: str, limit: int) -> Tuple[List[Message], int, Optional[Dict[str, Any]]]:
+        raise NotImplementedError
+
+    def set_summary(self, session_id: str, text: str, covers: int) -> bool:
+        """
+        Store a summary of the first `covers` messages
+
+        Only replaces a summary covering fewer messages, so a slower, older
+        summarization (another worker) can't overwrite a newer one.
+        """
+        result = self.sessions.update_one(
+            {"session_id": session_id, "$or": [
+                {"summary.covers": {"$lt": covers}},
+                {"summary": {"$exists": False}},
+            ]},
+            {"$set": {"summary": {"text": text, "covers": covers, "updated_at": datetime.utcnow()}}},
+        )
+        return bool(result.modified_count)
+
+    def _stored_ids(self, session_id: str, message_ids: List[str]) -> Set[str]:
+        raise NotImplementedError
+
+    def _without_stored(self, pending: Dict[str, List[Message]], retried: Collection[str]) -> Dict[str, List[Message]]:
+        """pending minus the messages of retried sessions that are already stored"""
+        unstored = {}
+        for session_id, messages in pending.items():
+            if session_id in retried:
+                stored = self._stored_ids(session_id, [message["message_id"] for message in messages if "message_id" in message])
+                messages = [message for message in messages if message.get("message_id") not in stored]
+                if len(messages) < len(pending[session_id]):
+                    logger.info(f"♻️ Skipping {len(pending[session_id]) - len(messages)} already stored messages of session {session_id}")
+            if messages:
+                unstored[session_id] = messages
+        return unstored
+
+
+class EmbeddedChatStore(_SessionSummary):
+    """All messages of a session in one chat_sessions document's `chats` array"""
+
+    layout = "embedded"
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+
+    def ensure_indexes(self) -> None:
+        ensure_session_index(self.sessions)
+
+    def recent_with_summary(self, session_id: str, limit: int) -> Tuple[List[Message], int, Optional[Dict[str, Any]]]:
+        # Slice and count server-side so only `limit` messages cross the wire
+        pipeline = [
+            {"$match": {"session_id": session_id}},
+            {"$limit": 1},
+            {"$project": {
+                "_id": 0,
+                "chats": {"$slice": [{"$ifNull": ["$chats", []]}, -limit]},
+                "message_count": {"$size": {"$ifNull": ["$chats", []]}},
+                "summary": 1,
+            }},
+        ]
+        session_docs = list(self.sessions.aggregate(pipeline))
+        if not session_docs:
+            return [], 0, None
+        return session_docs[0]["chats"], session_docs[0]["message_count"], session_docs[0].get("summary")
+
+    def version(self, session_id: str) -> Tuple[int, Optional[datetime]]:
+        pipeline = [
+            {"$match": {"session_id": session_id}},
+            {"$limit": 1},
+            {"$project": {"_id": 0, "message_count": {"$size": {"$ifNull": ["$chats", []]}}, "updated_at": 1}},
+        ]
+        session_docs = list(self.sessions.aggregate(pipeline))
+        if not session_docs:
+            return 0, None
+        return session_docs[0]["message_count"], session_docs[0].get("updated_at")
+
+    def page(self, session_id: str, start: int, limit: int,
+             fields: Optional[List[str]] = None) -> Tuple[List[Message], int]:
+        if limit <= 0:
+            return [], self.version(session_id)[0]
+        pipeline = [
+            {"$match": {"session_id": session_id}},
+            {"$limit": 1},
+            {"$project": {
+                "_id": 0,
+                "chats": _message_window("chats", start, limit, fields),
+                "message_count": {"$size": {"$ifNull": ["$chats", []]}},
+            }},
+        ]
+        session_docs = list(self.sessions.aggregate(pipeline))
+        if not session_docs:
+            return [], 0
+        return session_docs[0]["chats"], session_docs[0]["message_count"]
+
+    def _stored_ids(self, session_id: str, message_ids: List[str]) -> Set[str]:
+        if not message_ids:
+            return set()
+        # Only on the retry path: the ids of the whole array, not the messages
+        session_doc = self.sessions.find_one(
+            {"session_id": session_id, "chats.message_id": {"$in": message_ids}},
+            {"_id": 0, "chats.message_id": 1},
+        )
+        if session_doc is None:
+            return set()
+        return {message.get("message_id") for message in session_doc.get("chats", [])} & set(message_ids)
+
+    def append_many(self, pending: Dict[str, List[Message]], retried: Collection[str] = ()) -> None:
+        pending = self._without_stored(pending, retried)
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"session_id": session_id},
+                {
+                    "$push": {"chats": {"$each": messages}},
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True
+            )
+            for session_id, messages in pending.items()
+        ]
+        if operations:
+            self.sessions.bulk_write(operations, ordered=False)
+
+
+class BucketedChatStore(_SessionSummary):
+    """
+    Session index in chat_sessions, messages in fixed-size chat_buckets documents
+
+    - **sessions**: The chat_sessions collection (session index)
+    - **buckets**: The chat_buckets collection
+    - **bucket_size**: Messages per bucket document before a new one is opened
+    - **migration_lease**: Seconds a lazy migration keeps a session claimed (a
+      claim left by a crashed worker expires after this)
+    """
+
+    layout = "bucketed"
+
+    def __init__(self, sessions, buckets, bucket_size: int = DEFAULT_BUCKET_SIZE, migration_lease: float = 60.0):
+        self.sessions = sessions
+        self.buckets = buckets
+        self.bucket_size = bucket_size
+        self.migration_lease = migration_lease
+
+    def ensure_indexes(self) -> None:
+        ensure_session_index(self.sessions)
+        self._number_buckets()
+        # One bucket per number, scanned newest-first
+        self.buckets.create_index([("session_id", ASCENDING), ("seq", DESCENDING)], unique=True, name="session_id_seq")
+
+    def _number_buckets(self) -> None:
+        """Give buckets written before they were numbered a seq and a start position, in the order they were opened"""
+        unnumbered = set(self.buckets.distinct("session_id", {"seq": {"$exists": False}}))
+        for session_id in unnumbered | set(self.buckets.distinct("session_id", {"start": {"$exists": False}})):
+            order = [("opened_at", ASCENDING), ("_id", ASCENDING)] if session_id in unnumbered else [("seq", ASCENDING)]
+            buckets = list(self.buckets.find({"session_id": session_id}, {"_id": 1, "count": 1}).sort(order))
+            operations, start = [], 0
+            for seq, bucket in enumerate(buckets):
+                operations.append(UpdateOne({"_id": bucket["_id"]}, {"$set": {"seq": seq, "start": start}}))
+                start += bucket.get("count", 0)
+            self.buckets.bulk_write(operations)
+            self.sessions.update_one(
+                {"session_id": session_id},
+                {"$max": {"bucket_seq": len(buckets) - 1, "bucket_start": start - buckets[-1].get("count", 0)}},
+            )
+            logger.info(f"📦 Numbered {len(buckets)} buckets of session {session_id}")
+
+    @staticmethod
+    def _total(newest_bucket: Optional[Dict[str, Any]]) -> int:
+        """Messages in a session: where its newest bucket starts plus what that bucket holds"""
+        if newest_bucket is None:
+            return 0
+        return newest_bucket.get("start", 0) + newest_bucket.get("count", 0)
+
+    def recent_with_summary(self, session_id: str, limit: int) -> Tuple[List[Message], int, Optional[Dict[str, Any]]]:
+        # A legacy session still carries its `chats` array; slicing to one element
+        # is enough to detect it without transferring the array
+        session_doc = self.sessions.find_one(
+            {"session_id": session_id},
+            {"_id": 0, "summary": 1, "chats": {"$slice": -1}},
+        )
+        if session_doc is None:
+            return [], 0, None
+        if "chats" in session_doc:
+            if not self.migrate_session(session_id):
+                # Another reader is migrating it, or a legacy writer got in between -
+                # serve this read from the old layout
+                return EmbeddedChatStore(self.sessions).recent_with_summary(session_id, limit)
+            return self.recent_with_summary(session_id, limit)
+
+        summary = session_doc.get("summary")
+        # The newest bucket may be partially filled, so read one extra; it also gives the total
+        newest_first = self.buckets.find(
+            {"session_id": session_id},
+            {"_id": 0, "messages": 1, "count": 1, "start": 1} if limit > 0 else {"_id": 0, "count": 1, "start": 1},
+        ).sort("seq", DESCENDING).limit(math.ceil(max(limit, 0) / self.bucket_size) + 1)
+
+        collected: List[List[Message]] = []
+        total = None
+        count = 0
+        for bucket in newest_first:
+            if total is None:
+                total = self._total(bucket)
+            if limit <= 0 or count >= limit:
+                break
+            collected.append(bucket["messages"])
+            count += len(bucket["messages"])
+        messages = [message for bucket_messages in reversed(collected) for message in bucket_messages]
+        return (messages[-limit:] if limit > 0 else []), total or 0, summary
+
+    def version(self, session_id: str) -> Tuple[int, Optional[datetime]]:
+        session_doc = self.sessions.find_one(
+            {"session_id": session_id},
+            {"_id": 0, "updated_at": 1, "chats": {"$slice": -1}},
+        )
+        if session_doc is None:
+            return 0, None
+        if "chats" in session_doc:
+            return EmbeddedChatStore(self.sessions).version(session_id)
+        newest = self.buckets.find_one({"session_id": session_id}, {"_id": 0, "count": 1, "start": 1}, sort=[("seq", DESCENDING)])
+        return self._total(newest), session_doc.get("updated_at")
+
+    def page(self, session_id: str, start: int, limit: int,
+             fields: Optional[List[str]] = None) -> Tuple[List[Message], int]:
+        session_doc = self.sessions.find_one(
+            {"session_id": session_id},
+            {"_id": 0, "chats": {"$slice": -1}},
+        )
+        if session_doc is None:
+            return [], 0
+        if "chats" in session_doc:
+            if not self.migrate_session(session_id):
+                return EmbeddedChatStore(self.sessions).page(session_id, start, limit, fields)
+            return self.page(session_id, start, limit, fields)
+
+        # Bucket sizes only (a few bytes per bucket): the total, and the buckets holding [start, end)
+        sizes = list(self.buckets.find({"session_id": session_id}, {"_id": 1, "count": 1}).sort("seq", ASCENDING))
+        total = sum(bucket.get("count", 0) for bucket in sizes)
+        end = min(start + limit, total)
+        if end <= start:
+            return [], total
+        wanted = []
+        position = 0
+        for bucket in sizes:
+            if position >= end:
+                break
+            if position + bucket.get("count", 0) > start:
+                wanted.append((bucket["_id"], position))
+            position += bucket.get("count", 0)
+        if not wanted:
+            return [], total
+
+        projection = {"_id": 1, "messages": 1} if fields is None else {"_id": 1, **{f"messages.{field}": 1 for field in fields}}
+        buckets = {bucket["_id"]: bucket["messages"]
+                   for bucket in self.buckets.find({"_id": {"$in": [bucket_id for bucket_id, _ in wanted]}}, projection)}
+        # Only the first and last bucket are cut, so at most two buckets' worth is read beyond the page
+        messages: List[Message] = []
+        for bucket_id, position in wanted:
+            bucket_messages = buckets.get(bucket_id, [])
+            messages.extend(bucket_messages[max(0, start - position):end - position])
+        return messages, total
+
+    def _append_update(self, session_id: str, bucket: Tuple[int, int], chunk: List[Message]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        (filter, update) of an upsert appending chunk to bucket (seq, start) while it holds fewer than bucket_size messages
+
+        The write that fills a bucket may overflow it by its own length (one turn
+        is two messages). Once it is full, the upsert's insert collides with the
+        bucket on the unique (session_id, seq) index and fails with a duplicate
+        key error instead of opening a second bucket with the same number. The
+        push and the bucket's count change in the same write, so the count
+        never disagrees with the messages.
+        """
+        seq, start = bucket
+        return (
+            {"session_id": session_id, "seq": seq, "count": {"$lt": self.bucket_size}},
+            {
+                "$push": {"messages": {"$each": chunk}},
+                "$inc": {"count": len(chunk)},
+                "$setOnInsert": {"start": start, "opened_at": chunk[0].get("timestamp") or datetime.utcnow()},
+            },
+        )
+
+    def _append_chunk(self, session_id: str, open_buckets: Dict[str, Tuple[int, int]], chunk: List[Message],
+                      attempts: int = 5) -> None:
+        """Append chunk on its own, moving the session on to the next bucket while the one in open_buckets is full"""
+        for _ in range(attempts):
+            try:
+                self.buckets.update_one(*self._append_update(session_id, open_buckets[session_id], chunk), upsert=True)
+                return
+            except DuplicateKeyError:
+                open_buckets[session_id] = self._next_bucket(session_id, open_buckets[session_id])
+        raise RuntimeError(f"Could not append to a bucket of session {session_id} after {attempts} attempts")
+
+    def _next_bucket(self, session_id: str, bucket: Tuple[int, int]) -> Tuple[int, int]:
+        """The (seq, start) bucket to write after a duplicate key error on bucket"""
+        seq, _ = bucket
+        current = self.buckets.find_one({"session_id": session_id, "seq": seq}, {"_id": 0, "count": 1, "start": 1})
+        if current is None or current.get("count", 0) < self.bucket_size:
+            return bucket  # a concurrent writer opened it first; it still has room
+        # A full bucket takes no more writes, so where the next one starts is settled.
+        # $max: concurrent writers that find the same bucket full all move to the same next one
+        # The update returns the session's open bucket, which may be further on than
+        # the next one if this writer fell behind
+        now = datetime.utcnow()
+        session_doc = self.sessions.find_one_and_update(
+            {"session_id": session_id},
+            {"$max": {"bucket_seq": seq + 1, "bucket_start": self._total(current)},
+             "$setOnInsert": {"created_at": now, "layout": self.layout}},
+            projection={"_id": 0, "bucket_seq": 1, "bucket_start": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return session_doc["bucket_seq"], session_doc["bucket_start"]
+
+    def _stored_ids(self, session_id: str, message_ids: List[str]) -> Set[str]:
+        if not message_ids:
+            return set()
+        buckets = self.buckets.find(
+            {"session_id": session_id, "messages.message_id": {"$in": message_ids}},
+            {"_id": 0, "messages.message_id": 1},
+        )
+        return {message.get("message_id") for bucket in buckets for message in bucket["messages"]} & set(message_ids)
+
+    def append_many(self, pending: Dict[str, List[Message]], retried: Collection[str] = ()) -> None:
+        """
+        Append to each session's open bucket, after making sure its session document exists
+
+        The session write only records timestamps - a session's message count is
+        derived from its buckets - so a failure between it and the bucket writes
+        can't leave a count out of step with the messages.
+        """
+        pending = self._without_stored(pending, retried)
+        if not pending:
+            return
+        session_docs = {
+            session_doc["session_id"]: session_doc
+            for session_doc in self.sessions.find(
+                {"session_id": {"$in": list(pending)}},
+                {"_id": 0, "session_id": 1, "bucket_seq": 1, "bucket_start": 1, "chats": {"$slice": -1}},
+            )
+        }
+        # Legacy sessions must be moved into buckets first so their messages stay oldest
+        for session_id, session_doc in session_docs.items():
+            if "chats" in session_doc:
+                self._migrate_before_write(session_id)
+                session_docs[session_id] = self.sessions.find_one(
+                    {"session_id": session_id}, {"_id": 0, "bucket_seq": 1, "bucket_start": 1})
+        open_buckets = {
+            session_id: (session_docs.get(session_id, {}).get("bucket_seq", 0),
+                         session_docs.get(session_id, {}).get("bucket_start", 0))
+            for session_id in pending
+        }
+        chunks = {
+            session_id: [messages[start:start + self.bucket_size] for start in range(0, len(messages), self.bucket_size)]
+            for session_id, messages in pending.items()
+        }
+
+        now = datetime.utcnow()
+        self.sessions.bulk_write([
+            UpdateOne(
+                {"session_id": session_id},
+                {"$set": {"updated_at": now}, "$setOnInsert": {"created_at": now, "layout": self.layout}},
+                upsert=True,
+            )
+            for session_id in pending
+        ], ordered=False)
+
+        # Usually each session's messages go to its open bucket in one write - one bulk_write for all of them
+        order = list(pending)
+        appended = set(order)
+        try:
+            self.buckets.bulk_write(
+                [UpdateOne(*self._append_update(session_id, open_buckets[session_id], chunks[session_id][0]), upsert=True)
+                 for session_id in order],
+                ordered=False,
+            )
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") != DUPLICATE_KEY:
+                    raise
+                appended.discard(order[error["index"]])
+        # Sessions whose open bucket was full, and chunks beyond the first, one write at a time and in order
+        for session_id in order:
+            for chunk in chunks[session_id][1 if session_id in appended else 0:]:
+                self._append_chunk(session_id, open_buckets, chunk)
+
+    def _migrate_before_write(self, session_id: str, attempts: int = 3) -> None:
+        for _ in range(attempts):
+            if self.migrate_session(session_id):
+                return
+        raise RuntimeError(f"Could not migrate legacy session {session_id} to bucketed storage")
+
+    def migrate_session(self, session_id: str) -> bool:
+        """
+        Move one embedded session's `chats` array into buckets
+
+        The migration first claims the session: a compare-and-set of its `layout`
+        to "migrating" (or over a claim older than migration_lease), so
+        concurrent readers don't race each other into the buckets - whoever loses
+        returns False and reads the old layout. Buckets are numbered by their
+        position, and the legacy array is only removed if it still has the length
+        that was copied (a concurrent legacy writer makes this return False so
+        the caller can retry).
+        """
+        now = datetime.utcnow()
+        session_doc = self.sessions.find_one_and_update(
+            {"session_id": session_id, "chats": {"$exists": True}, "$or": [
+                {"layout": {"$ne": "migrating"}},
+                {"migration_started_at": {"$lt": now - timedelta(seconds=self.migration_lease)}},
+            ]},
+            {"$set": {"layout": "migrating", "migration_started_at": now}},
+            projection={"_id": 0, "chats": 1},
+        )
+        if session_doc is None:
+            return False  # not a legacy session (anymore), or another worker is migrating it
+        claim = {"session_id": session_id, "layout": "migrating", "migration_started_at": now}
+        chats = session_doc["chats"]
+        buckets = []
+        for position in range(0, len(chats), self.bucket_size):
+            chunk = chats[position:position + self.bucket_size]
+            buckets.append({
+                "session_id": session_id,
+                "messages": chunk,
+                "count": len(chunk),
+                "seq": position // self.bucket_size,
+                "start": position,
+                "opened_at": chunk[0].get("timestamp") or datetime.min,
+                "migrated_from_position": position,
+            })
+        try:
+            # Leftovers of a migration that lost its claim
+            self.buckets.delete_many({"session_id": session_id, "migrated_from_position": {"$exists": True}})
+            if buckets:
+                self.buckets.insert_many(buckets, ordered=True)
+        except DuplicateKeyError:
+            # The claim expired and another migration took over
+            return False
+        result = self.sessions.update_one(
+            {**claim, "chats": {"$size": len(chats)}},
+            {"$unset": {"chats": "", "migration_started_at": ""},
+             "$set": {"bucket_seq": max(0, len(buckets) - 1), "bucket_start": buckets[-1]["start"] if buckets else 0,
+                      "layout": self.layout}},
+        )
+        if result.modified_count:
+            logger.info(f"📦 Migrated session {session_id} ({len(chats)} messages) to bucketed storage")
+            return True
+        # A legacy writer appended meanwhile - give the session back to the old layout
+        if self.sessions.update_one(claim, {"$set": {"layout": EmbeddedChatStore.layout},
+                                            "$unset": {"migration_started_at": ""}}).modified_count:
+            self.buckets.delete_many({"session_id": session_id, "migrated_from_position": {"$exists": True}})
+        return False
+
+    def migrate_all(self, batch_size: int = 100) -> int:
+        """Migrate every legacy session in one pass; returns the number migrated"""
+        legacy_ids = [
+            session_doc["session_id"]
+            for session_doc in self.sessions.find(
+                {"chats": {"$exists": True}}, {"_id": 0, "session_id": 1}
+            ).batch_size(batch_size)
+        ]
+        return sum(self.migrate_session(session_id) for session_id in legacy_ids)
+
+
+def build_chat_store(db, layout: str = "embedded", bucket_size: int = DEFAULT_BUCKET_SIZE):
+    """
+    Create the store for the configured layout
+
+    - **db**: The voiceforge_chat_history database
+    - **layout**: "embedded" or "bucketed" (CHAT_STORAGE_LAYOUT)
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown CHAT_STORAGE_LAYOUT {layout!r}, expected one of {LAYOUTS}")
+    if layout == "bucketed":
+        return BucketedChatStore(db.chat_sessions, db.chat_buckets, bucket_size)
+    return EmbeddedChatStore(db.chat_sessions)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["migrate"] and (len(sys.argv) != 3 or sys.argv[1] != "replay"):
+        raise SystemExit("Usage: python chat_store.py migrate | python chat_store.py replay <dead-letter file>")
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    from database import connection_options
+    from executor import env_int
+    from persistence import read_dead_letters
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    mongo_client = MongoClient(os.environ["MONGODB_URL"], **connection_options())
+    if sys.argv[1] == "replay":
+        store = build_chat_store(mongo_client.voiceforge_chat_history, os.getenv("CHAT_STORAGE_LAYOUT", "embedded"),
+                                 env_int("CHAT_BUCKET_SIZE", DEFAULT_BUCKET_SIZE))
+        records = read_dead_letters(sys.argv[2])
+        for record in records:
+            store.append_many({record["session_id"]: record["messages"]}, retried={record["session_id"]})
+        print(f"✅ Replayed {len(records)} dead-lettered chat writes")
+    else:
+        store = BucketedChatStore(
+            mongo_client.voiceforge_chat_history.chat_sessions,
+            mongo_client.voiceforge_chat_history.chat_buckets,
+            env_int("CHAT_BUCKET_SIZE", DEFAULT_BUCKET_SIZE),
+        )
+        store.ensure_indexes()
+        print(f"✅ Migrated {store.migrate_all()} sessions to bucketed storage")
@@ -0,0 +1,154 @@
+"""
+Process-wide upstream SDK clients (Murf, Gemini, AssemblyAI)
+
+Building a new SDK client per request means a new HTTP session, a new TLS
+handshake and more allocation on every turn. The registry keeps one
+long-lived client per service, each backed by a keep-alive connection pool,
+and rebuilds a client only when its API key changes.
+
+The registry is created and closed by the FastAPI lifespan in main.py. The
+SDKs themselves are imported by the builders, on first use: together they
+take longer to import than the rest of the app, and each worker process
+(and every autoreload) would otherwise pay for that before serving anything.
+"""
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from executor import env_int
+
+logger = logging.getLogger(__name__)
+
+
+def transcription_config() -> Dict[str, Any]:
+    """Same transcription settings transcribe_file has always used"""
+    import assemblyai as aai
+
+    return dict(
+        speech_model=aai.SpeechModel.best,
+        language_detection=True,
+        punctuate=True,
+        format_text=True,
+    )
+
+
+def _murf_key() -> Optional[str]:
+    return os.getenv("MURF_API_KEY")
+
+
+def _gemini_key() -> Optional[str]:
+    return os.getenv("GEMINI_API_KEY")
+
+
+def _assemblyai_key() -> Optional[str]:
+    return os.getenv("ASSEMBLYAI_API_KEY")
+
+
+class ClientRegistry:
+    """
+    Long-lived upstream clients, rebuilt when their API key rotates
+
+    - **pool_size**: Maximum connections kept per upstream HTTP pool (Murf, Gemini)
+    - **keepalive_expiry**: Seconds an idle keep-alive connection is kept open (Murf, Gemini)
+    """
+
+    def __init__(self, pool_size: int = 20, keepalive_expiry: float = 60.0):
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self._lock = threading.Lock()
+        # service -> (api_key, client, closer)
+        self._clients: Dict[str, Tuple[str, Any, Callable[[], None]]] = {}
+        # Clients replaced after a key rotation; in-flight calls may still hold
+        # them, so they are only closed on shutdown
+        self._retired: List[Tuple[str, Callable[[], None]]] = []
+        self.builds: Dict[str, int] = {"murf": 0, "gemini": 0, "assemblyai": 0}
+
+    @classmethod
+    def from_env(cls) -> "ClientRegistry":
+        """Build a registry sized by UPSTREAM_HTTP_POOL_SIZE / UPSTREAM_HTTP_KEEPALIVE_SECONDS"""
+        return cls(
+            pool_size=env_int("UPSTREAM_HTTP_POOL_SIZE", 20),
+            keepalive_expiry=float(env_int("UPSTREAM_HTTP_KEEPALIVE_SECONDS", 60)),
+        )
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def _get(self, service: str, api_key: Optional[str], build: Callable[[str], Tuple[Any, Callable[[], None]]]) -> Any:
+        """Return the cached client for service, (re)building it if the key changed"""
+        if not api_key:
+            raise ValueError(f"API key for {service} is not configured")
+        cached = self._clients.get(service)
+        if cached and cached[0] == api_key:
+            return cached[1]
+        with self._lock:
+            cached = self._clients.get(service)
+            if cached and cached[0] == api_key:
+                return cached[1]
+            if cached:
+                logger.info(f"🔑 {service} API key changed - rebuilding client")
+                self._retired.append((service, cached[2]))
+            client, closer = build(api_key)
+            self._clients[service] = (api_key, client, closer)
+            self.builds[service] += 1
+            return client
+
+    # Builders return (client, closer) and are overridable, e.g. by the benchmark stubs
+
+    def _build_murf(self, api_key: str) -> Tuple[Any, Callable[[], None]]:
+        from murf import Murf
+
+        http_client = httpx.Client(limits=self._limits(), timeout=60, follow_redirects=True)
+        return Murf(api_key=api_key, httpx_client=http_client), http_client.close
+
+    def _build_gemini(self, api_key: str) -> Tuple[Any, Callable[[], None]]:
+        from google import genai
+        from google.genai import types as genai_types
+
+        http_options = genai_types.HttpOptions(client_args={"limits": self._limits()})
+        client = genai.Client(api_key=api_key, http_options=http_options)
+        return client, client.close
+
+    def _build_transcriber(self, api_key: str) -> Tuple[Any, Callable[[], None]]:
+        import assemblyai as aai
+
+        settings = aai.settings.copy()
+        settings.api_key = api_key
+        # The SDK builds its own httpx client and takes no limits: its pool keeps the SDK defaults
+        aai_client = aai.Client(settings=settings)
+        transcriber = aai.Transcriber(client=aai_client, config=aai.TranscriptionConfig(**transcription_config()))
+        return transcriber, aai_client.http_client.close
+
+    # Accessors
+
+    def murf(self) -> Any:
+        """Shared Murf client for the current MURF_API_KEY"""
+        return self._get("murf", _murf_key(), self._build_murf)
+
+    def gemini(self) -> Any:
+        """Shared Gemini client for the current GEMINI_API_KEY"""
+        return self._get("gemini", _gemini_key(), self._build_gemini)
+
+    def transcriber(self) -> Any:
+        """Shared AssemblyAI transcriber for the current ASSEMBLYAI_API_KEY"""
+        return self._get("assemblyai", _assemblyai_key(), self._build_transcriber)
+
+    def close(self) -> None:
+        """Close every pooled HTTP connection (called from the lifespan on shutdown)"""
+        with self._lock:
+            closers = [(service, closer) for service, (_, _, closer) in self._clients.items()]
+            closers += self._retired
+            self._clients.clear()
+            self._retired.clear()
+        for service, closer in closers:
+            try:
+                closer()
+            except Exception as e:
+                logger.warning(f"⚠️ Error closing {service} client: {type(e).__name__}: {e}")
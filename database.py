@@ -0,0 +1,122 @@
+"""
+MongoDB connection profile and retry policy
+
+The client used to be created with `maxPoolSize=1` and every read/write was
+preceded by a `ping`, so concurrent chat turns queued behind a single socket
+and paid an extra round trip each. This module provides:
+
+- `connection_options()`: a production pool profile configurable from the environment
+- `with_retries()`: retries driven by pymongo's own retryable-error classification
+- `warm_up()`: a first connection so the driver can fill the pool to minPoolSize
+- `ensure_indexes()`: the unique `session_id` index the chat helpers rely on
+"""
+import logging
+import random
+import time
+from typing import Any, Callable, Dict
+
+from pymongo import ASCENDING
+from pymongo.errors import ConnectionFailure, PyMongoError, WaitQueueTimeoutError
+from pymongo.server_api import ServerApi
+
+from executor import env_int
+from metrics import RETRIES
+from resilience import call_time_left
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def connection_options() -> Dict[str, Any]:
+    """
+    MongoClient keyword arguments for the production connection profile
+
+    Pool sizing is read from MONGODB_MAX_POOL_SIZE, MONGODB_MIN_POOL_SIZE and
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS. The pool should be at least as large as
+    MONGODB_MAX_CONCURRENCY (the thread pool that runs pymongo calls).
+    """
+    return dict(
+        server_api=ServerApi('1'),
+        serverSelectionTimeoutMS=env_int("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 30000),  # DNS + SRV resolution
+        connectTimeoutMS=env_int("MONGODB_CONNECT_TIMEOUT_MS", 20000),
+        socketTimeoutMS=env_int("MONGODB_SOCKET_TIMEOUT_MS", 20000),
+        maxPoolSize=env_int("MONGODB_MAX_POOL_SIZE", 32),
+        minPoolSize=env_int("MONGODB_MIN_POOL_SIZE", 4),
+        # How long a caller waits for a free socket before failing fast
+        waitQueueTimeoutMS=env_int("MONGODB_WAIT_QUEUE_TIMEOUT_MS", 5000),
+        maxIdleTimeMS=env_int("MONGODB_MAX_IDLE_TIME_MS", 45000),
+        retryWrites=True,
+        retryReads=True,
+        # Lazy connection - don't resolve DNS or connect at construction time
+        connect=False,
+    )
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether an operation that raised error is worth retrying
+
+    Network errors and primary step-downs (ConnectionFailure, which includes
+    AutoReconnect/NotPrimaryError/NetworkTimeout/ServerSelectionTimeoutError) and
+    server errors labelled RetryableWriteError are transient. A wait-queue
+    timeout means the pool is exhausted, so retrying would only add load.
+    """
+    if isinstance(error, WaitQueueTimeoutError):
+        return False
+    if isinstance(error, ConnectionFailure):
+        return True
+    if isinstance(error, PyMongoError):
+        return error.has_error_label("RetryableWriteError") or error.has_error_label("TransientTransactionError")
+    return False
+
+
+def with_retries(operation: Callable[[], Any], description: str,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, base_delay: float = 0.1) -> Any:
+    """
+    Run a blocking pymongo operation, retrying transient failures with jittered backoff
+
+    - **operation**: Zero-argument callable performing the database call
+    - **description**: Used in log lines ("saving chat message", ...)
+
+    Non-retryable errors and the last failed attempt are raised to the caller,
+    as is an error whose retry would start after the caller's timeout (see
+    resilience.py). Blocking (sleeps between attempts) - run it on the
+    "mongodb" upstream pool.
+
+    Only for idempotent operations (reads, guarded `$set`/`$max` updates): after
+    a ConnectionFailure the first attempt may have been applied, so a `$push`
+    retried here can be written twice. Appends rely on retryWrites instead.
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return operation()
+        except Exception as e:
+            if attempt == max_attempts or not is_retryable(e):
+                raise
+            delay = base_delay * (2 ** (attempt - 1)) * (1 + random.random())
+            time_left = call_time_left()
+            if time_left is not None and delay >= time_left:
+                raise  # nobody is waiting for the result anymore
+            RETRIES.inc(operation=description)
+            logger.warning(f"Attempt {attempt}/{max_attempts} - Transient error {description}: {type(e).__name__}: {e} (retrying in {delay:.2f}s)")
+            time.sleep(delay)
+
+
+def warm_up(client) -> None:
+    """
+    Establish the first connection so the driver's pool maintenance can open
+    minPoolSize sockets in the background before the first chat turn
+    """
+    client.admin.command('ping')
+
+
+def ensure_indexes(collection) -> None:
+    """
+    Create the unique session_id index on chat_sessions (no-op if it already exists)
+
+    Every history read and write looks a session up by session_id; without the
+    index each lookup is a collection scan. Fails with DuplicateKeyError if the
+    collection already holds duplicate sessions.
+    """
+    collection.create_index([("session_id", ASCENDING)], unique=True, name="session_id_unique")
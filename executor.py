@@ -0,0 +1,179 @@
+"""
+Execution layer for the blocking upstream SDKs (AssemblyAI, Gemini, Murf, MongoDB)
+
+The SDKs we use are synchronous. Calling them directly from an `async def`
+endpoint blocks the event loop, so one slow transcription stalls every other
+request in the worker. Every blocking upstream call goes through
+`UpstreamExecutor.run`, which hands it to a bounded thread pool dedicated to
+that upstream. Each pool size is the concurrency limit for its service.
+
+Calls get their pool slot from the service's scheduler, by priority class and
+within the provider's rate quota (see scheduler.py). Every call records its
+queue wait (per priority) and run time per upstream (see metrics.py).
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from metrics import UPSTREAM_ERRORS, UPSTREAM_QUEUE_SECONDS, UPSTREAM_SECONDS
+from scheduler import UpstreamScheduler, current_priority
+
+logger = logging.getLogger(__name__)
+
+# Default per-upstream concurrency limits (overridable via environment)
+DEFAULT_LIMITS = {
+    "stt": 8,        # AssemblyAI transcriptions are long-running uploads + polling
+    "llm": 16,       # Gemini generate_content
+    "tts": 8,        # Murf text_to_speech
+    "mongodb": 16,   # pymongo operations
+    "audio": 2,      # local audio preprocessing (NumPy, ffmpeg subprocesses) - CPU bound
+}
+
+ENV_VARS = {
+    "stt": "STT_MAX_CONCURRENCY",
+    "llm": "LLM_MAX_CONCURRENCY",
+    "tts": "TTS_MAX_CONCURRENCY",
+    "mongodb": "MONGODB_MAX_CONCURRENCY",
+    "audio": "AUDIO_MAX_CONCURRENCY",
+}
+
+
+def env_int(name: str, default: int) -> int:
+    """Read a positive integer from the environment, falling back to default"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        parsed = int(value)
+    except ValueError:
+        logger.warning(f"⚠️ Ignoring invalid {name}={value!r}, using {default}")
+        return default
+    return parsed if parsed > 0 else default
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float from the environment, falling back to default"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"⚠️ Ignoring invalid {name}={value!r}, using {default}")
+        return default
+
+
+class UpstreamExecutor:
+    """
+    One bounded thread pool per upstream service
+
+    - **limits**: Mapping of service name to maximum concurrent calls
+    - **scheduler**: Hands out the pool slots (default: priority weights only, no rate quotas)
+    """
+
+    def __init__(self, limits: Dict[str, int], scheduler: Optional[UpstreamScheduler] = None):
+        self.limits = dict(limits)
+        self.scheduler = scheduler or UpstreamScheduler(self.limits)
+        self._pools: Dict[str, ThreadPoolExecutor] = {
+            service: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"upstream-{service}")
+            for service, limit in self.limits.items()
+        }
+        self._in_flight: Dict[str, int] = {service: 0 for service in self.limits}
+
+    @classmethod
+    def from_env(cls) -> "UpstreamExecutor":
+        """Build an executor using DEFAULT_LIMITS overridden by *_MAX_CONCURRENCY env vars"""
+        limits = {
+            service: env_int(ENV_VARS[service], default)
+            for service, default in DEFAULT_LIMITS.items()
+        }
+        return cls(limits, UpstreamScheduler.from_env(limits))
+
+    async def acquire(self, service: str, timeout: Optional[float] = None) -> None:
+        """
+        Wait for a slot on the service's pool at the caller's priority (see scheduler.py)
+
+        - **timeout**: Seconds to wait in the queue (None: no limit); raises asyncio.TimeoutError after it
+
+        Every acquire must be followed by exactly one submit() or release()
+        """
+        if service not in self._pools:
+            raise KeyError(f"Unknown upstream service: {service}")
+        priority = current_priority()
+        queued = time.perf_counter()
+        self._in_flight[service] += 1
+        try:
+            if timeout is None:
+                await self.scheduler.acquire(service, priority)
+            else:
+                await asyncio.wait_for(self.scheduler.acquire(service, priority), timeout)
+        except BaseException:
+            self._in_flight[service] -= 1
+            raise
+        UPSTREAM_QUEUE_SECONDS.observe(time.perf_counter() - queued, upstream=service, priority=priority)
+
+    def submit(self, service: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> "asyncio.Future[Any]":
+        """
+        Start a blocking callable on a slot taken with acquire()
+
+        Returns a future of fn's result; the slot is freed when the worker
+        thread is done with fn, not when the future's awaiter stops waiting
+        """
+        loop = asyncio.get_running_loop()
+        # Copy the context so contextvars set by the request survive the hop to the worker thread
+        context = contextvars.copy_context()
+
+        def call():
+            started = time.perf_counter()
+            try:
+                return context.run(fn, *args, **kwargs)
+            except Exception:
+                UPSTREAM_ERRORS.inc(upstream=service)
+                raise
+            finally:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, upstream=service)
+
+        def release(_):
+            # The slot is free once the worker thread is done (or the call never started)
+            try:
+                loop.call_soon_threadsafe(self.release, service)
+            except RuntimeError:
+                pass  # loop closed at shutdown
+
+        future = self._pools[service].submit(call)
+        future.add_done_callback(release)
+        return asyncio.wrap_future(future)
+
+    def release(self, service: str) -> None:
+        """Give back a slot taken with acquire() (submit() does this when its call is done)"""
+        self._in_flight[service] -= 1
+        self.scheduler.release(service)
+
+    async def run(self, service: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a blocking callable on the pool for the given upstream service
+
+        - **service**: One of the configured services ("stt", "llm", "tts", "mongodb", "audio")
+        - **fn**: The blocking callable
+
+        Waits for a slot at the caller's priority (see scheduler.py).
+        Returns whatever fn returns; exceptions propagate to the caller
+        """
+        await self.acquire(service)
+        return await self.submit(service, fn, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Current limit and in-flight (queued + running on a worker) call count per service (see scheduler.stats() per priority)"""
+        return {
+            service: {"limit": self.limits[service], "in_flight": self._in_flight[service]}
+            for service in self.limits
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Shut down every pool (called from the app lifespan on exit)"""
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
@@ -0,0 +1,168 @@
+"""
+Background health checks behind the liveness/readiness probes
+
+/api/health used to ping MongoDB and `count_documents({})` the whole
+chat_sessions collection on every request, so each load balancer probe cost a
+round trip plus a collection scan, and probe latency tracked database load.
+Now a `HealthMonitor` runs the registered checks on a fixed interval in the
+background and the probe endpoints only read its last results:
+
+- every check of a round runs concurrently, each bounded by `timeout`
+- a check either returns details (up) or raises (down, with the error)
+- readiness needs the startup steps (`warm_up()`) finished, a completed
+  round, results no older than `stale_after` and every *critical* check up;
+  non-critical checks (the upstream APIs, which every replica shares) only
+  mark the service degraded
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from executor import env_float
+
+logger = logging.getLogger(__name__)
+
+Check = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class HealthMonitor:
+    """
+    Runs health checks periodically and keeps the latest result of each
+
+    - **interval**: Seconds between the end of one round and the start of the next
+    - **timeout**: Seconds a single check may take before it counts as down
+    - **stale_after**: Age of the last round after which readiness fails (default 3 intervals)
+    """
+
+    def __init__(self, interval: float = 10.0, timeout: float = 3.0, stale_after: Optional[float] = None):
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after if stale_after is not None else 3 * interval
+        # name -> (check, critical)
+        self._checks: Dict[str, Tuple[Check, bool]] = {}
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._last_round: Optional[float] = None
+        self._warming: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.rounds = 0
+        self.started_at = time.monotonic()
+
+    @classmethod
+    def from_env(cls) -> "HealthMonitor":
+        """Interval and per-check timeout from HEALTH_CHECK_INTERVAL_SECONDS / HEALTH_CHECK_TIMEOUT_SECONDS"""
+        return cls(
+            interval=env_float("HEALTH_CHECK_INTERVAL_SECONDS", 10.0),
+            timeout=env_float("HEALTH_CHECK_TIMEOUT_SECONDS", 3.0),
+        )
+
+    def register(self, name: str, check: Check, critical: bool = True) -> None:
+        """Add a check; critical checks must be up for the service to be ready"""
+        self._checks[name] = (check, critical)
+
+    def start(self) -> None:
+        """Start the background loop (called from the lifespan); the first round runs immediately"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def warm_up(self, name: str, step: Awaitable[Any]) -> None:
+        """
+        Run a startup step; readiness stays "starting" until every step has finished
+
+        A step that fails still ends the wait - the checks decide readiness from there.
+        """
+        self._warming.add(name)
+        try:
+            await step
+        finally:
+            self._warming.discard(name)
+        if not self._warming:
+            # Don't make the first ready answer wait for the next interval
+            await self.run_checks()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_checks()
+            except Exception as e:
+                logger.error(f"❌ Health check round failed: {type(e).__name__}: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_checks(self) -> None:
+        """Run one round of every registered check concurrently"""
+        names = list(self._checks)
+        results = await asyncio.gather(*(self._check(name) for name in names))
+        for name, result in zip(names, results):
+            previous = self._results.get(name, {}).get("status")
+            # Log changes, and failures of the first round
+            if previous != result["status"] and (previous is not None or result["status"] != "up"):
+                log = logger.info if result["status"] == "up" else logger.warning
+                log(f"{'✅' if result['status'] == 'up' else '⚠️'} Health: {name} is {result['status']}"
+                    f"{' - ' + result['error'] if 'error' in result else ''}")
+            self._results[name] = result
+        self._last_round = time.monotonic()
+        self.rounds += 1
+
+    async def _check(self, name: str) -> Dict[str, Any]:
+        check, critical = self._checks[name]
+        start = time.perf_counter()
+        try:
+            details = await asyncio.wait_for(check(), timeout=self.timeout)
+            result = {"status": "up", **(details or {})}
+        except asyncio.TimeoutError:
+            result = {"status": "down", "error": f"no answer within {self.timeout:g}s"}
+        except Exception as e:
+            result = {"status": "down", "error": f"{type(e).__name__}: {e}"}
+        result["critical"] = critical
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        result["checked_at"] = datetime.now(timezone.utc).isoformat()
+        return result
+
+    def age(self) -> Optional[float]:
+        """Seconds since the last completed round, None before the first"""
+        return None if self._last_round is None else time.monotonic() - self._last_round
+
+    def readiness(self) -> Tuple[bool, str]:
+        """(ready, reason) from the cached results - no I/O"""
+        if self._warming:
+            return False, f"starting ({', '.join(sorted(self._warming))})"
+        age = self.age()
+        if age is None:
+            return False, "starting"
+        if age > self.stale_after:
+            return False, f"health checks stale ({age:.0f}s old)"
+        down = [name for name, result in self._results.items() if result["critical"] and result["status"] != "up"]
+        if down:
+            return False, f"{', '.join(down)} down"
+        return True, "ready"
+
+    def status(self) -> str:
+        """starting, healthy, degraded (a non-critical check down) or unhealthy (not ready)"""
+        ready, reason = self.readiness()
+        if not ready:
+            return "starting" if reason.startswith("starting") else "unhealthy"
+        if any(result["status"] != "up" for result in self._results.values()):
+            return "degraded"
+        return "healthy"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Latest result per check, as served by the probes"""
+        age = self.age()
+        return {
+            "status": self.status(),
+            "checked_seconds_ago": None if age is None else round(age, 1),
+            "services": dict(self._results),
+        }
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started_at
@@ -0,0 +1,272 @@
+"""
+Opt-in response cache for the agent's LLM step (LLM_CACHE=on)
+
+Many voice turns are the same few short queries - greetings, "what can you
+do", the same question repeated after a failed transcription - and every one
+of them used to be a full Gemini call. Responses are cached under the
+normalized transcription plus a fingerprint of the recent context (the last
+`context_messages` messages), in two tiers:
+
+- exact: same normalized query and context fingerprint
+- semantic: cosine similarity of locally computed embeddings (hashed word and
+  character-trigram features, no model download or API call) at or above
+  `similarity_threshold`, only among entries with the same context fingerprint
+  and the same content words - every word but a short list of stopwords, so
+  numbers included - in the same order. Embeddings alone put "square root of
+  484222" right next to "square root of 90222"; the semantic tier only bridges
+  phrasings that differ in stopwords ("so what can you do" / "what can you do")
+
+Entries expire after `ttl_seconds`; the least recently used one is evicted
+beyond `max_entries`. Turns whose answer depends on more than the query are
+never cached (`key_for()` returns None):
+
+- the session has a rolling summary (it is personalized by now)
+- more than `max_history` messages of history
+- queries longer than `max_query_words` words (specific, unlikely to repeat)
+
+Hits are counted per tier, along with the LLM time they saved (the latency of
+the call that produced the cached response). The semantic tier needs NumPy;
+without it the cache runs exact-only, and importing this module never needs it.
+"""
+import hashlib
+import logging
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from executor import env_float, env_int
+
+try:
+    import numpy as np
+except ImportError:  # optional: exact tier only
+    np = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 512
+
+_APOSTROPHES = re.compile(r"['\u2019]")
+_NON_WORD = re.compile(r"[^\w\s]+")
+# Hesitations and politeness that STT transcribes but that don't change the answer
+FILLER_WORDS = frozenset({"um", "umm", "uh", "uhm", "er", "erm", "hmm", "please"})
+# Words a semantic hit may differ in. Question words, pronouns, negations and numbers are not among them
+STOP_WORDS = frozenset({
+    "a", "an", "the", "so", "well", "ok", "okay", "oh", "just", "really", "actually", "exactly",
+    "is", "are", "am", "was", "were", "be", "been", "being", "do", "does", "did", "doing",
+    "can", "could", "would", "will", "shall", "should", "may", "might",
+    "to", "of", "in", "on", "at", "for", "with", "about", "and", "or", "then", "there",
+})
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, drop punctuation, apostrophes and filler words - the differences STT output varies in"""
+    words = _NON_WORD.sub(" ", _APOSTROPHES.sub("", text.lower())).split()
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+def embed(normalized: str, dim: int = EMBEDDING_DIM) -> "np.ndarray":
+    """
+    Unit-length feature-hashed embedding of a normalized query
+
+    Whole words carry most of the weight; character trigrams make near-misses
+    of the same word ("joke" / "jokes") still overlap. Stopwords count for a
+    tenth, so phrasings that only differ in them stay close.
+    """
+    features = []
+    for word in normalized.split():
+        scale = 0.1 if word in STOP_WORDS else 1.0
+        padded = f" {word} "
+        features.append((f"w:{word}", scale))
+        features.extend((f"c:{padded[i:i + 3]}", 0.3 * scale) for i in range(len(padded) - 2))
+    vector = np.zeros(dim, dtype=np.float32)
+    if not features:
+        return vector
+    hashes = np.array([zlib.crc32(feature.encode("utf-8")) for feature, _ in features], dtype=np.uint64)
+    weights = np.array([weight for _, weight in features], dtype=np.float32)
+    # The top hash bit picks the sign, so colliding features partly cancel out instead of adding up
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, (hashes % dim).astype(np.intp), signs * weights)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def content_signature(normalized: str) -> int:
+    """64-bit hash of a normalized query's content words (all but STOP_WORDS), in order"""
+    payload = " ".join(word for word in normalized.split() if word not in STOP_WORDS)
+    return int.from_bytes(hashlib.sha256(payload.encode("utf-8")).digest()[:8], "little")
+
+
+def context_fingerprint(history: List[Any], context_messages: int) -> int:
+    """64-bit fingerprint of the last `context_messages` messages (roles + normalized content)"""
+    recent = history[-context_messages:] if context_messages else []
+    payload = "\x00".join(f"{message.role}\x01{normalize_query(message.content)}" for message in recent)
+    return int.from_bytes(hashlib.sha256(payload.encode("utf-8")).digest()[:8], "little")
+
+
+class CacheKey:
+    """Lookup key of one turn, from LLMResponseCache.key_for()"""
+
+    def __init__(self, query: str, fingerprint: int, vector: Optional["np.ndarray"]):
+        self.query = query
+        self.fingerprint = fingerprint
+        self.vector = vector
+        self.signature = content_signature(query)
+        self.exact = f"{fingerprint:016x}:{query}"
+
+
+class _Entry:
+    __slots__ = ("response", "expires", "slot", "seconds")
+
+    def __init__(self, response: str, expires: float, slot: int, seconds: float):
+        self.response = response
+        self.expires = expires
+        self.slot = slot
+        self.seconds = seconds
+
+
+class LLMResponseCache:
+    """
+    Exact + semantic LRU/TTL cache of agent LLM responses
+
+    - **max_entries**: LRU capacity
+    - **ttl_seconds**: Lifetime of an entry
+    - **similarity_threshold**: Minimum cosine similarity for a semantic hit (above 1, or without NumPy: no semantic tier)
+    - **context_messages**: Recent messages that make up the context fingerprint
+    - **max_history**: Sessions with more history than this bypass the cache
+    - **max_query_words**: Longer queries bypass the cache
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600, similarity_threshold: float = 0.95,
+                 context_messages: int = 2, max_history: int = 2, max_query_words: int = 12):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.context_messages = context_messages
+        self.max_history = max_history
+        self.max_query_words = max_query_words
+        self.semantic = similarity_threshold <= 1 and np is not None
+        if similarity_threshold <= 1 and np is None:
+            logger.warning("⚠️ NumPy is not installed, the LLM response cache runs without its semantic tier")
+        # exact key -> entry, in LRU order
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Embedding slots for the semantic tier, one row per entry
+        if self.semantic:
+            self._vectors = np.zeros((max_entries, EMBEDDING_DIM), dtype=np.float32)
+            self._fingerprints = np.zeros(max_entries, dtype=np.uint64)
+            self._signatures = np.zeros(max_entries, dtype=np.uint64)
+            self._live = np.zeros(max_entries, dtype=bool)
+        self._slot_keys: List[Optional[str]] = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self.counters = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+        self.saved_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "LLMResponseCache":
+        return cls(
+            max_entries=env_int("LLM_CACHE_MAX_ENTRIES", 512),
+            ttl_seconds=env_int("LLM_CACHE_TTL_SECONDS", 3600),
+            similarity_threshold=env_float("LLM_CACHE_SIMILARITY", 0.95),
+            max_history=env_int("LLM_CACHE_MAX_HISTORY", 2),
+            max_query_words=env_int("LLM_CACHE_MAX_QUERY_WORDS", 12),
+        )
+
+    def key_for(self, query: str, history: List[Any], summary: Optional[Dict[str, Any]] = None) -> Optional[CacheKey]:
+        """
+        Cache key of a turn, or None if the turn must bypass the cache
+
+        - **history**: Recent messages of the session (objects with `role` and `content`)
+        - **summary**: The session's rolling summary, if any
+        """
+        normalized = normalize_query(query)
+        if (not normalized or summary or len(history) > self.max_history
+                or len(normalized.split()) > self.max_query_words):
+            self.counters["bypassed"] += 1
+            return None
+        return CacheKey(normalized, context_fingerprint(history, self.context_messages),
+                        embed(normalized) if self.semantic else None)
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        """Cached response for the key (exact, then semantic tier), or None"""
+        now = time.monotonic()
+        entry = self._entries.get(key.exact)
+        if entry is not None and entry.expires <= now:
+            self._remove(key.exact)
+            entry = None
+        if entry is not None:
+            self.counters["exact_hits"] += 1
+        else:
+            entry = self._nearest(key, now)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["semantic_hits"] += 1
+        self._entries.move_to_end(self._slot_keys[entry.slot])
+        self.saved_seconds += entry.seconds
+        return entry.response
+
+    def _nearest(self, key: CacheKey, now: float) -> Optional[_Entry]:
+        if not self.semantic:
+            return None
+        candidates = (self._live & (self._fingerprints == np.uint64(key.fingerprint))
+                      & (self._signatures == np.uint64(key.signature)))
+        if not candidates.any():
+            return None
+        scores = np.where(candidates, self._vectors @ key.vector, -1.0)
+        best = int(scores.argmax())
+        if scores[best] < self.similarity_threshold:
+            return None
+        exact = self._slot_keys[best]
+        entry = self._entries[exact]
+        if entry.expires <= now:
+            self._remove(exact)
+            return None
+        return entry
+
+    def put(self, key: CacheKey, response: str, seconds: float) -> None:
+        """
+        Cache a response
+
+        - **seconds**: How long the LLM call took - credited as saved on every hit
+        """
+        if key.exact in self._entries:
+            self._remove(key.exact)
+        while len(self._entries) >= self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+        slot = self._free_slots.pop()
+        if self.semantic:
+            self._vectors[slot] = key.vector
+            self._fingerprints[slot] = key.fingerprint
+            self._signatures[slot] = key.signature
+            self._live[slot] = True
+        self._slot_keys[slot] = key.exact
+        self._entries[key.exact] = _Entry(response, time.monotonic() + self.ttl_seconds, slot, seconds)
+        self.counters["stores"] += 1
+
+    def _remove(self, exact: str) -> None:
+        entry = self._entries.pop(exact)
+        if self.semantic:
+            self._live[entry.slot] = False
+        self._slot_keys[entry.slot] = None
+        self._free_slots.append(entry.slot)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, hit rate and LLM time saved, for /api/llm/cache and metrics"""
+        hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
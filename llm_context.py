@@ -0,0 +1,250 @@
+"""
+Gemini context for an agent turn: structured multi-turn contents, a token budget and a rolling summary
+
+`format_chat_history_for_llm` used to glue the last 10 messages into one flat
+prompt string. Nothing bounded its size (one long earlier reply inflated the
+prompt, and the LLM latency, of every following turn) and everything older
+than those 10 messages was forgotten.
+
+`ContextBuilder.build()` produces:
+
+- `contents`: the recent messages as user/model turns followed by the current
+  user message, newest first until `token_budget` is spent; a single message
+  longer than `max_message_tokens` is cut
+- `system_instruction`: the rolling summary of everything older, capped at
+  `summary_tokens`
+
+`RollingSummarizer` keeps that summary up to date incrementally. Once `window`
+messages of a session are not covered by its summary, all but the newest
+`keep` are folded in with one small LLM call that sees only the previous
+summary and those messages, so a summary is never recomputed from the whole
+session. It runs in the background after the turn has been answered, and
+the summary is stored on the session document (see chat_store.py).
+
+Token counts are estimated (about 4 characters per token for English) rather
+than asked from Gemini's count_tokens, which would cost a round trip per turn.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from executor import env_int
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+
+Summary = Dict[str, Any]  # {"text": ..., "covers": number of messages folded in, ...}
+
+SUMMARY_INSTRUCTION = (
+    "The earlier part of this conversation is not included in the messages. "
+    "Summary of it:\n{summary}"
+)
+
+SUMMARY_PROMPT = (
+    "You keep a running summary of a voice conversation between a user and an AI assistant. "
+    "Update the summary with the new messages. Keep names, facts, preferences, decisions and "
+    "open questions; drop greetings and small talk. Write plain prose, at most {words} words.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New messages:\n{messages}\n\n"
+    "Updated summary:"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, at a word boundary where possible"""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit - 1]
+    space = cut.rfind(" ")
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "…"
+
+
+class LLMContext:
+    """
+    Prompt for one generate_content call
+
+    - **contents**: Gemini contents, `[{"role": "user" | "model", "parts": [{"text": ...}]}, ...]`
+    - **system_instruction**: Rolling summary instruction, or None
+    - **tokens**: Estimated prompt tokens
+    - **history_messages**: Past messages included in contents
+    """
+
+    def __init__(self, contents: List[Dict[str, Any]], system_instruction: Optional[str],
+                 tokens: int, history_messages: int):
+        self.contents = contents
+        self.system_instruction = system_instruction
+        self.tokens = tokens
+        self.history_messages = history_messages
+
+    @property
+    def uses_history(self) -> bool:
+        return bool(self.history_messages or self.system_instruction)
+
+    def config(self) -> Optional[Dict[str, Any]]:
+        """`config` argument for generate_content / generate_content_stream"""
+        if self.system_instruction is None:
+            return None
+        return {"system_instruction": self.system_instruction}
+
+
+class ContextBuilder:
+    """
+    Token-budgeted Gemini context from recent messages and the rolling summary
+
+    - **token_budget**: Estimated tokens for summary + history (the current message is always sent)
+    - **max_message_tokens**: Longer past messages are cut to this
+    - **summary_tokens**: Cap for the summary in the prompt
+    """
+
+    def __init__(self, token_budget: int = 2000, max_message_tokens: int = 400, summary_tokens: int = 300):
+        self.token_budget = token_budget
+        self.max_message_tokens = max_message_tokens
+        self.summary_tokens = summary_tokens
+
+    @classmethod
+    def from_env(cls) -> "ContextBuilder":
+        return cls(
+            token_budget=env_int("LLM_CONTEXT_TOKENS", 2000),
+            max_message_tokens=env_int("LLM_CONTEXT_MESSAGE_TOKENS", 400),
+            summary_tokens=env_int("LLM_SUMMARY_TOKENS", 300),
+        )
+
+    def build(self, history: List[Any], user_message: str, summary: Optional[Summary] = None) -> LLMContext:
+        """
+        Context for a turn
+
+        - **history**: Recent messages, oldest first (objects with `role` and `content`)
+        - **user_message**: The current user message
+        - **summary**: The session's rolling summary, if any
+        """
+        remaining = self.token_budget
+        system_instruction = None
+        if summary and summary.get("text"):
+            system_instruction = SUMMARY_INSTRUCTION.format(
+                summary=truncate_to_tokens(summary["text"], self.summary_tokens))
+            remaining -= estimate_tokens(system_instruction)
+
+        picked: List[Tuple[str, str]] = []
+        for message in reversed(history):
+            text = truncate_to_tokens(message.content, self.max_message_tokens)
+            cost = estimate_tokens(text)
+            if cost > remaining:
+                break
+            remaining -= cost
+            picked.append(("user" if message.role == "user" else "model", text))
+        picked.reverse()
+        # Gemini expects the conversation to open with a user turn
+        while picked and picked[0][0] == "model":
+            remaining += estimate_tokens(picked.pop(0)[1])
+        history_messages = len(picked)
+
+        contents: List[Dict[str, Any]] = []
+        for role, text in picked + [("user", user_message)]:
+            if contents and contents[-1]["role"] == role:
+                # e.g. a turn whose assistant message was never saved
+                contents[-1]["parts"].append({"text": text})
+            else:
+                contents.append({"role": role, "parts": [{"text": text}]})
+        tokens = self.token_budget - remaining + estimate_tokens(user_message)
+        return LLMContext(contents, system_instruction, tokens, history_messages)
+
+
+def summary_prompt(previous: Optional[str], messages: List[Dict[str, Any]], summary_tokens: int,
+                   max_message_tokens: int) -> str:
+    lines = "\n".join(
+        f"{'User' if message['role'] == 'user' else 'Assistant'}: "
+        f"{truncate_to_tokens(message['content'], max_message_tokens)}"
+        for message in messages
+    )
+    return SUMMARY_PROMPT.format(
+        words=summary_tokens * 3 // 4, summary=previous or "(none yet)", messages=lines)
+
+
+class RollingSummarizer:
+    """
+    Background, incremental summary updates per session
+
+    - **load**: Async (session_id, limit) -> (last `limit` message dicts, total count, summary or None)
+    - **save**: Async (session_id, text, covers) storing the summary of the first `covers` messages
+    - **summarize**: Async prompt -> summary text (one LLM call)
+    - **window**: Unsummarized messages that trigger an update (the history fetched per turn)
+    - **keep**: Newest messages left out of the summary, still sent verbatim
+    - **summary_tokens**: Cap for the summary text
+    - **max_message_tokens**: Longer messages are cut before they are summarized
+
+    Sessions that predate summaries start theirs from their last 2 x window
+    messages; older ones are never loaded.
+    """
+
+    def __init__(self, load: Callable[[str, int], Awaitable[Tuple[List[Dict[str, Any]], int, Optional[Summary]]]],
+                 save: Callable[[str, str, int], Awaitable[Any]],
+                 summarize: Callable[[str], Awaitable[str]],
+                 window: int = 10, keep: int = 4, summary_tokens: int = 300, max_message_tokens: int = 400):
+        self._load = load
+        self._save = save
+        self._summarize = summarize
+        self.window = window
+        self.keep = min(keep, max(0, window - 2))
+        self.summary_tokens = summary_tokens
+        self.max_message_tokens = max_message_tokens
+        self._running: Dict[str, asyncio.Task] = {}
+        self.stats = {"updates": 0, "failures": 0}
+
+    def due(self, total: int, summary: Optional[Summary]) -> bool:
+        """True if the next turn would push messages out of the history window unsummarized"""
+        covered = summary.get("covers", 0) if summary else 0
+        return total - covered >= self.window
+
+    def schedule(self, session_id: str, total: int, summary: Optional[Summary]) -> None:
+        """
+        Start a background update for the session if one is due; returns immediately
+
+        - **total**: Message count including the turn that just finished
+        - **summary**: The summary the turn was answered with
+        """
+        if session_id in self._running or not self.due(total, summary):
+            return
+        task = asyncio.create_task(self._update(session_id))
+        self._running[session_id] = task
+        task.add_done_callback(lambda _: self._running.pop(session_id, None))
+
+    async def _update(self, session_id: str) -> None:
+        try:
+            messages, total, summary = await self._load(session_id, 2 * self.window)
+            covered = summary.get("covers", 0) if summary else 0
+            fold_until = total - self.keep
+            if fold_until <= covered:
+                return
+            # messages[i] is message number first + i of the session
+            first = total - len(messages)
+            to_fold = messages[max(covered, first) - first:fold_until - first]
+            if not to_fold:
+                return
+            prompt = summary_prompt(summary.get("text") if summary else None, to_fold,
+                                    self.summary_tokens, self.max_message_tokens)
+            text = (await self._summarize(prompt) or "").strip()
+            if not text:
+                raise ValueError("LLM returned an empty summary")
+            await self._save(session_id, truncate_to_tokens(text, self.summary_tokens), fold_until)
+            self.stats["updates"] += 1
+            logger.info(f"📝 Rolling summary of session {session_id} now covers {fold_until} messages")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.warning(f"⚠️ Rolling summary update failed for session {session_id}: {type(e).__name__}: {e}")
+
+    async def stop(self) -> None:
+        """Cancel updates still running (called from the lifespan on exit)"""
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,116 +1,345 @@
-from fastapi import FastAPI, Request, UploadFile, File
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-import uvicorn
 import os
+import asyncio
+import functools
+import hashlib
+import io
+import json
+import logging
+import time
+import uuid
+import weakref
 from pathlib import Path
 from dotenv import load_dotenv
-from murf import Murf
-import assemblyai as aai
-from google import genai
 from pymongo import MongoClient
-from pymongo.server_api import ServerApi
-from typing import List
+from typing import List, Literal, Optional, Tuple
 from datetime import datetime
+from contextlib import asynccontextmanager, nullcontext
+from executor import UpstreamExecutor, env_int
+from clients import ClientRegistry
+from database import connection_options, warm_up, with_retries
+from chat_store import build_chat_store
+from persistence import ChatWriteBehind
+from tts_cache import DEFAULT_TTL_SECONDS, MongoTTSCacheBackend, TTSCache, cache_key
+from audio_store import AUDIO_ID, AudioFileResponse, AudioStore
+from text_processing import SentenceSplitter, trim_text_for_tts
+from tts_batch import TTSBatchRunner
+from static_assets import REVALIDATE, Asset, StaticAssets
+from speech_stream import AssemblyAIStreamingTranscription, BufferedTranscription, StreamingTranscription
+from uploads import (AUDIO_UPLOAD_OPENAPI, MAX_AUDIO_BYTES, AudioUpload, UploadError, audio_too_large,
+                     receive_audio_upload)
+from audio_preprocessing import PreprocessConfig, preprocess_audio
+from llm_context import ContextBuilder, LLMContext, RollingSummarizer
+from llm_cache import LLMResponseCache
+from resilience import Deadline, Resilience, call_time_left, deadline_scope
+from health import HealthMonitor
+from admission import AdmissionController, AdmissionRejected
+from scheduler import BULK, INTERACTIVE, prioritized, priority_scope
+from metrics import (FALLBACKS, LLM_PROMPT_TOKENS, REQUEST_SECONDS, STAGE_SECONDS, STT_AUDIO_SECONDS, TTS_TRIMS,
+                     metrics, span, timed)
 
 # Load environment variables
 load_dotenv()
 
-# Configure AssemblyAI
-aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY", "e6136224990d49f494f6bcf658569b7c")
+# Leveled logging: LOG_LEVEL=WARNING silences the per-request lines, DEBUG adds transcripts and responses
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)-7s %(name)s: %(message)s",
+)
+logger = logging.getLogger("voiceforge")
 
-# Configure MongoDB with detailed debugging
+# AssemblyAI key (the SDK itself is imported on first use, see clients.py)
+os.environ.setdefault("ASSEMBLYAI_API_KEY", "e6136224990d49f494f6bcf658569b7c")
+
+# MongoDB: the client is created by the lifespan, in the background (see connect_mongodb)
 mongodb_url = os.getenv("MONGODB_URL")
 if not mongodb_url:
     raise ValueError("MONGODB_URL environment variable not set")
+CHAT_STORAGE_LAYOUT = os.getenv("CHAT_STORAGE_LAYOUT", "embedded")
+CHAT_BUCKET_SIZE = env_int("CHAT_BUCKET_SIZE", 100)
 
-print("🔍 MongoDB Debug Information:")
-print(f"📍 MongoDB URL: {mongodb_url[:50]}...{mongodb_url[-10:] if len(mongodb_url) > 60 else mongodb_url}")
-print(f"🔗 URL Type: {'SRV' if '+srv' in mongodb_url else 'Standard'}")
-print(f"📊 URL Length: {len(mongodb_url)} characters")
-
-try:
-    print("🔄 Creating MongoDB client (lazy connection)...")
-    # Create client with lazy connection - don't test immediately to avoid DNS issues during reload
-    client = MongoClient(
-        mongodb_url,
-        server_api=ServerApi('1'),
-        serverSelectionTimeoutMS=30000,  # 30 seconds for DNS resolution
-        connectTimeoutMS=20000,          # 20 seconds for connection
-        socketTimeoutMS=20000,           # 20 seconds for socket operations  
-        maxPoolSize=1,                   # Single connection for startup
-        retryWrites=True,
-        # Additional settings for DNS stability
-        maxIdleTimeMS=45000,
-        waitQueueTimeoutMS=10000,
-        # Lazy connection - don't connect immediately
-        connect=False,  # This prevents immediate DNS resolution
-    )
-    
-    print("✅ MongoClient created successfully (lazy connection)")
-    
-    # Set up database and collection references (no actual connection yet)
-    db = client.voiceforge_chat_history
+client: Optional[MongoClient] = None
+db = None
+chat_collection = None
+chat_store = None
+
+def connect_mongodb() -> None:
+    """
+    Create the MongoDB client and the collection handles the chat helpers use
+
+    Blocking: for a mongodb+srv:// URL pymongo resolves the SRV/TXT records here,
+    which is why this no longer runs at import. The connection itself is lazy;
+    pool size, wait queue and timeouts come from the production profile in database.py.
+    """
+    global client, db, chat_collection, chat_store
+    logger.info(f"🔄 Creating MongoDB client ({'SRV' if '+srv' in mongodb_url else 'standard'} URL, lazy connection)...")
+    logger.debug(f"📍 MongoDB URL: {mongodb_url[:50]}...{mongodb_url[-10:] if len(mongodb_url) > 60 else mongodb_url}")
+    mongo_options = connection_options()
+    mongo_client = MongoClient(mongodb_url, **mongo_options)
+    db = mongo_client.voiceforge_chat_history
     chat_collection = db.chat_sessions
-    
-    # Only test connection if we're not in a reload scenario
-    import __main__
-    if hasattr(__main__, '__file__') and not hasattr(__main__, '_called_from_test'):
+    # Embedded (one document per session) or bucketed history layout (see chat_store.py)
+    chat_store = build_chat_store(db, layout=CHAT_STORAGE_LAYOUT, bucket_size=CHAT_BUCKET_SIZE)
+    client = mongo_client
+    logger.info(f"✅ MongoClient created (pool {mongo_options['minPoolSize']}-{mongo_options['maxPoolSize']})")
+
+# Bounded per-upstream thread pools for the blocking SDK calls (see executor.py)
+upstreams = UpstreamExecutor.from_env()
+
+# Timeouts, turn deadline, circuit breakers and TTS hedging around those pools (see resilience.py)
+resilience = Resilience.from_env(upstreams)
+
+# Per-session turn ordering and a bounded number of concurrent agent turns (see admission.py)
+admission = AdmissionController.from_env()
+
+# Cached MongoDB/upstream health behind the probe endpoints, started by the lifespan (see health.py)
+health = HealthMonitor.from_env()
+# Also call each upstream API on every health round (a cheap metadata request each)
+HEALTH_PROBE_UPSTREAMS = os.getenv("HEALTH_PROBE_UPSTREAMS", "off") == "on"
+
+# Long-lived Murf/Gemini/AssemblyAI clients, created by the lifespan (see clients.py)
+upstream_clients: Optional[ClientRegistry] = None
+
+# Write-behind queue for chat turns, started by the lifespan (see persistence.py)
+chat_writer: Optional[ChatWriteBehind] = None
+
+# Locally served synthesized audio, created by the lifespan unless AUDIO_STORE=off (see audio_store.py)
+AUDIO_STORE_ENABLED = os.getenv("AUDIO_STORE", "on") == "on"
+audio_store: Optional[AudioStore] = None
+
+# TTS result cache for Murf's audio links, created by the lifespan only with AUDIO_STORE=off -
+# the audio store takes its place otherwise (see tts_cache.py)
+tts_cache: Optional[TTSCache] = None
+
+# Bulk synthesis behind /api/tts/batch, created by the lifespan (see tts_batch.py)
+tts_batch: Optional[TTSBatchRunner] = None
+
+# Background rolling summaries of older chat history, created by the lifespan (see llm_context.py)
+summarizer: Optional[RollingSummarizer] = None
+
+# Exact + semantic cache of LLM responses to short, context-free turns, off unless LLM_CACHE=on (see llm_cache.py)
+llm_cache: Optional[LLMResponseCache] = LLMResponseCache.from_env() if os.getenv("LLM_CACHE", "off") == "on" else None
+
+# Silence trimming and downsampling of uploads before STT, off unless AUDIO_PREPROCESS=on (see audio_preprocessing.py)
+audio_preprocess: Optional[PreprocessConfig] = (
+    PreprocessConfig.from_env() if os.getenv("AUDIO_PREPROCESS", "off") == "on" else None
+)
+
+# Scrape-time views of the pools, the write-behind queue, the caches and the summarizer
+metrics.callback(
+    "voiceforge_upstream_in_flight", "Upstream calls running or queued per pool", "gauge",
+    lambda: [({"upstream": service}, stats["in_flight"]) for service, stats in upstreams.stats().items()],
+)
+metrics.callback(
+    "voiceforge_upstream_limit", "Concurrency limit per upstream pool", "gauge",
+    lambda: [({"upstream": service}, stats["limit"]) for service, stats in upstreams.stats().items()],
+)
+metrics.callback(
+    "voiceforge_upstream_queued", "Upstream calls waiting for a pool slot per priority class", "gauge",
+    lambda: [({"upstream": service, "priority": priority}, count)
+             for service, stats in upstreams.scheduler.stats().items() for priority, count in stats["queued"].items()],
+)
+metrics.callback(
+    "voiceforge_upstream_dispatched_total", "Upstream calls given a pool slot per priority class", "counter",
+    lambda: [({"upstream": service, "priority": priority}, count)
+             for service, stats in upstreams.scheduler.stats().items() for priority, count in stats["dispatched"].items()],
+)
+metrics.callback(
+    "voiceforge_circuit_open", "1 while the upstream's circuit breaker fails calls fast (open or half-open)", "gauge",
+    lambda: [({"upstream": service}, int(state["state"] != "closed"))
+             for service, state in resilience.breaker_states().items()],
+)
+metrics.callback(
+    "voiceforge_health_check_up", "1 if the last background health check of the service passed", "gauge",
+    lambda: [({"service": name}, int(result["status"] == "up")) for name, result in health.snapshot()["services"].items()],
+)
+metrics.callback(
+    "voiceforge_agent_turns_in_flight", "Agent turns admitted and running", "gauge",
+    lambda: [({}, admission.in_flight)],
+)
+metrics.callback(
+    "voiceforge_agent_turn_queue_depth", "Agent turns waiting for a turn slot", "gauge",
+    lambda: [({}, admission.queued)],
+)
+metrics.callback(
+    "voiceforge_agent_turn_admissions_total", "Agent turn admission outcomes", "counter",
+    lambda: [({"event": event}, value) for event, value in admission.counters.items()],
+)
+metrics.callback(
+    "voiceforge_chat_write_pending_sessions", "Sessions with chat turns waiting in the write-behind queue", "gauge",
+    lambda: [({}, chat_writer.pending_sessions())],
+)
+metrics.callback(
+    "voiceforge_chat_writes_total", "Write-behind queue activity", "counter",
+    lambda: [({"event": event}, value) for event, value in chat_writer.stats.items()],
+)
+if AUDIO_STORE_ENABLED:
+    metrics.callback(
+        "voiceforge_audio_store_events_total", "Audio store lookups, writes and evictions", "counter",
+        lambda: [({"event": event}, value) for event, value in audio_store.counters.items()],
+    )
+    metrics.callback(
+        "voiceforge_audio_store_bytes", "Size of the synthesized audio kept on disk", "gauge",
+        lambda: [({}, audio_store.total_bytes)],
+    )
+else:
+    metrics.callback(
+        "voiceforge_tts_cache_events_total", "TTS cache lookups by outcome", "counter",
+        lambda: [({"event": event}, value) for event, value in tts_cache.counters.items()],
+    )
+    metrics.callback(
+        "voiceforge_tts_cache_entries", "Entries in the in-memory TTS cache", "gauge",
+        lambda: [({}, tts_cache.stats()["entries"])],
+    )
+metrics.callback(
+    "voiceforge_tts_batch_chunks_total", "Batch TTS chunks by outcome", "counter",
+    lambda: [({"event": event}, tts_batch.counters[event])
+             for event in ("chunks", "deduplicated", "cached", "synthesized", "failed")],
+)
+metrics.callback(
+    "voiceforge_tts_batch_jobs_running", "Batch TTS jobs still synthesizing", "gauge",
+    lambda: [({}, tts_batch.stats()["jobs_running"])],
+)
+metrics.callback(
+    "voiceforge_llm_cache_events_total", "LLM response cache lookups by outcome", "counter",
+    lambda: [({"event": event}, value) for event, value in llm_cache.counters.items()],
+)
+metrics.callback(
+    "voiceforge_llm_cache_saved_seconds_total", "LLM time saved by cache hits (latency of the cached calls)", "counter",
+    lambda: [({}, llm_cache.saved_seconds)],
+)
+metrics.callback(
+    "voiceforge_summary_updates_total", "Rolling chat summary updates by outcome", "counter",
+    lambda: [({"event": event}, value) for event, value in summarizer.stats.items()],
+)
+
+def build_tts_cache() -> TTSCache:
+    """
+    In-memory LRU; with TTS_CACHE_BACKEND=mongodb the shared tts_cache collection is
+    attached once MongoDB is connected (see _prepare_mongodb)
+    """
+    return TTSCache(
+        max_entries=env_int("TTS_CACHE_MAX_ENTRIES", 1024),
+        ttl_seconds=env_int("TTS_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS),
+        run_blocking=lambda fn, *args: resilience.call("mongodb", fn, *args),
+    )
+
+@timed(STAGE_SECONDS, stage="save")
+def _write_chat_batch(pending, retried) -> None:
+    """
+    Blocking batched write of queued chat turns, run on the "mongodb" upstream pool
+
+    Not wrapped in with_retries: pymongo's retryable writes already retry it
+    safely, and a failed batch goes back to the write-behind queue (see persistence.py)
+    """
+    chat_store.append_many(pending, retried)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application lifespan: create the pooled upstream clients, caches and chat writer, connect to
+    MongoDB and warm up in the background; flush and release everything on shutdown
+    """
+    global upstream_clients, chat_writer, tts_cache, audio_store, tts_batch, summarizer, index_page
+    if upstream_clients is None:
+        upstream_clients = ClientRegistry.from_env()
+    if AUDIO_STORE_ENABLED:
+        if audio_store is None:
+            audio_store = AudioStore.from_env(UPLOAD_DIR / "audio")
+            await upstreams.run("audio", audio_store.load)
+    elif tts_cache is None:
+        tts_cache = build_tts_cache()
+    await upstreams.run("audio", static_assets.build)
+    index_page = static_assets.render_page(templates, "index.html")
+    tts_batch = TTSBatchRunner.from_env(
+        lambda text, voice_id, slot: synthesize_speech(text, voice_id, hedge=False, upstream_slot=slot)
+    )
+    chat_writer = ChatWriteBehind(
+        lambda pending, retried: upstreams.run("mongodb", _write_chat_batch, pending, retried),
+        flush_interval=env_int("CHAT_WRITE_FLUSH_MS", 50) / 1000,
+        max_batch=env_int("CHAT_WRITE_MAX_BATCH", 100),
+        max_attempts=env_int("CHAT_WRITE_MAX_ATTEMPTS", 5),
+        retry_delay=env_int("CHAT_WRITE_RETRY_MS", 500) / 1000,
+        dead_letter_path=os.getenv("CHAT_DEAD_LETTER_PATH") or str(UPLOAD_DIR / "chat_dead_letters.jsonl"),
+    )
+    chat_writer.start()
+    summarizer = RollingSummarizer(
+        load_summary_window, save_summary, summarize_conversation,
+        window=HISTORY_CONTEXT_MESSAGES,
+        keep=env_int("LLM_SUMMARY_KEEP_MESSAGES", 4),
+        summary_tokens=context_builder.summary_tokens,
+        max_message_tokens=context_builder.max_message_tokens,
+    )
+    logger.info(f"⚙️ Upstream concurrency limits: {upstreams.limits}, HTTP pool size: {upstream_clients.pool_size}")
+    # Connect to MongoDB and build the SDK clients in the background - the server accepts
+    # requests right away and /api/health/ready answers 503 until both are done
+    startup_tasks = [
+        asyncio.create_task(health.warm_up("mongodb", _prepare_mongodb())),
+        asyncio.create_task(health.warm_up("upstream_clients", _warm_up_upstream_clients())),
+    ]
+    health.start()
+    yield
+    for task in startup_tasks:
+        task.cancel()
+    await health.stop()
+    await tts_batch.stop()
+    await summarizer.stop()
+    await chat_writer.stop()
+    upstream_clients.close()
+    upstreams.shutdown(wait=False)
+
+async def _prepare_mongodb():
+    """Create the client (retrying while DNS or the cluster is unreachable), open the first connection, ensure indexes"""
+    delay = 1.0
+    while client is None:
         try:
-            print("🧪 Testing database connection...")
-            client.admin.command('ping')
-            print("✅ MongoDB ping successful!")
-            
-            # Test collection access
-            print("🧪 Testing collection access...")
-            collection_count = chat_collection.count_documents({})
-            print(f"✅ Collection accessible, current document count: {collection_count}")
-            
-            print("🎉 MongoDB setup completed successfully!")
-        except Exception as conn_test_error:
-            print(f"⚠️ Initial connection test failed (will retry on first use): {conn_test_error}")
-    else:
-        print("🔄 Skipping connection test during reload - will connect on first use")
-    
-except Exception as e:
-    print("❌ MongoDB Connection Failed!")
-    print(f"🔍 Error Type: {type(e).__name__}")
-    print(f"🔍 Error Message: {str(e)}")
-    
-    # Additional debug info for different error types
-    if "DNS" in str(e) or "resolution" in str(e):
-        print("\n🌐 DNS Resolution Debug:")
-        print("- This appears to be a DNS resolution issue")
-        print("- Check if you're using mongodb+srv:// format")
-        print("- Verify your internet connection")
-        print("- Try using a direct connection string instead of SRV")
-        
-    elif "timeout" in str(e).lower():
-        print("\n⏱️ Timeout Debug:")
-        print("- Connection is timing out")
-        print("- Check if MongoDB Atlas IP whitelist includes your current IP")
-        print("- Verify firewall settings")
-        
-    elif "authentication" in str(e).lower():
-        print("\n🔐 Authentication Debug:")
-        print("- Check username and password in connection string")
-        print("- Verify database user permissions")
-        
-    print(f"\n🔍 Full MongoDB URL for debugging: {mongodb_url}")
-    print("💡 Possible solutions:")
-    print("1. Check your internet connection")
-    print("2. Verify MongoDB Atlas cluster is running")
-    print("3. Check IP whitelist in MongoDB Atlas")
-    print("4. Try a different network connection")
-    print("5. Use a direct connection string instead of SRV")
-    
-    # Don't fallback - raise the error to stop startup
-    raise RuntimeError(f"MongoDB connection required but failed: {str(e)}") from e
+            await upstreams.run("mongodb", connect_mongodb)
+        except Exception as e:
+            logger.error(f"❌ MongoDB client creation failed, retrying in {delay:.0f}s: {type(e).__name__}: {e}")
+            logger.warning("💡 Check MONGODB_URL, the network/DNS (SRV lookups) and the Atlas IP access list")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+    if os.getenv("TTS_CACHE_BACKEND", "memory") == "mongodb" and tts_cache is not None and tts_cache.backend is None:
+        tts_cache.backend = MongoTTSCacheBackend(db.tts_cache)
+    try:
+        await upstreams.run("mongodb", warm_up, client)
+        logger.info("✅ MongoDB connection pool warmed up")
+        await upstreams.run("mongodb", chat_store.ensure_indexes)
+        if tts_cache is not None and tts_cache.backend is not None:
+            await upstreams.run("mongodb", tts_cache.backend.ensure_indexes)
+        logger.info(f"✅ MongoDB indexes ensured ({chat_store.layout} chat storage)")
+    except Exception as e:
+        logger.warning(f"⚠️ MongoDB startup preparation failed (will connect on first use): {type(e).__name__}: {e}")
+
+async def _warm_up_upstream_clients():
+    """Import the SDKs and build the shared clients on the upstream pools, before the first turn needs them"""
+    # One at a time: imports hold the GIL, and in parallel they would only contend for it
+    for service, accessor in (("stt", upstream_clients.transcriber), ("llm", upstream_clients.gemini),
+                              ("tts", upstream_clients.murf)):
+        try:
+            await upstreams.run(service, accessor)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not prepare the {service} client: {type(e).__name__}: {e}")
+    logger.info("✅ Upstream SDK clients ready")
 
 # Create FastAPI app instance
-app = FastAPI(title="VoiceForge - Text-to-Speech Platform", version="1.0.0")
+app = FastAPI(title="VoiceForge - Text-to-Speech Platform", version="1.0.0", lifespan=lifespan)
+
+def _turn_rejected_body(e: AdmissionRejected) -> dict:
+    if e.status_code == 429:
+        message = "I'm still answering your previous message. Please wait a moment and try again."
+    else:
+        message = "I'm handling a lot of conversations right now. Please try again in a moment."
+    return {"success": False, "error": "session_busy" if e.status_code == 429 else "overloaded",
+            "message": message, "retry_after": e.retry_after, "fallback_audio": None}
+
+@app.exception_handler(AdmissionRejected)
+async def turn_rejected(request: Request, e: AdmissionRejected):
+    """429/503 with Retry-After for agent turns that were not admitted (see admission.py)"""
+    return JSONResponse(_turn_rejected_body(e), status_code=e.status_code, headers={"Retry-After": str(e.retry_after)})
 
 # Create uploads directory if it doesn't exist
 UPLOAD_DIR = Path("uploads")
@@ -120,6 +349,19 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 class TTSRequest(BaseModel):
     text: str
     voice_id: str = "en-US-terrell"
+    priority: Optional[Literal["manual", "bulk"]] = None  # Murf scheduling class (default: manual)
+
+class TTSBatchItem(BaseModel):
+    text: str
+    voice_id: Optional[str] = None  # default: the batch's voice_id
+    id: Optional[str] = None  # echoed back, e.g. a prompt or chapter name
+
+class TTSBatchRequest(BaseModel):
+    items: List[TTSBatchItem] = []
+    text: Optional[str] = None  # one long document, instead of or before items
+    voice_id: str = "en-US-terrell"
+    wait: bool = True  # False: answer with a job ID right away and poll /api/tts/batch/{job_id}
+    priority: Literal["manual", "bulk"] = "bulk"  # Murf scheduling class
 
 # Pydantic model for LLM API
 class LLMRequest(BaseModel):
@@ -137,177 +379,297 @@ class ChatSession(BaseModel):
     created_at: datetime = None
     updated_at: datetime = None
 
-# Mount static files directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Static files, precompressed and fingerprinted at startup (see static_assets.py)
+static_assets = StaticAssets(Path("static"))
+app.mount("/static", static_assets, name="static")
 
-# Set up templates directory
+# Set up templates directory; templates link static files as {{ asset('script.js') }}
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset"] = static_assets.url
+# index.html rendered once at startup (it has no per-request data)
+index_page: Optional[Asset] = None
 
-def trim_text_for_tts(text: str, max_chars: int = 3000) -> str:
+# Number of most recent messages fetched from MongoDB per turn; older ones reach the
+# LLM through the session's rolling summary
+HISTORY_CONTEXT_MESSAGES = env_int("HISTORY_CONTEXT_MESSAGES", 10)
+
+# Messages per page of GET /agent/history/{session_id} by default and at most; NDJSON
+# exports read the session in pages of HISTORY_PAGE_MAX
+HISTORY_PAGE_SIZE = env_int("HISTORY_PAGE_SIZE", 50)
+HISTORY_PAGE_MAX = env_int("HISTORY_PAGE_MAX", 500)
+HISTORY_FIELDS = ("role", "content", "timestamp", "message_id")
+
+# Token budget for the history part of the prompt (see llm_context.py)
+context_builder = ContextBuilder.from_env()
+
+# Agent pipeline settings
+LLM_MODEL = "gemini-2.0-flash-exp"
+AGENT_VOICE_ID = "en-US-terrell"
+AGENT_FALLBACK_MESSAGE = "I'm having trouble connecting right now. Please try again in a moment."
+EMPTY_LLM_RESPONSE = "I'm not sure how to respond to that. Could you please try rephrasing your question?"
+
+def get_chat_history_window(session_id: str, limit: int = HISTORY_CONTEXT_MESSAGES) -> Tuple[List[ChatMessage], int, Optional[dict]]:
     """
-    Trim text to fit within Murf TTS character limits while preserving sentence structure
-    
-    - **text**: The text to trim
-    - **max_chars**: Maximum character limit (default: 3000 for Murf)
-    
-    Returns trimmed text that ends at a complete sentence when possible
+    Retrieve the last `limit` messages of a session, its total message count and its rolling summary
+
+    The chat store slices server-side, so only `limit` messages cross the wire
+    and get parsed, however long the session has grown.
+
+    Blocking (pymongo + retry sleeps) - call it through `resilience.call("mongodb", ...)`
+    from async code. Errors are raised, so the mongodb circuit breaker sees them.
     """
-    if len(text) <= max_chars:
-        return text
-    
-    # Find the last complete sentence within the limit
-    # Look for sentence endings: . ! ?
-    sentence_endings = ['.', '!', '?']
-    
-    # Start from the max_chars position and work backwards
-    for i in range(max_chars - 1, max_chars // 2, -1):
-        if text[i] in sentence_endings:
-            # Check if this is actually the end of a sentence (not an abbreviation)
-            # Simple heuristic: if followed by space and capital letter, it's likely a sentence end
-            if i + 1 < len(text) and (i + 1 == len(text) or (text[i + 1] == ' ' and i + 2 < len(text) and text[i + 2].isupper())):
-                trimmed = text[:i + 1].strip()
-                if len(trimmed) > 50:  # Ensure we have a reasonable amount of text
-                    return trimmed
-    
-    # If no good sentence break found, look for paragraph breaks
-    for i in range(max_chars - 1, max_chars // 2, -1):
-        if text[i] == '\n':
-            trimmed = text[:i].strip()
-            if len(trimmed) > 50:
-                return trimmed
-    
-    # If no good break found, just cut at word boundary
-    # Find the last space before the limit
-    for i in range(max_chars - 1, max_chars // 2, -1):
-        if text[i] == ' ':
-            trimmed = text[:i].strip()
-            if len(trimmed) > 50:
-                return trimmed + "..."
-    
-    # Last resort: hard cut with ellipsis
-    return text[:max_chars - 3].strip() + "..."
+    chats, message_count, summary = with_retries(
+        lambda: chat_store.recent_with_summary(session_id, limit),
+        "retrieving chat history",
+    )
+    return [ChatMessage(**chat) for chat in chats], message_count, summary
 
-def get_chat_history(session_id: str) -> List[ChatMessage]:
+def get_chat_history(session_id: str, limit: int = HISTORY_CONTEXT_MESSAGES) -> List[ChatMessage]:
     """
-    Retrieve chat history for a given session ID with connection retry
+    Retrieve the last `limit` messages of a session (see get_chat_history_window), or [] on failure
     """
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            # Ensure connection is active
-            if attempt == 0:
-                client.admin.command('ping')  # Test connection
-            
-            session_doc = chat_collection.find_one({"session_id": session_id})
-            if session_doc:
-                return [ChatMessage(**chat) for chat in session_doc.get("chats", [])]
-            return []
-        except Exception as e:
-            print(f"Attempt {attempt + 1}/{max_retries} - Error retrieving chat history: {e}")
-            if attempt == max_retries - 1:
-                print(f"❌ Failed to retrieve chat history after {max_retries} attempts")
-                return []
-            # Wait before retry
-            import time
-            time.sleep(1)
-    return []
+    try:
+        return get_chat_history_window(session_id, limit)[0]
+    except Exception as e:
+        logger.error(f"❌ Failed to retrieve chat history: {type(e).__name__}: {e}")
+        return []
 
+@timed(STAGE_SECONDS, stage="save")
 def save_chat_message(session_id: str, role: str, content: str) -> bool:
     """
-    Save a chat message to the database with connection retry
+    Save a chat message to the database
+
+    Retried only by pymongo's retryable writes - an append is not idempotent, so
+    with_retries must not send it again. Blocking - call it through
+    `upstreams.run("mongodb", ...)` from async code
     """
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            # Ensure connection is active
-            if attempt == 0:
-                client.admin.command('ping')  # Test connection
-                
-            message = {
-                "role": role,
-                "content": content,
-                "timestamp": datetime.utcnow()
-            }
-            
-            # Try to update existing session, or create new one
-            chat_collection.update_one(
-                {"session_id": session_id},
-                {
-                    "$push": {"chats": message},
-                    "$set": {"updated_at": datetime.utcnow()},
-                    "$setOnInsert": {"created_at": datetime.utcnow()}
-                },
-                upsert=True
-            )
-            return True
-        except Exception as e:
-            print(f"Attempt {attempt + 1}/{max_retries} - Error saving chat message: {e}")
-            if attempt == max_retries - 1:
-                print(f"❌ Failed to save chat message after {max_retries} attempts")
-                return False
-            # Wait before retry
-            import time
-            time.sleep(1)
-    return False
+    message = {
+        "role": role,
+        "content": content,
+        "timestamp": datetime.utcnow(),
+        "message_id": uuid.uuid4().hex,
+    }
+    
+    try:
+        chat_store.append_many({session_id: [message]})
+        return True
+    except Exception as e:
+        logger.error(f"❌ Failed to save chat message: {type(e).__name__}: {e}")
+        return False
+
+async def load_summary_window(session_id: str, limit: int):
+    """Messages, count and summary for a summary update, after this session's queued writes are flushed"""
+    await chat_writer.wait_for_session(session_id)
+    return await upstreams.run(
+        "mongodb", with_retries, lambda: chat_store.recent_with_summary(session_id, limit), "loading messages to summarize"
+    )
+
+async def save_summary(session_id: str, text: str, covers: int) -> None:
+    await upstreams.run(
+        "mongodb", with_retries, lambda: chat_store.set_summary(session_id, text, covers), "saving rolling summary"
+    )
+
+async def summarize_conversation(prompt: str) -> str:
+    """Fold older messages into a session's rolling summary (one Gemini call on the "llm" pool)"""
+    gemini_client = upstream_clients.gemini()
+    with span(STAGE_SECONDS, stage="summary"):
+        response = await resilience.call("llm", gemini_client.models.generate_content, model=LLM_MODEL, contents=prompt)
+    return getattr(response, "text", None) or ""
+
+def build_llm_context(chat_history: List[ChatMessage], user_message: str, summary: Optional[dict]) -> LLMContext:
+    """Token-budgeted Gemini contents for a turn: rolling summary + recent messages + the user message"""
+    llm_context = context_builder.build(chat_history, user_message, summary)
+    LLM_PROMPT_TOKENS.observe(llm_context.tokens)
+    logger.debug(f"🤖 LLM context: ~{llm_context.tokens} tokens, {llm_context.history_messages} history messages"
+                 f"{', with summary' if llm_context.system_instruction else ''}")
+    return llm_context
 
-def format_chat_history_for_llm(chat_history: List[ChatMessage]) -> str:
+@timed(STAGE_SECONDS, stage="tts")
+async def synthesize_speech(text: str, voice_id: str, hedge: bool = True,
+                            upstream_slot=None) -> Tuple[Optional[str], bool]:
     """
-    Format chat history for LLM context
+    Murf TTS through the shared client, stored and served locally (or through the TTS cache if AUDIO_STORE=off)
+
+    - **hedge**: Hedge a slow Murf call (interactive turns); batch synthesis doesn't
+    - **upstream_slot**: Async context manager factory held around the Murf call only,
+      so stored/cached audio isn't throttled (the batch runner's concurrency limit)
+
+    Returns (audio URL or None if Murf returned no audio, whether it was already stored/cached).
+    Upstream exceptions propagate to the caller.
     """
-    if not chat_history:
-        return ""
+    # Shared Murf client (rebuilt only if the key rotates)
+    murf_client = upstream_clients.murf()
+
+    if audio_store is not None:
+        audio_id = cache_key(text, voice_id)
+
+        async def murf_store() -> bool:
+            # Base64 in the response instead of a 72-hour link; idempotent, so a slow call may be hedged
+            async with upstream_slot() if upstream_slot else nullcontext():
+                res = await resilience.call(
+                    "tts",
+                    murf_client.text_to_speech.generate,
+                    text=text,
+                    voice_id=voice_id,
+                    encode_as_base_64=True,
+                    format="MP3",
+                    hedge=hedge,
+                )
+            if not res or not getattr(res, 'encoded_audio', None):
+                logger.error("❌ TTS Error: Invalid response from Murf API")
+                return False
+            await upstreams.run("audio", audio_store.put_base64, audio_id, res.encoded_audio)
+            return True
+
+        # Identical text + voice is served from disk (see audio_store.py)
+        return await audio_store.get_or_create(audio_id, murf_store)
+
+    generated = False
     
-    formatted_history = "Previous conversation:\n"
-    for message in chat_history[-10:]:  # Keep last 10 messages for context
-        role = "Human" if message.role == "user" else "Assistant"
-        formatted_history += f"{role}: {message.content}\n"
+    async def murf_generate() -> Optional[str]:
+        nonlocal generated
+        generated = True
+        
+        # Generate speech using Murf SDK (idempotent, so a slow call may be hedged)
+        async with upstream_slot() if upstream_slot else nullcontext():
+            res = await resilience.call(
+                "tts",
+                murf_client.text_to_speech.generate,
+                text=text,
+                voice_id=voice_id,
+                hedge=hedge,
+            )
+        
+        # Validate response
+        if not res or not hasattr(res, 'audio_file') or not res.audio_file:
+            logger.error("❌ TTS Error: Invalid response from Murf API")
+            return None
+        return res.audio_file
     
-    formatted_history += "\nCurrent message:\n"
-    return formatted_history
+    # Identical text + voice is served from the TTS cache (see tts_cache.py)
+    audio_file = await tts_cache.get_or_generate(text, voice_id, murf_generate)
+    return audio_file, bool(audio_file) and not generated
+
+@timed(STAGE_SECONDS, stage="history")
+async def retrieve_chat_context(session_id: str) -> Tuple[List[ChatMessage], int, Optional[dict]]:
+    """
+    Recent history, total message count and rolling summary for a turn, or ([], 0, None) if the database is unavailable
+    """
+    logger.info(f"📚 Retrieving chat history for session: {session_id}")
+    try:
+        # Read-your-writes: the previous turn of this session may still be queued
+        await chat_writer.wait_for_session(session_id)
+        chat_history, history_length, summary = await resilience.call("mongodb", get_chat_history_window, session_id)
+        summarized = f", summary of first {summary.get('covers', 0)}" if summary else ""
+        logger.info(f"📚 Found {history_length} previous messages (using last {len(chat_history)}{summarized})")
+        return chat_history, history_length, summary
+    except Exception as db_error:
+        logger.warning(f"⚠️ Database error retrieving chat history: {db_error}")
+        FALLBACKS.inc(reason="history_unavailable")
+        return [], 0, None  # Continue without history
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
-    """Serve the main index page"""
-    return templates.TemplateResponse("index.html", {"request": request})
+    """Serve the main index page (prerendered, compressed per Accept-Encoding, revalidated by ETag)"""
+    if index_page is None:
+        return templates.TemplateResponse("index.html", {"request": request})
+    return index_page.response(request.scope, REVALIDATE)
+
+def _mongodb_health() -> dict:
+    """Blocking ping plus a metadata-based document count (no collection scan)"""
+    if client is None:
+        raise RuntimeError("client not created yet")
+    client.admin.command('ping')
+    return {
+        "database": "voiceforge_chat_history",
+        "collection": "chat_sessions",
+        "document_count": chat_collection.estimated_document_count(),
+    }
+
+def _probe_assemblyai(transcriber) -> None:
+    import assemblyai as aai
+    transcriber.list_transcripts(aai.ListTranscriptParameters(limit=1))
+
+# Upstream API -> (pool / circuit breaker, shared client accessor, cheap metadata request)
+UPSTREAM_HEALTH = {
+    "assemblyai": ("stt", lambda: upstream_clients.transcriber(), _probe_assemblyai),
+    "gemini": ("llm", lambda: upstream_clients.gemini(),
+               lambda gemini: gemini.models.get(model=LLM_MODEL)),
+    "murf": ("tts", lambda: upstream_clients.murf(),
+             lambda murf: murf.text_to_speech.get_voices()),
+}
+
+async def _upstream_health(name: str) -> dict:
+    """
+    Down if the API key is missing or the circuit breaker is open
+
+    With HEALTH_PROBE_UPSTREAMS=on the API itself is called too.
+    """
+    pool, get_client, probe = UPSTREAM_HEALTH[name]
+    # Raises if the API key isn't configured; on the pool, as the first call imports the SDK
+    upstream_client = await upstreams.run(pool, get_client)
+    breaker = resilience.breaker_states()[pool]
+    if breaker["state"] == "open":
+        raise RuntimeError(f"circuit breaker open (retry in {breaker['retry_in']:.0f}s)")
+    if HEALTH_PROBE_UPSTREAMS:
+        await upstreams.run(pool, probe, upstream_client)
+    return {"circuit_breaker": breaker["state"], "probed": HEALTH_PROBE_UPSTREAMS}
+
+health.register("mongodb", lambda: upstreams.run("mongodb", _mongodb_health))
+for _upstream in UPSTREAM_HEALTH:
+    health.register(_upstream, functools.partial(_upstream_health, _upstream), critical=False)
 
 @app.get("/api/health")
 async def health_check():
-    """Health check endpoint with MongoDB status"""
-    health_status = {
-        "status": "healthy",
+    """
+    Health of MongoDB and the upstream APIs, from the last background check (no I/O per request)
+
+    Circuit breaker states and agent turn admission (running, queued, rejected) are live.
+    """
+    return {
+        **health.snapshot(),
         "message": "30 Days of Voice Agents - Day 10: Chat History Ready!",
-        "services": {}
+        "circuit_breakers": resilience.breaker_states(),
+        "agent_turns": admission.stats(),
     }
-    
-    # Check MongoDB connection
-    try:
-        client.admin.command('ping')
-        collection_count = chat_collection.count_documents({})
-        health_status["services"]["mongodb"] = {
-            "status": "connected",
-            "database": "voiceforge_chat_history",
-            "collection": "chat_sessions",
-            "document_count": collection_count
-        }
-    except Exception as e:
-        health_status["status"] = "degraded"
-        health_status["services"]["mongodb"] = {
-            "status": "disconnected",
-            "error": str(e)
-        }
-    
-    return health_status
+
+@app.get("/api/health/live")
+async def liveness():
+    """Liveness probe: the process is serving requests"""
+    return {"status": "alive", "uptime_seconds": round(health.uptime(), 1)}
+
+@app.get("/api/health/ready")
+async def readiness():
+    """
+    Readiness probe: 200 once MongoDB passed its last background check, 503 otherwise
+
+    Upstream API problems don't fail readiness - every replica shares them, and turns
+    degrade to fallbacks instead.
+    """
+    ready, reason = health.readiness()
+    age = health.age()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "reason": reason,
+                 "checked_seconds_ago": None if age is None else round(age, 1)},
+    )
 
 @app.post("/api/tts")
+@timed(REQUEST_SECONDS, endpoint="tts")
 async def generate_speech(request: TTSRequest):
     """
     Generate speech from text using Murf's TTS API
     
     - **text**: The text to convert to speech
     - **voice_id**: Voice ID to use (default: en-US-terrell)
+    - **priority**: "manual" (default) or "bulk" - voice agent turns go first either way
     
     Returns the audio file URL from Murf's API
     """
+    return await _generate_speech(request)
+
+async def _generate_speech(request: TTSRequest):
+    """/api/tts without the request metric - what agent_chat calls for its reply"""
     try:
         # Validate input
         if not request.text or len(request.text.strip()) == 0:
@@ -329,7 +691,7 @@ async def generate_speech(request: TTSRequest):
         # Get API key from environment
         api_key = os.getenv("MURF_API_KEY")
         if not api_key:
-            print("❌ TTS Error: MURF_API_KEY not found in environment")
+            logger.error("❌ TTS Error: MURF_API_KEY not found in environment")
             return {
                 "success": False,
                 "error": "configuration_error",
@@ -337,18 +699,10 @@ async def generate_speech(request: TTSRequest):
                 "fallback_audio": None
             }
         
-        # Initialize Murf client
-        murf_client = Murf(api_key=api_key)
-        
-        # Generate speech using Murf SDK
-        res = murf_client.text_to_speech.generate(
-            text=request.text,
-            voice_id=request.voice_id,
-        )
+        with priority_scope(request.priority) if request.priority else nullcontext():
+            audio_file, cached = await synthesize_speech(request.text, request.voice_id)
         
-        # Validate response
-        if not res or not hasattr(res, 'audio_file') or not res.audio_file:
-            print("❌ TTS Error: Invalid response from Murf API")
+        if not audio_file:
             return {
                 "success": False,
                 "error": "api_error",
@@ -359,13 +713,15 @@ async def generate_speech(request: TTSRequest):
         # Return the audio file URL
         return {
             "success": True,
-            "audio_file": res.audio_file,
-            "message": "Audio file generated successfully. The link will be available for 72 hours."
+            "audio_file": audio_file,
+            "cached": cached,
+            "message": "Audio file served from cache. The link is still valid." if cached
+                       else "Audio file generated successfully." + ("" if audio_store is not None else " The link will be available for 72 hours.")
         }
         
     except Exception as e:
         # Log the error
-        print(f"❌ TTS Error: {type(e).__name__}: {str(e)}")
+        logger.error(f"❌ TTS Error: {type(e).__name__}: {str(e)}")
         
         # Return user-friendly error response
         return {
@@ -375,38 +731,169 @@ async def generate_speech(request: TTSRequest):
             "fallback_audio": None
         }
 
-@app.post("/transcribe/file")
-async def transcribe_file(audio_file: UploadFile = File(...)):
+@app.post("/api/tts/batch")
+@timed(REQUEST_SECONDS, endpoint="tts_batch")
+async def generate_speech_batch(request: TTSBatchRequest):
+    """
+    Generate speech for many texts, or one long document, in a single request
+
+    - **items**: Texts to synthesize, each with an optional voice_id and id
+    - **text**: A long document (chapter, script) to synthesize as the first item
+    - **voice_id**: Voice for the document and for items without their own
+    - **wait**: Answer with the results (default), or with a job ID to poll
+    - **priority**: "bulk" (default) or "manual" - scheduling class of the Murf calls
+
+    Each text is split at sentence boundaries into chunks of up to TTS_BATCH_CHUNK_CHARS
+    characters; per item, the audio segments come back in order. Identical chunks are
+    synthesized once, and Murf calls are rate-limited (see tts_batch.py).
+    """
+    items = ([(None, request.text, request.voice_id)] if request.text else []) + [
+        (item.id, item.text, item.voice_id or request.voice_id) for item in request.items
+    ]
+    error = None
+    if not items or any(not text.strip() for _, text, _ in items):
+        error = "Provide text or items, and no empty texts"
+    elif len(items) > tts_batch.max_items:
+        error = f"Too many items. Please limit to {tts_batch.max_items} per batch."
+    elif sum(len(text) for _, text, _ in items) > tts_batch.max_chars:
+        error = f"Batch is too long. Please limit to {tts_batch.max_chars} characters."
+    if error:
+        return {"success": False, "error": "validation_error", "message": error, "fallback_audio": None}
+
+    if not os.getenv("MURF_API_KEY"):
+        logger.error("❌ TTS Error: MURF_API_KEY not found in environment")
+        return {
+            "success": False,
+            "error": "configuration_error",
+            "message": "I'm having trouble with the voice service configuration right now.",
+            "fallback_audio": None
+        }
+
+    job = tts_batch.plan(items)
+    if not request.wait:
+        # The job's task inherits the priority
+        with priority_scope(request.priority):
+            submitted = tts_batch.submit(job)
+        if not submitted:
+            return JSONResponse({
+                "success": False,
+                "error": "too_many_jobs",
+                "message": "Too many batch jobs are kept right now. Please try again later.",
+                "fallback_audio": None
+            }, status_code=503, headers={"Retry-After": "60"})
+        return {"success": True, **job.to_dict(), "status_url": f"/api/tts/batch/{job.job_id}"}
+
+    with priority_scope(request.priority):
+        await tts_batch.run(job)
+    result = job.to_dict()
+    return {"success": all(item["success"] for item in result["items"]), **result}
+
+@app.get("/api/tts/batch/{job_id}")
+async def tts_batch_status(job_id: str):
+    """Status and progress of a batch started with wait=false; the ordered results once done"""
+    job = tts_batch.get(job_id)
+    if job is None:
+        return JSONResponse({
+            "success": False,
+            "error": "not_found",
+            "message": "Unknown or expired batch job"
+        }, status_code=404)
+    result = job.to_dict()
+    return {"success": job.status == "done" and all(item["success"] for item in result["items"]), **result}
+
+if not AUDIO_STORE_ENABLED:
+    @app.get("/api/tts/cache")
+    async def tts_cache_stats():
+        """TTS cache hit/miss counters and size (AUDIO_STORE=off; the audio store replaces the cache otherwise)"""
+        return tts_cache.stats()
+
+@app.api_route("/api/audio/{audio_id}.mp3", methods=["GET", "HEAD"], response_class=AudioFileResponse)
+async def serve_audio(audio_id: str, request: Request):
+    """
+    Synthesized speech from the audio store
+
+    Supports single byte ranges (seeking), `If-None-Match` / `If-Range` revalidation,
+    and is cacheable forever - the ID is the hash of the text and voice.
+    """
+    if audio_store is None or not AUDIO_ID.match(audio_id) or not audio_store.touch(audio_id):
+        return PlainTextResponse("Audio not found", status_code=404)
+    try:
+        return AudioFileResponse(
+            audio_store.path(audio_id),
+            range_header=request.headers.get("range"),
+            if_none_match=request.headers.get("if-none-match"),
+            if_range=request.headers.get("if-range"),
+        )
+    except FileNotFoundError:
+        return PlainTextResponse("Audio not found", status_code=404)  # evicted since the lookup
+
+@app.get("/api/llm/cache")
+async def llm_cache_stats():
+    """LLM response cache hit/miss counters, hit rate, size and LLM time saved"""
+    if llm_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **llm_cache.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Pipeline metrics in Prometheus text format
+    
+    Per-stage and per-upstream latency summaries (p50/p95/p99), retry/fallback/trim
+    counters, pool, write-behind queue and TTS cache state
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/transcribe/file", openapi_extra=AUDIO_UPLOAD_OPENAPI)
+async def transcribe_file(request: Request):
     """
     Transcribe an audio file using AssemblyAI
     
-    - **audio_file**: The audio file to transcribe (WebM, WAV, MP3, etc.)
+    - **audio_file**: The audio file to transcribe (WebM, WAV, MP3 or OGG), as a multipart form field
     
     Returns the transcription text
     """
+    return await transcribe_upload(request)
+
+@timed(STAGE_SECONDS, stage="preprocess")
+async def preprocess_upload(upload: AudioUpload):
+    """
+    Decode, trim and downsample an upload on the "audio" pool (see audio_preprocessing.py)
+    
+    Returns None if the upload should be transcribed as it is - it can't be
+    decoded here, or preprocessing failed (which never fails the request).
+    """
+    try:
+        processed = await upstreams.run("audio", preprocess_audio, upload, audio_preprocess)
+    except Exception as e:
+        logger.warning(f"⚠️ Audio preprocessing failed, transcribing the original upload: {type(e).__name__}: {e}")
+        return None
+    if processed is None:
+        return None
+    STT_AUDIO_SECONDS.inc(processed.original_seconds, stage="received")
+    if not processed.has_speech:
+        logger.info(f"🔇 No speech in {processed.original_seconds:.1f}s of audio, skipping transcription")
+    elif processed.improves_on_original:
+        STT_AUDIO_SECONDS.inc(processed.seconds, stage="sent")
+        logger.info(f"✂️ Preprocessed audio: {processed.original_seconds:.1f}s/{processed.original_bytes} bytes -> "
+                    f"{processed.seconds:.1f}s/{len(processed.data)} bytes {processed.format}")
+    else:
+        STT_AUDIO_SECONDS.inc(processed.original_seconds, stage="sent")
+    return processed
+
+@timed(STAGE_SECONDS, stage="stt")
+async def transcribe_upload(request: Request) -> dict:
+    """
+    Receive the `audio_file` upload of a request and transcribe it (shared by the upload endpoints)
+    
+    The upload is streamed and size-checked as it arrives and handed to the
+    transcriber as a spooled file, never as one bytes object (see uploads.py).
+    """
+    upload = None
     try:
-        # Validate file type
-        allowed_types = ["audio/webm", "audio/wav", "audio/mp3", "audio/mpeg", "audio/ogg"]
-        if audio_file.content_type not in allowed_types:
-            return {
-                "success": False,
-                "error": "validation_error",
-                "message": f"Unsupported file type. Please use WebM, WAV, MP3, or OGG format.",
-                "transcription": ""
-            }
-        
-        # Check file size (limit to 25MB)
-        if audio_file.size and audio_file.size > 25 * 1024 * 1024:
-            return {
-                "success": False,
-                "error": "validation_error",
-                "message": "Audio file is too large. Please use files under 25MB.",
-                "transcription": ""
-            }
-        
         # Check if AssemblyAI API key is configured
-        if not aai.settings.api_key:
-            print("❌ STT Error: AssemblyAI API key not configured")
+        if not os.getenv("ASSEMBLYAI_API_KEY"):
+            logger.error("❌ STT Error: AssemblyAI API key not configured")
             return {
                 "success": False,
                 "error": "configuration_error",
@@ -414,32 +901,40 @@ async def transcribe_file(audio_file: UploadFile = File(...)):
                 "transcription": ""
             }
         
-        # Read the file content directly into memory
-        audio_data = await audio_file.read()
-        
-        if not audio_data or len(audio_data) == 0:
+        # Stream the upload to a spooled file, enforcing the size limit and sniffing the format
+        try:
+            upload = await receive_audio_upload(request)
+        except UploadError as upload_error:
             return {
                 "success": False,
-                "error": "validation_error",
-                "message": "The audio file appears to be empty. Please try recording again.",
+                "error": upload_error.error,
+                "message": upload_error.message,
                 "transcription": ""
             }
         
-        # Configure transcription settings
-        config = aai.TranscriptionConfig(
-            speech_model=aai.SpeechModel.best,
-            language_detection=True,
-            punctuate=True,
-            format_text=True
-        )
+        audio = upload.file
+        if audio_preprocess is not None:
+            processed = await preprocess_upload(upload)
+            if processed is not None and not processed.has_speech:
+                # Nothing above the VAD threshold - don't pay for transcribing silence
+                return {
+                    "success": False,
+                    "error": "no_speech",
+                    "message": "I didn't detect any speech in the audio. Please try speaking louder or closer to the microphone.",
+                    "transcription": ""
+                }
+            if processed is not None and processed.improves_on_original:
+                audio = io.BytesIO(processed.data)
+            else:
+                upload.file.seek(0)
         
-        # Create transcriber and transcribe the audio data
-        transcriber = aai.Transcriber(config=config)
-        transcript = transcriber.transcribe(audio_data)
+        # Shared transcriber (configured once in clients.py) - it uploads the file in chunks
+        transcriber = upstream_clients.transcriber()
+        transcript = await resilience.call("stt", transcriber.transcribe, audio)
         
         # Check for transcription errors
         if transcript.status == "error":
-            print(f"❌ STT Error: {transcript.error}")
+            logger.error(f"❌ STT Error: {transcript.error}")
             return {
                 "success": False,
                 "error": "transcription_error",
@@ -468,7 +963,7 @@ async def transcribe_file(audio_file: UploadFile = File(...)):
         
     except Exception as e:
         # Log the error
-        print(f"❌ STT Error: {type(e).__name__}: {str(e)}")
+        logger.error(f"❌ STT Error: {type(e).__name__}: {str(e)}")
         
         # Return user-friendly error response
         return {
@@ -477,29 +972,54 @@ async def transcribe_file(audio_file: UploadFile = File(...)):
             "message": "I'm having trouble connecting to the speech recognition service right now. Please try again.",
             "transcription": ""
         }
+    finally:
+        if upload is not None:
+            upload.close()
 
 
 
 
 
-@app.post("/agent/chat/{session_id}")
-async def agent_chat(session_id: str, audio_file: UploadFile = File(...)):
+@app.post("/agent/chat/{session_id}", openapi_extra=AUDIO_UPLOAD_OPENAPI)
+@timed(REQUEST_SECONDS, endpoint="agent_chat")
+@admission.admitted
+@prioritized(INTERACTIVE)
+@resilience.budgeted
+async def agent_chat(session_id: str, request: Request):
     """
     Chat with AI agent using voice input with persistent chat history
     
     - **session_id**: Unique session identifier for chat history
     - **audio_file**: Audio file containing user's voice message
     
-    Returns AI response with audio output and maintains chat history
+    Returns AI response with audio output and maintains chat history. The whole
+    turn shares one time budget (TURN_BUDGET_SECONDS): an upstream that is out
+    of time degrades it to the fallback message or a text-only reply.
+    
+    Turns of a session run one at a time, and a bounded number run at once; a turn
+    that can't be admitted gets 429 (session busy) or 503 (overloaded) with Retry-After.
+    Its upstream calls go ahead of manual and bulk TTS (see scheduler.py).
+    
+    Stages start as soon as their inputs are ready:
+    
+        transcribe ─┐
+                    ├─> llm ─> tts
+        history ────┘      └─> save (write-behind, off the response path)
+    
+    so the critical path is STT, LLM and TTS only.
     """
-    fallback_message = "I'm having trouble connecting right now. Please try again in a moment."
+    fallback_message = AGENT_FALLBACK_MESSAGE
+    history_task = None
     
     try:
-        print(f"🎤 Starting Agent Chat for session: {session_id}")
+        logger.info(f"🎤 Starting Agent Chat for session: {session_id}")
+        
+        # The history read doesn't depend on the transcript - run it during STT
+        history_task = asyncio.create_task(retrieve_chat_context(session_id))
         
         # Step 1: Transcribe the audio
-        print("🎤 Transcribing audio with AssemblyAI...")
-        transcription_result = await transcribe_file(audio_file)
+        logger.info("🎤 Transcribing audio with AssemblyAI...")
+        transcription_result = await transcribe_upload(request)
         
         # Check if transcription was successful
         if not transcription_result.get("success"):
@@ -512,27 +1032,19 @@ async def agent_chat(session_id: str, audio_file: UploadFile = File(...)):
             }
         
         user_message = transcription_result["transcription"]
-        print(f"✅ Transcription successful: {user_message}")
-        
-        # Step 2: Retrieve chat history (with fallback)
-        print(f"📚 Retrieving chat history for session: {session_id}")
-        try:
-            chat_history = get_chat_history(session_id)
-            print(f"📚 Found {len(chat_history)} previous messages")
-        except Exception as db_error:
-            print(f"⚠️ Database error retrieving chat history: {db_error}")
-            chat_history = []  # Continue without history
+        user_timestamp = datetime.utcnow()
+        logger.debug(f"✅ Transcription successful: {user_message}")
         
-        # Step 3: Format context for LLM
-        context = format_chat_history_for_llm(chat_history)
-        llm_input = context + user_message if context else user_message
+        # Step 2: Chat history, fetched while transcribing (with fallback)
+        chat_history, history_length, summary = await history_task
         
-        print(f"🤖 Sending to LLM with context: {llm_input[:200]}...")
+        # Step 3: Build the token-budgeted LLM context (rolling summary + recent turns)
+        llm_context = build_llm_context(chat_history, user_message, summary)
         
         # Step 4: Get AI response
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
-            print("❌ LLM Error: GEMINI_API_KEY not found in environment")
+            logger.error("❌ LLM Error: GEMINI_API_KEY not found in environment")
             return {
                 "success": False,
                 "error": "configuration_error",
@@ -540,83 +1052,98 @@ async def agent_chat(session_id: str, audio_file: UploadFile = File(...)):
                 "fallback_audio": None
             }
         
+        # Near-identical short turns are answered from the LLM response cache (see llm_cache.py)
+        cache_key = llm_cache.key_for(user_message, chat_history, summary) if llm_cache is not None else None
+        cached_response = llm_cache.get(cache_key) if cache_key is not None else None
+        
         try:
-            gemini_client = genai.Client(api_key=api_key)
-            response = gemini_client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=llm_input
-            )
-            
-            ai_response = response.text if hasattr(response, 'text') else str(response)
-            
-            if not ai_response or len(ai_response.strip()) == 0:
-                ai_response = "I'm not sure how to respond to that. Could you please try rephrasing your question?"
+            if cached_response is not None:
+                logger.info("⚡ LLM response served from cache")
+                ai_response = cached_response
+            else:
+                gemini_client = upstream_clients.gemini()
+                started = time.perf_counter()
+                with span(STAGE_SECONDS, stage="llm"):
+                    response = await resilience.call(
+                        "llm",
+                        gemini_client.models.generate_content,
+                        model=LLM_MODEL,
+                        contents=llm_context.contents,
+                        config=llm_context.config()
+                    )
+                
+                ai_response = response.text if hasattr(response, 'text') else str(response)
+                
+                if not ai_response or len(ai_response.strip()) == 0:
+                    FALLBACKS.inc(reason="llm_empty")
+                    ai_response = EMPTY_LLM_RESPONSE
+                elif cache_key is not None:
+                    llm_cache.put(cache_key, ai_response, time.perf_counter() - started)
             
-            print(f"🤖 LLM Response: {ai_response}")
+            logger.debug(f"🤖 LLM Response: {ai_response}")
             
         except Exception as llm_error:
-            print(f"❌ LLM Error: {type(llm_error).__name__}: {str(llm_error)}")
+            logger.error(f"❌ LLM Error: {type(llm_error).__name__}: {str(llm_error)}")
+            FALLBACKS.inc(reason="llm_error")
             ai_response = fallback_message
         
-        # Step 5: Save user message to chat history (with error handling)
-        try:
-            save_chat_message(session_id, "user", user_message)
-            print(f"💾 Saved user message to session: {session_id}")
-        except Exception as save_error:
-            print(f"⚠️ Error saving user message: {save_error}")
-        
-        # Step 6: Save AI response to chat history (with error handling)
-        try:
-            save_chat_message(session_id, "assistant", ai_response)
-            print(f"💾 Saved AI response to session: {session_id}")
-        except Exception as save_error:
-            print(f"⚠️ Error saving AI response: {save_error}")
+        # Step 5: Queue both messages of this turn for a single write-behind upsert
+        chat_writer.enqueue(session_id, [
+            {"role": "user", "content": user_message, "timestamp": user_timestamp},
+            {"role": "assistant", "content": ai_response, "timestamp": datetime.utcnow()},
+        ])
+        logger.info(f"💾 Queued chat turn for session: {session_id}")
+        with priority_scope(BULK):
+            summarizer.schedule(session_id, history_length + 2, summary)
         
-        # Step 7: Generate audio response
-        print("🎵 Generating speech response using Murf TTS...")
+        # Step 6: Generate audio response
+        logger.info("🎵 Generating speech response using Murf TTS...")
         
         # Trim response text for Murf TTS (3,000 character limit)
         original_length = len(ai_response)
         trimmed_response = trim_text_for_tts(ai_response)
         
         if len(trimmed_response) < original_length:
-            print(f"⚠️ AI response trimmed from {original_length} to {len(trimmed_response)} characters for TTS")
+            TTS_TRIMS.inc()
+            logger.warning(f"⚠️ AI response trimmed from {original_length} to {len(trimmed_response)} characters for TTS")
         
         # Create TTS request object with trimmed text
         tts_request = TTSRequest(
             text=trimmed_response,
-            voice_id="en-US-terrell"
+            voice_id=AGENT_VOICE_ID
         )
         
         # Generate speech with error handling
-        tts_result = await generate_speech(tts_request)
+        tts_result = await _generate_speech(tts_request)
         
         if tts_result.get("success"):
             audio_file_url = tts_result["audio_file"]
-            print(f"✅ Murf TTS successful: {audio_file_url}")
+            logger.debug(f"✅ Murf TTS successful: {audio_file_url}")
         else:
-            print(f"⚠️ TTS failed: {tts_result.get('message', 'Unknown error')}")
+            logger.warning(f"⚠️ TTS failed: {tts_result.get('message', 'Unknown error')}")
+            FALLBACKS.inc(reason="tts_failed")
             audio_file_url = None
         
-        # Step 8: Return comprehensive response
+        # Step 7: Return comprehensive response
         return {
             "success": True,
             "session_id": session_id,
             "user_message": user_message,
             "ai_response": trimmed_response,
             "audio_file": audio_file_url,
-            "chat_history_length": len(chat_history) + 2,  # +2 for current exchange
+            "chat_history_length": history_length + 2,  # +2 for current exchange
             "complete_response": {
-                "model": "gemini-2.0-flash-exp",
+                "model": LLM_MODEL,
                 "text": ai_response,
-                "context_used": bool(context)
+                "context_used": llm_context.uses_history
             },
-            "message": "Agent chat processed successfully" + (" with history" if chat_history else "") + (". The audio link will be available for 72 hours." if audio_file_url else " (audio generation failed).")
+            "message": "Agent chat processed successfully" + (" with history" if chat_history else "") + (("" if audio_store is not None else ". The audio link will be available for 72 hours.") if audio_file_url else " (audio generation failed).")
         }
         
     except Exception as e:
         # Handle any unexpected errors
-        print(f"❌ Agent Chat Error: {type(e).__name__}: {str(e)}")
+        logger.error(f"❌ Agent Chat Error: {type(e).__name__}: {str(e)}")
+        FALLBACKS.inc(reason="agent_error")
         
         return {
             "success": False,
@@ -624,6 +1151,521 @@ async def agent_chat(session_id: str, audio_file: UploadFile = File(...)):
             "message": fallback_message,
             "fallback_audio": None
         }
+    finally:
+        if history_task is not None:
+            history_task.cancel()  # no-op unless the turn ended before using it
+
+@app.post("/agent/chat/{session_id}/stream", openapi_extra=AUDIO_UPLOAD_OPENAPI)
+@prioritized(INTERACTIVE)
+async def agent_chat_stream(session_id: str, request: Request):
+    """
+    Streaming variant of /agent/chat/{session_id} with sentence-level TTS
+    
+    - **session_id**: Unique session identifier for chat history
+    - **audio_file**: Audio file containing user's voice message
+    
+    The Gemini response is streamed and split into sentences as it arrives; each
+    sentence goes to Murf as soon as it is complete, so the first audio is ready
+    after the first sentence instead of after the whole response. Returns
+    newline-delimited JSON events:
+    
+    - `{"type": "transcription", "user_message": ...}`
+    - `{"type": "segment", "index": n, "text": ..., "audio_file": url or null}` per sentence, in order
+    - `{"type": "done", "ai_response": ..., "chat_history_length": n, ...}`
+    
+    If transcription fails, a regular JSON error response (as from /agent/chat) is returned instead.
+    Turns are admitted, budgeted and timed as in /agent/chat, for as long as the stream runs.
+    """
+    started = time.perf_counter()
+    body = None
+    try:
+        turn = await admission.acquire(session_id)
+        logger.info(f"🎤 Starting streaming Agent Chat for session: {session_id}")
+        # One turn deadline for STT and the streamed body, which runs after this returns
+        deadline = resilience.new_deadline()
+        with deadline_scope(deadline):
+            # As in agent_chat, the history read runs during STT
+            history_task = asyncio.create_task(retrieve_chat_context(session_id))
+            try:
+                transcription_result = await transcribe_upload(request)
+            except BaseException:
+                history_task.cancel()
+                turn.release()
+                raise
+        if not transcription_result.get("success"):
+            history_task.cancel()
+            turn.release()
+            return {
+                "success": False,
+                "error": "transcription_error",
+                "message": transcription_result.get("message", "I couldn't understand the audio. Please try again."),
+                "fallback_audio": None
+            }
+        
+        user_message = transcription_result["transcription"]
+        logger.debug(f"✅ Transcription successful: {user_message}")
+        body = _ndjson_stream(
+            stream_agent_turn(session_id, user_message, datetime.utcnow(), history_task, deadline), turn, started)
+        # A client that disconnects before the body starts never runs the generator's finally
+        weakref.finalize(body, turn.release)
+        return StreamingResponse(
+            body,
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    finally:
+        if body is None:
+            REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="agent_chat_stream")
+
+def _ndjson(event: dict) -> bytes:
+    return (json.dumps(event) + "\n").encode("utf-8")
+
+async def _ndjson_stream(events, turn, started: float):
+    """NDJSON body of a streamed turn; the turn's admission and request duration end with the stream"""
+    try:
+        async for event in events:
+            yield _ndjson(event)
+    finally:
+        turn.release()
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="agent_chat_stream")
+
+@app.get("/agent/history/{session_id}")
+@timed(REQUEST_SECONDS, endpoint="history")
+async def agent_history(session_id: str, request: Request,
+                        limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_PAGE_MAX),
+                        before: Optional[int] = Query(None, ge=0), after: Optional[int] = Query(None, ge=-1),
+                        fields: Optional[str] = None, format: Literal["json", "ndjson"] = "json"):
+    """
+    A page of a session's chat history, oldest message first
+    
+    - **session_id**: Unique session identifier
+    - **limit**: Messages per page (default HISTORY_PAGE_SIZE, at most HISTORY_PAGE_MAX)
+    - **before**: Only messages before this index - pass a page's `prev_cursor` for the older page
+    - **after**: Only messages after this index - pass a page's `next_cursor` for the newer page
+    - **fields**: Comma-separated subset of role, content, timestamp, message_id (default: all), projected in MongoDB
+    - **format**: "json" (one page) or "ndjson" (every message between the cursors, one per line - for exports)
+    
+    Without cursors, returns the newest `limit` messages. Every message carries its `index`,
+    its position in the session (history is append-only, so indexes never change).
+    The ETag follows the session's message count and last write; a matching
+    If-None-Match gets 304 before any message is read.
+    """
+    projection = None
+    if fields is not None:
+        projection = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in projection if field not in HISTORY_FIELDS]
+        if unknown or not projection:
+            return JSONResponse({
+                "success": False,
+                "error": "invalid_fields",
+                "message": f"fields must be a comma-separated subset of {', '.join(HISTORY_FIELDS)}"
+            }, status_code=400)
+
+    try:
+        # Messages of a turn that just ended may still be queued for the write-behind
+        await chat_writer.wait_for_session(session_id)
+        total, updated_at = await resilience.call(
+            "mongodb", with_retries, lambda: chat_store.version(session_id), "reading chat history version"
+        )
+    except Exception as e:
+        logger.error(f"❌ Failed to read chat history version: {type(e).__name__}: {e}")
+        return _history_unavailable()
+
+    version = f"{session_id}:{total}:{updated_at.isoformat() if updated_at else ''}"
+    etag = f'"{hashlib.sha256(version.encode()).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Total-Count": str(total)}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))):
+        return Response(status_code=304, headers=headers)
+
+    stop = total if before is None else min(before, total)
+    first = 0 if after is None else min(after + 1, stop)
+    if format == "ndjson":
+        return StreamingResponse(
+            _history_export(session_id, first, stop, projection),
+            media_type="application/x-ndjson",
+            headers=headers,
+        )
+
+    # Paging forward from `after`, otherwise backward from `before` (or the newest message)
+    start, end = (first, min(first + limit, stop)) if after is not None and before is None else (max(first, stop - limit), stop)
+    try:
+        messages, _ = await resilience.call(
+            "mongodb", with_retries, lambda: chat_store.page(session_id, start, end - start, projection),
+            "reading chat history page"
+        )
+    except Exception as e:
+        logger.error(f"❌ Failed to read chat history page: {type(e).__name__}: {e}")
+        return _history_unavailable()
+    return JSONResponse({
+        "success": True,
+        "session_id": session_id,
+        "total": total,
+        "messages": [_history_message(start + offset, message) for offset, message in enumerate(messages)],
+        "prev_cursor": start if start > 0 else None,
+        "next_cursor": start + len(messages) - 1 if messages and start + len(messages) < total else None,
+    }, headers=headers)
+
+def _history_unavailable() -> JSONResponse:
+    return JSONResponse({
+        "success": False,
+        "error": "database_error",
+        "message": "Chat history is unavailable right now. Please try again in a moment."
+    }, status_code=503)
+
+def _history_message(index: int, message: dict) -> dict:
+    """A stored message as the history API returns it, timestamps in UTC ISO 8601"""
+    timestamp = message.get("timestamp")
+    if isinstance(timestamp, datetime):
+        message = {**message, "timestamp": timestamp.isoformat() + ("Z" if timestamp.tzinfo is None else "")}
+    return {"index": index, **message}
+
+async def _history_export(session_id: str, start: int, stop: int, projection: Optional[List[str]]):
+    """NDJSON body of a history export: messages [start, stop) read HISTORY_PAGE_MAX at a time"""
+    position = start
+    while position < stop:
+        try:
+            with priority_scope(BULK):
+                messages, _ = await resilience.call(
+                    "mongodb", with_retries,
+                    lambda: chat_store.page(session_id, position, min(HISTORY_PAGE_MAX, stop - position), projection),
+                    "exporting chat history"
+                )
+        except Exception as e:
+            # Too late for an error status - the export just ends early
+            logger.error(f"❌ Chat history export of {session_id} stopped at {position}: {type(e).__name__}: {e}")
+            return
+        if not messages:
+            return
+        for offset, message in enumerate(messages):
+            yield _ndjson(_history_message(position + offset, message))
+        position += len(messages)
+
+async def _synthesize_segment(text: str) -> Optional[str]:
+    """TTS for one streamed sentence; a failed segment plays as text-only rather than failing the turn"""
+    try:
+        audio_file, _ = await synthesize_speech(text, AGENT_VOICE_ID)
+        return audio_file
+    except Exception as e:
+        logger.warning(f"⚠️ TTS failed for streamed segment: {type(e).__name__}: {e}")
+        FALLBACKS.inc(reason="tts_failed")
+        return None
+
+async def stream_agent_turn(session_id: str, user_message: str, user_timestamp: datetime,
+                            history_task: Optional["asyncio.Task"] = None, deadline: Optional[Deadline] = None):
+    """
+    Async generator of turn events behind /agent/chat/{session_id}/stream and /ws/agent/{session_id}
+    
+    - **history_task**: retrieve_chat_context(session_id) started while the audio was being
+      transcribed, if the caller did; otherwise the history is read here
+    - **deadline**: The turn deadline, if the caller started it before STT; otherwise it starts here
+    
+    Three stages run concurrently: the Gemini stream (on the "llm" pool) feeds
+    complete sentences into a queue, a dispatcher starts a TTS task per sentence
+    right away, and this generator emits the segments in sentence order. All
+    three share the turn deadline (see resilience.py).
+    """
+    turn_start = time.perf_counter()
+    deadline = deadline or resilience.new_deadline()
+    if history_task is None:
+        with deadline_scope(deadline), priority_scope(INTERACTIVE):
+            history_task = asyncio.create_task(retrieve_chat_context(session_id))
+    try:
+        yield {"type": "transcription", "user_message": user_message}
+        chat_history, history_length, summary = await history_task
+    finally:
+        history_task.cancel()  # no-op unless the client went away before the history arrived
+    llm_context = build_llm_context(chat_history, user_message, summary)
+    cache_key = llm_cache.key_for(user_message, chat_history, summary) if llm_cache is not None else None
+    cached_response = llm_cache.get(cache_key) if cache_key is not None else None
+    
+    loop = asyncio.get_running_loop()
+    sentences: asyncio.Queue = asyncio.Queue()
+    segments: asyncio.Queue = asyncio.Queue()
+    response_parts: List[str] = []
+    llm_failed = False
+    
+    def stream_llm():
+        # Runs on a worker thread: iterate the blocking Gemini stream, hand sentences to the loop
+        splitter = SentenceSplitter()
+        gemini_client = upstream_clients.gemini()
+        started = time.perf_counter()
+        first_sentence = True
+        for chunk in gemini_client.models.generate_content_stream(
+                model=LLM_MODEL, contents=llm_context.contents, config=llm_context.config()):
+            time_left = call_time_left()
+            if time_left is not None and time_left <= 0:
+                break  # the turn has already moved on without the rest of the response
+            text = getattr(chunk, "text", None) or ""
+            response_parts.append(text)
+            for sentence in splitter.feed(text):
+                if first_sentence:
+                    STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm_first_sentence")
+                    first_sentence = False
+                loop.call_soon_threadsafe(sentences.put_nowait, sentence)
+        for sentence in splitter.flush():
+            loop.call_soon_threadsafe(sentences.put_nowait, sentence)
+    
+    async def produce():
+        nonlocal llm_failed
+        try:
+            with deadline_scope(deadline):
+                if cached_response is not None:
+                    # Same sentences as the original stream, all available at once
+                    logger.info("⚡ LLM response served from cache")
+                    response_parts.append(cached_response)
+                    splitter = SentenceSplitter()
+                    for sentence in [*splitter.feed(cached_response), *splitter.flush()]:
+                        sentences.put_nowait(sentence)
+                    return
+                if not os.getenv("GEMINI_API_KEY"):
+                    raise ValueError("GEMINI_API_KEY not found in environment")
+                started = time.perf_counter()
+                with span(STAGE_SECONDS, stage="llm"):
+                    await resilience.call("llm", stream_llm)
+                response = "".join(response_parts).strip()
+                if cache_key is not None and response:
+                    llm_cache.put(cache_key, response, time.perf_counter() - started)
+        except Exception as llm_error:
+            logger.error(f"❌ LLM Error: {type(llm_error).__name__}: {str(llm_error)}")
+            FALLBACKS.inc(reason="llm_error")
+            llm_failed = True
+        finally:
+            sentences.put_nowait(None)
+    
+    async def dispatch():
+        dispatched = 0
+        # The TTS tasks inherit the deadline
+        with deadline_scope(deadline):
+            while (sentence := await sentences.get()) is not None:
+                segments.put_nowait((sentence, asyncio.create_task(_synthesize_segment(sentence))))
+                dispatched += 1
+            if dispatched == 0:
+                # Nothing usable came back - speak the same fallback lines as agent_chat
+                if not llm_failed:
+                    FALLBACKS.inc(reason="llm_empty")
+                sentence = AGENT_FALLBACK_MESSAGE if llm_failed else EMPTY_LLM_RESPONSE
+                segments.put_nowait((sentence, asyncio.create_task(_synthesize_segment(sentence))))
+        segments.put_nowait(None)
+    
+    # The body runs after the endpoint returned - give the turn's tasks (and the TTS tasks they start) its priority
+    with priority_scope(INTERACTIVE):
+        producer = asyncio.create_task(produce())
+        dispatcher = asyncio.create_task(dispatch())
+    spoken: List[str] = []
+    try:
+        while (item := await segments.get()) is not None:
+            sentence, tts_task = item
+            audio_file = await tts_task
+            if not spoken:
+                # Transcript to first playable segment - what the user waits for
+                STAGE_SECONDS.observe(time.perf_counter() - turn_start, stage="first_segment")
+            yield {"type": "segment", "index": len(spoken), "text": sentence, "audio_file": audio_file}
+            spoken.append(sentence)
+    finally:
+        # Client went away mid-stream: stop dispatching (the LLM thread finishes on its own)
+        dispatcher.cancel()
+        producer.cancel()
+    
+    ai_response = "".join(response_parts).strip()
+    if llm_failed or not ai_response:
+        ai_response = " ".join(spoken)
+    logger.debug(f"🤖 LLM Response ({len(spoken)} segments): {ai_response}")
+    STAGE_SECONDS.observe(time.perf_counter() - turn_start, stage="stream_turn")
+    
+    # Queue both messages of this turn for a single write-behind upsert
+    chat_writer.enqueue(session_id, [
+        {"role": "user", "content": user_message, "timestamp": user_timestamp},
+        {"role": "assistant", "content": ai_response, "timestamp": datetime.utcnow()},
+    ])
+    with priority_scope(BULK):
+        summarizer.schedule(session_id, history_length + 2, summary)
+    
+    yield {
+        "type": "done",
+        "success": True,
+        "session_id": session_id,
+        "ai_response": ai_response,
+        "segments": len(spoken),
+        "chat_history_length": history_length + 2,  # +2 for current exchange
+        "model": LLM_MODEL,
+        "context_used": llm_context.uses_history,
+    }
+
+async def transcribe_audio_bytes(audio_data: bytes) -> str:
+    """Batch-transcribe a complete utterance (BufferedTranscription's backend)"""
+    transcript = await resilience.call("stt", upstream_clients.transcriber().transcribe, audio_data)
+    if transcript.status == "error":
+        raise RuntimeError(f"Transcription failed: {transcript.error}")
+    return transcript.text or ""
+
+def open_streaming_transcription(audio_format: str, sample_rate: int) -> StreamingTranscription:
+    """
+    STT session for one WebSocket connection
+    
+    PCM goes to AssemblyAI's streaming API unless STT_STREAMING=buffered; any other
+    format (e.g. MediaRecorder WebM chunks) is buffered and batch-transcribed.
+    """
+    if audio_format == "pcm16" and os.getenv("STT_STREAMING", "assemblyai") == "assemblyai":
+        return AssemblyAIStreamingTranscription(
+            os.getenv("ASSEMBLYAI_API_KEY"),
+            lambda fn, *args: upstreams.run("stt", fn, *args),
+            sample_rate=sample_rate,
+        )
+    return BufferedTranscription(transcribe_audio_bytes)
+
+async def _receive_audio(websocket: WebSocket, stt: StreamingTranscription, received: int = 0) -> None:
+    """
+    Forward audio frames to the STT session until the client disconnects
+
+    - **received**: Bytes of the current utterance already sent to stt
+
+    Raises UploadError once an utterance is over MAX_AUDIO_BYTES, the limit of audio uploads
+    """
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        if message.get("bytes"):
+            received += len(message["bytes"])
+            if received > MAX_AUDIO_BYTES:
+                raise audio_too_large()
+            await stt.send_audio(message["bytes"])
+        elif message.get("text"):
+            control = json.loads(message["text"])
+            if control.get("type") == "end":
+                received = 0
+                await stt.end_utterance()
+
+@app.websocket("/ws/agent/{session_id}")
+@prioritized(INTERACTIVE)
+async def agent_websocket(websocket: WebSocket, session_id: str):
+    """
+    Voice chat over a WebSocket, transcribing while the user is still speaking
+    
+    - **session_id**: Unique session identifier for chat history
+    
+    Client messages:
+    - `{"type": "start", "format": "pcm16" | "webm", "sample_rate": 16000}` first (optional, defaults shown)
+    - binary frames with audio as it is recorded
+    - `{"type": "end"}` when the user stops talking
+    
+    Server messages (JSON text frames):
+    - `{"type": "ready"}` once the STT session is open
+    - `{"type": "partial", "text": ...}` while transcribing
+    - per utterance, the events of /agent/chat/{session_id}/stream (transcription, segment..., done)
+    - `{"type": "error", "error": ..., "message": ...}` for a failed utterance or session, including
+      utterances not admitted as turns (`session_busy` / `overloaded`, with `retry_after`)
+    
+    An utterance over the audio upload limit (25MB) gets a `validation_error` and the socket is closed (1009).
+    
+    The socket stays open for further utterances. /agent/chat/{session_id} remains the fallback.
+    """
+    await websocket.accept()
+    if not os.getenv("ASSEMBLYAI_API_KEY"):
+        logger.error("❌ STT Error: AssemblyAI API key not configured")
+        await websocket.send_json({
+            "type": "error",
+            "error": "configuration_error",
+            "message": "I'm having trouble with the speech recognition service configuration.",
+        })
+        await websocket.close()
+        return
+    
+    stt = None
+    receiver = None
+    history_task = None
+    try:
+        options = {}
+        first = await websocket.receive()
+        if first["type"] == "websocket.disconnect":
+            return
+        if first.get("text"):
+            options = json.loads(first["text"])
+        stt = open_streaming_transcription(options.get("format", "pcm16"), int(options.get("sample_rate", 16000)))
+        await stt.start()
+        received = len(first.get("bytes") or b"")
+        if received > MAX_AUDIO_BYTES:
+            raise audio_too_large()
+        if received:
+            await stt.send_audio(first["bytes"])
+        await websocket.send_json({"type": "ready"})
+        logger.info(f"🎙️ Streaming session opened for {session_id} ({type(stt).__name__})")
+        
+        receiver = asyncio.create_task(_receive_audio(websocket, stt, received))
+        while True:
+            next_event = asyncio.ensure_future(stt.next_event())
+            await asyncio.wait({next_event, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                receiver.result()  # re-raise a receive error
+                break  # client disconnected
+            event = next_event.result()
+            if not event.end_of_utterance:
+                if history_task is None:
+                    # The user is still talking - read the history in the meantime
+                    history_task = asyncio.create_task(retrieve_chat_context(session_id))
+                await websocket.send_json({"type": "partial", "text": event.text})
+                continue
+            
+            user_message = event.text.strip()
+            if len(user_message) < 2:
+                if history_task is not None:
+                    history_task.cancel()
+                    history_task = None
+                await websocket.send_json({
+                    "type": "error",
+                    "error": "no_speech",
+                    "message": "I didn't detect any speech in the audio. Please try speaking louder or closer to the microphone.",
+                })
+                continue
+            logger.debug(f"✅ Streaming transcription complete: {user_message}")
+            turn_history, history_task = history_task, None
+            try:
+                turn = await admission.acquire(session_id)
+            except AdmissionRejected as e:
+                if turn_history is not None:
+                    turn_history.cancel()
+                await websocket.send_json({"type": "error", **_turn_rejected_body(e)})
+                continue
+            try:
+                if turn.waited_for_session and turn_history is not None:
+                    # Another turn of this session finished meanwhile - read the history again
+                    turn_history.cancel()
+                    turn_history = None
+                async for turn_event in stream_agent_turn(session_id, user_message, datetime.utcnow(), turn_history):
+                    await websocket.send_json(turn_event)
+            finally:
+                turn.release()
+    except WebSocketDisconnect:
+        pass
+    except UploadError as upload_error:
+        logger.warning(f"⚠️ Closing streaming session for {session_id}: {upload_error.message}")
+        try:
+            await websocket.send_json({"type": "error", "error": upload_error.error, "message": upload_error.message})
+            await websocket.close(code=1009)  # message too big
+        except Exception:
+            pass  # the socket is already gone
+    except Exception as e:
+        logger.error(f"❌ Streaming session error: {type(e).__name__}: {str(e)}")
+        try:
+            await websocket.send_json({
+                "type": "error",
+                "error": "service_error",
+                "message": "I'm having trouble connecting to the speech recognition service right now. Please try again.",
+            })
+            await websocket.close()
+        except Exception:
+            pass  # the socket is already gone
+    finally:
+        if receiver is not None:
+            receiver.cancel()
+        if history_task is not None:
+            history_task.cancel()
+        if stt is not None:
+            await stt.close()
+        logger.info(f"🎙️ Streaming session closed for {session_id}")
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
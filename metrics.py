@@ -0,0 +1,249 @@
+"""
+In-process metrics for the voice pipeline, rendered in Prometheus text format at /metrics
+
+- `Summary`: latency distribution per label set - p50/p95/p99 over a sliding
+  window of recent observations, plus cumulative `_sum` and `_count`
+- `Counter`: monotonically increasing totals (retries, fallbacks, trims, ...)
+- callback metrics: values read from existing components (pools, queues,
+  caches) at scrape time, so the hot path doesn't pay for them
+- `span()` / `timed()`: time a block or a function into a Summary
+
+There is one registry per process (`metrics`). Observations may come from the
+upstream worker threads, so every metric takes a lock.
+"""
+import asyncio
+import functools
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Tuple
+
+QUANTILES = (0.5, 0.95, 0.99)
+DEFAULT_WINDOW = 1024
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def _label_set(labels: Dict[str, Any]) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+class Summary:
+    """
+    Latency distribution per label set
+
+    - **window**: Observations kept per label set for the quantiles
+    """
+
+    type = "summary"
+
+    def __init__(self, name: str, help: str, window: int = DEFAULT_WINDOW):
+        self.name = name
+        self.help = help
+        self.window = window
+        self._lock = threading.Lock()
+        # labels -> [recent observations, sum, count]
+        self._series: Dict[LabelSet, list] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_set(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [deque(maxlen=self.window), 0.0, 0]
+            series[0].append(value)
+            series[1] += value
+            series[2] += 1
+
+    def quantiles(self, **labels: Any) -> Dict[float, float]:
+        """Nearest-rank quantiles of the current window for one label set (NaN if empty)"""
+        with self._lock:
+            series = self._series.get(_label_set(labels))
+            recent = sorted(series[0]) if series else []
+        return {q: self._quantile(recent, q) for q in QUANTILES}
+
+    @staticmethod
+    def _quantile(ordered: List[float], q: float) -> float:
+        if not ordered:
+            return math.nan
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            snapshot = [(key, sorted(recent), total, count) for key, (recent, total, count) in self._series.items()]
+        for key, ordered, total, count in snapshot:
+            for q in QUANTILES:
+                labels = _format_labels(key + (("quantile", str(q)),))
+                yield f"{self.name}{labels} {_format_value(self._quantile(ordered, q))}"
+            yield f"{self.name}_sum{_format_labels(key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(key)} {count}"
+
+
+class Counter:
+    """Monotonically increasing total per label set"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values: Dict[LabelSet, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = _label_set(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(_label_set(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            snapshot = list(self._values.items())
+        for key, value in snapshot:
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class CallbackMetric:
+    """
+    Gauge or counter whose values are read at scrape time
+
+    - **collect**: Returns [(labels dict, value), ...]; an exception skips the metric
+    """
+
+    def __init__(self, name: str, help: str, type: str,
+                 collect: Callable[[], Iterable[Tuple[Dict[str, Any], float]]]):
+        self.name = name
+        self.help = help
+        self.type = type
+        self._collect = collect
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self._collect():
+            yield f"{self.name}{_format_labels(_label_set(labels))} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    """All metrics of the process, in registration order"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric):
+                raise ValueError(f"Metric {metric.name} already registered as {existing.type}")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def summary(self, name: str, help: str, window: int = DEFAULT_WINDOW) -> Summary:
+        return self._register(Summary(name, help, window))
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(name, help))
+
+    def callback(self, name: str, help: str, type: str,
+                 collect: Callable[[], Iterable[Tuple[Dict[str, Any], float]]]) -> CallbackMetric:
+        """Register (or replace) a gauge/counter computed at scrape time"""
+        metric = CallbackMetric(name, help, type, collect)
+        self._metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                continue  # a callback whose component isn't up yet
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def span(summary: Summary, **labels: Any) -> Iterator[None]:
+    """Observe the duration of the block (also when it raises)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        summary.observe(time.perf_counter() - start, **labels)
+
+
+def timed(summary: Summary, **labels: Any) -> Callable:
+    """Decorator form of span() for sync and async functions"""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(summary, **labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(summary, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+metrics = MetricsRegistry()
+
+# Pipeline metrics shared by the modules that record them
+STAGE_SECONDS = metrics.summary(
+    "voiceforge_stage_seconds", "Duration of voice pipeline stages (stt, history, llm, tts, save, ...)")
+REQUEST_SECONDS = metrics.summary(
+    "voiceforge_request_seconds", "End-to-end duration of agent and TTS requests")
+UPSTREAM_SECONDS = metrics.summary(
+    "voiceforge_upstream_seconds", "Time blocking upstream calls spend running on their pool")
+UPSTREAM_QUEUE_SECONDS = metrics.summary(
+    "voiceforge_upstream_queue_seconds", "Time upstream calls wait for a free pool worker")
+UPSTREAM_ERRORS = metrics.counter(
+    "voiceforge_upstream_errors_total", "Upstream calls that raised")
+UPSTREAM_TIMEOUTS = metrics.counter(
+    "voiceforge_upstream_timeouts_total", "Upstream calls abandoned at their timeout, their queue timeout or the turn deadline")
+CIRCUIT_REJECTIONS = metrics.counter(
+    "voiceforge_circuit_rejections_total", "Upstream calls failed fast by an open circuit breaker")
+HEDGED_REQUESTS = metrics.counter(
+    "voiceforge_hedged_requests_total", "Hedged second attempts of idempotent upstream calls, sent and won")
+ADMISSION_WAIT_SECONDS = metrics.summary(
+    "voiceforge_admission_wait_seconds", "Time agent turns wait for their session's previous turn and a turn slot")
+ADMISSION_REJECTIONS = metrics.counter(
+    "voiceforge_admission_rejections_total", "Agent turns turned away with 429/503 before any upstream call")
+RETRIES = metrics.counter(
+    "voiceforge_retries_total", "Transient MongoDB errors retried")
+FALLBACKS = metrics.counter(
+    "voiceforge_fallbacks_total", "Turns or steps that degraded to a fallback")
+STT_AUDIO_SECONDS = metrics.counter(
+    "voiceforge_stt_audio_seconds_total", "Seconds of uploaded audio received and sent to STT after preprocessing")
+LLM_PROMPT_TOKENS = metrics.summary(
+    "voiceforge_llm_prompt_tokens", "Estimated prompt tokens per agent turn (history budget + user message)")
+TTS_TRIMS = metrics.counter(
+    "voiceforge_tts_trims_total", "Responses trimmed to Murf's character limit")
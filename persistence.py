@@ -0,0 +1,224 @@
+"""
+Write-behind persistence for chat turns
+
+agent_chat used to make two synchronous upserts per turn (user message, then
+assistant message) before TTS could start. Turns are now enqueued here and
+written in the background:
+
+- both messages of a turn are appended together (one `$push` with `$each`)
+- pending turns are coalesced per session and across sessions into one batched
+  write (`append_many` on the chat store, i.e. a `bulk_write`), flushed every
+  `flush_interval` seconds or as soon as `max_batch` sessions are pending
+- `wait_for_session()` gives read-your-writes: the next turn of a session waits
+  for (and triggers) the flush of that session's pending writes before reading,
+  and for a batch holding that session's writes that is still being written
+- a failed batch is not retried in place: pymongo's retryable writes already
+  retry a write once, and a `$push` whose outcome is unknown must not simply be
+  sent again. Its turns go back to the front of the queue and are retried after
+  a backoff. Every message carries a `message_id`, so a retried write skips
+  messages that did get stored. After `max_attempts` failed flushes, a
+  session's messages are dead-lettered to `dead_letter_path` (JSON lines)
+- `stop()` flushes everything that is still queued on shutdown; what can't be
+  written then is dead-lettered too
+"""
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Collection, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ChatWriteBehind:
+    """
+    Background queue that batches chat turn writes into bulk_write calls
+
+    - **write_batch**: Async callable persisting {session_id: [messages]} in one batch; its
+      second argument holds the sessions whose messages may already be partly stored
+    - **flush_interval**: Maximum seconds a write waits in the queue
+    - **max_batch**: Number of pending sessions that triggers an immediate flush
+    - **max_attempts**: Failed flushes after which a session's messages are dead-lettered
+    - **retry_delay**: Backoff after the first failed flush, doubled after each further one
+    - **dead_letter_path**: JSON-lines file the dead-lettered messages are appended to
+    """
+
+    def __init__(self, write_batch: Callable[[Dict[str, List[Dict[str, Any]]], Collection[str]], Awaitable[Any]],
+                 flush_interval: float = 0.05, max_batch: int = 100, max_attempts: int = 5,
+                 retry_delay: float = 0.5, dead_letter_path: Optional[str] = None):
+        self._write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.dead_letter_path = dead_letter_path
+        # session_id -> messages waiting to be written (insertion order kept)
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        # session_id -> future resolved once that session's writes are flushed
+        self._flushed: Dict[str, asyncio.Future] = {}
+        # session_id -> future of the batch being written right now, resolved when the write returns
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # session_id -> failed flushes of the messages queued for it
+        self._attempts: Dict[str, int] = {}
+        self._wakeup = asyncio.Event()
+        self._stop_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {"turns_enqueued": 0, "batches_written": 0, "sessions_written": 0, "failed_batches": 0,
+                      "sessions_requeued": 0, "messages_dead_lettered": 0}
+
+    def start(self) -> None:
+        """Start the background flush loop (called from the lifespan)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """
+        Queue messages for a session; returns immediately
+
+        Messages of the same session are written in the order they were enqueued.
+        Each gets a `message_id` (unless it has one) that makes its write idempotent.
+        """
+        for message in messages:
+            message.setdefault("message_id", uuid.uuid4().hex)
+        self._pending.setdefault(session_id, []).extend(messages)
+        if session_id not in self._flushed:
+            self._flushed[session_id] = asyncio.get_running_loop().create_future()
+        self.stats["turns_enqueued"] += 1
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    async def wait_for_session(self, session_id: str) -> None:
+        """Wait until every write queued for session_id has been flushed (read-your-writes)"""
+        in_flight = self._in_flight.get(session_id)
+        queued = self._flushed.get(session_id)
+        if queued is not None:
+            # Don't make the reader sit out the rest of the flush interval
+            self._wakeup.set()
+        for waiter in (in_flight, queued):
+            if waiter is not None:
+                await asyncio.shield(waiter)
+
+    def pending_sessions(self) -> int:
+        return len(self._pending)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if await self.flush() or self._stopping:
+                continue
+            # Back off before the re-queued turns are tried again
+            backoff = self.retry_delay * 2 ** (max(self._attempts.values(), default=1) - 1)
+            try:
+                await asyncio.wait_for(self._stop_requested.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+
+    async def flush(self) -> bool:
+        """Write everything queued so far in a single bulk_write; False if the write failed"""
+        if not self._pending:
+            return True
+        pending, self._pending = self._pending, {}
+        # Readers keep waiting on these until the batch is written, not just taken off the queue
+        waiters = {session_id: self._flushed.pop(session_id) for session_id in pending}
+        self._in_flight.update(waiters)
+        retried = {session_id for session_id in pending if session_id in self._attempts}
+        try:
+            await self._write_batch(pending, retried)
+            self.stats["batches_written"] += 1
+            self.stats["sessions_written"] += len(pending)
+            for session_id in retried:
+                del self._attempts[session_id]
+            return True
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            logger.error(f"❌ Failed to persist chat messages for {len(pending)} sessions: {type(e).__name__}: {e}")
+            self._requeue(pending, e)
+            return False
+        finally:
+            # Release readers even on failure - a lost write must not stall the next turn
+            for session_id, waiter in waiters.items():
+                if self._in_flight.get(session_id) is waiter:
+                    del self._in_flight[session_id]
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    def _requeue(self, pending: Dict[str, List[Dict[str, Any]]], error: Exception) -> None:
+        """Put the turns of a failed batch back in front of the queue, or dead-letter them"""
+        for session_id, messages in pending.items():
+            attempts = self._attempts.get(session_id, 0) + 1
+            if attempts >= self.max_attempts:
+                self._attempts.pop(session_id, None)
+                self._dead_letter(session_id, messages, error)
+                continue
+            self._attempts[session_id] = attempts
+            # Ahead of whatever was enqueued while the batch was being written
+            self._pending[session_id] = messages + self._pending.get(session_id, [])
+            if session_id not in self._flushed:
+                self._flushed[session_id] = asyncio.get_running_loop().create_future()
+            self.stats["sessions_requeued"] += 1
+
+    def _dead_letter(self, session_id: str, messages: List[Dict[str, Any]], error: Exception) -> None:
+        self.stats["messages_dead_lettered"] += len(messages)
+        if not self.dead_letter_path:
+            logger.error(f"❌ Gave up on {len(messages)} chat messages of session {session_id}")
+            return
+        record = {
+            "session_id": session_id,
+            "messages": messages,
+            "error": f"{type(error).__name__}: {error}",
+            "failed_at": datetime.utcnow(),
+        }
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letters:
+                dead_letters.write(json.dumps(record, default=_json_default) + "\n")
+        except OSError as e:
+            logger.error(f"❌ Could not dead-letter {len(messages)} chat messages of session {session_id}: {e}")
+            return
+        logger.error(f"❌ Gave up on {len(messages)} chat messages of session {session_id}, "
+                     f"dead-lettered to {self.dead_letter_path}")
+
+    async def stop(self) -> None:
+        """Stop the flush loop, write whatever is still queued and dead-letter what can't be written"""
+        self._stopping = True
+        self._wakeup.set()
+        self._stop_requested.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if await self.flush():
+            return
+        leftovers, self._pending = self._pending, {}
+        for session_id, messages in leftovers.items():
+            self._attempts.pop(session_id, None)
+            self._dead_letter(session_id, messages, RuntimeError("still unwritten at shutdown"))
+        for waiter in self._flushed.values():
+            if not waiter.done():
+                waiter.set_result(None)
+        self._flushed.clear()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def read_dead_letters(path: str) -> List[Dict[str, Any]]:
+    """Records of a dead-letter file, message timestamps parsed back into datetimes"""
+    records = []
+    with open(path, encoding="utf-8") as dead_letters:
+        for line in dead_letters:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for message in record["messages"]:
+                if isinstance(message.get("timestamp"), str):
+                    message["timestamp"] = datetime.fromisoformat(message["timestamp"])
+            records.append(record)
+    return records
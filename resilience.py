@@ -0,0 +1,378 @@
+"""
+Timeouts, a per-turn deadline, circuit breakers and hedged requests for the upstream calls
+
+`UpstreamExecutor.run` bounds how many calls run at once, but not how long
+one may take: a slow Murf, AssemblyAI or Gemini kept the turn waiting for as
+long as the SDK did, and an upstream that was down was still called (and
+waited for) on every turn. `Resilience.call` runs calls on the executor with:
+
+- a timeout per upstream (`*_TIMEOUT_SECONDS`), counted from the moment the
+  call gets its pool slot - time spent queued behind other calls is not the
+  upstream's, and never counts against its breaker
+- the turn deadline: a time budget for the whole turn, set with
+  `deadline_scope()`; every call inside the scope gets at most the time left,
+  and a call with no time left fails without being made
+- a queue timeout per priority class (`QUEUE_TIMEOUT_SECONDS_*`): bulk work
+  that the scheduler keeps behind interactive turns gives up with
+  QueueTimeout instead of piling up - also never a breaker failure
+- a circuit breaker per upstream: after `failure_threshold` consecutive
+  failures (exceptions or timeouts) calls fail fast with CircuitOpenError for
+  `reset_seconds`, then one probe call decides whether it closes again
+- hedging for idempotent calls (TTS): if the first attempt is slower than the
+  upstream's recent p95, a second one is started when the pool has a free
+  worker, and whichever finishes first wins
+
+All of these raise into the callers' existing error handling, so a failing
+upstream degrades the turn to the usual fallback message or text-only reply.
+
+A timed-out call can't be interrupted on its worker thread; it keeps its pool
+slot until the SDK returns. Blocking code that loops or retries can check
+`call_time_left()` to give up early.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from executor import UpstreamExecutor, env_float, env_int
+from metrics import CIRCUIT_REJECTIONS, HEDGED_REQUESTS, UPSTREAM_SECONDS, UPSTREAM_TIMEOUTS
+from scheduler import BULK, INTERACTIVE, MANUAL, current_priority
+
+logger = logging.getLogger(__name__)
+
+# Default seconds per call (overridable via environment)
+DEFAULT_TIMEOUTS = {
+    "stt": 30.0,
+    "llm": 20.0,
+    "tts": 15.0,
+    "mongodb": 10.0,
+}
+
+TIMEOUT_ENV_VARS = {
+    "stt": "STT_TIMEOUT_SECONDS",
+    "llm": "LLM_TIMEOUT_SECONDS",
+    "tts": "TTS_TIMEOUT_SECONDS",
+    "mongodb": "MONGODB_TIMEOUT_SECONDS",
+}
+
+DEFAULT_TURN_BUDGET_SECONDS = 45.0
+
+# Default seconds a call may wait for a pool slot, by priority class (0 = only the turn deadline)
+DEFAULT_QUEUE_TIMEOUTS = {
+    INTERACTIVE: 0.0,
+    MANUAL: 30.0,
+    BULK: 60.0,
+}
+
+QUEUE_TIMEOUT_ENV_VARS = {
+    INTERACTIVE: "QUEUE_TIMEOUT_SECONDS_INTERACTIVE",
+    MANUAL: "QUEUE_TIMEOUT_SECONDS_MANUAL",
+    BULK: "QUEUE_TIMEOUT_SECONDS_BULK",
+}
+
+
+class UpstreamTimeout(TimeoutError):
+    """An upstream call ran out of time (its own timeout or the turn deadline)"""
+
+    def __init__(self, service: str, seconds: float):
+        super().__init__(f"{service} call timed out after {seconds:.2f}s")
+        self.service = service
+        self.seconds = seconds
+
+
+class QueueTimeout(UpstreamTimeout):
+    """A call waited longer than its priority class's queue timeout for a pool slot; it was not made"""
+
+    def __init__(self, service: str, seconds: float, priority: str):
+        TimeoutError.__init__(self, f"{service} call waited {seconds:.2f}s for a {priority} slot")
+        self.service = service
+        self.seconds = seconds
+        self.priority = priority
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream's circuit breaker is open; the call was not made"""
+
+    def __init__(self, service: str, retry_in: float):
+        super().__init__(f"{service} circuit breaker is open (next probe in {retry_in:.1f}s)")
+        self.service = service
+        self.retry_in = retry_in
+
+
+class Deadline:
+    """Point in time by which a turn must be answered"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+
+# Deadline of the turn being handled by the current task
+_turn_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("turn_deadline", default=None)
+# Absolute time.monotonic() deadline of the upstream call running on this worker thread
+_call_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("call_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Make deadline the turn deadline of every Resilience.call in the block (and in tasks it creates)"""
+    token = _turn_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _turn_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _turn_deadline.get()
+
+
+def call_time_left() -> Optional[float]:
+    """Seconds until the current upstream call times out (None outside Resilience.call); usable on worker threads"""
+    deadline = _call_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one upstream
+
+    - **failure_threshold**: Consecutive failures that open the circuit
+    - **reset_seconds**: How long it stays open before a probe call is let through
+
+    closed: calls pass. open: calls fail fast. half_open: one probe call is in
+    flight; its success closes the circuit, its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, service: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        """Whether a call may be made now (moves open -> half_open once reset_seconds have passed)"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and self.retry_in() == 0:
+            self.state = self.HALF_OPEN
+            logger.info(f"🔌 {self.service} circuit half-open, sending a probe call")
+            return True
+        return False  # open, or the half-open probe is still running
+
+    def retry_in(self) -> float:
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def release_probe(self) -> None:
+        """The half-open probe was cancelled without an outcome; let the next call probe instead"""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic() - self.reset_seconds
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"✅ {self.service} circuit closed again")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"⚠️ {self.service} circuit opened after {self.consecutive_failures} consecutive "
+                               f"failures, failing fast for {self.reset_seconds:.0f}s")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "retry_in": round(self.retry_in(), 1),
+        }
+
+
+class Resilience:
+    """
+    Timeouts, deadline, breakers and hedging around an UpstreamExecutor
+
+    - **executor**: The pools the calls run on
+    - **timeouts**: Seconds per call, by service (services without one get no timeout and no breaker)
+    - **failure_threshold** / **reset_seconds**: Circuit breaker settings, shared by every upstream
+    - **turn_budget**: Default seconds for a turn's Deadline
+    - **queue_timeouts**: Seconds a call may wait for a pool slot, by priority class (0 or missing: no limit)
+    - **hedge**: Services whose `hedge=True` calls may be hedged
+    - **hedge_min_seconds**: Never hedge sooner than this, whatever the recent p95
+    """
+
+    def __init__(self, executor: UpstreamExecutor, timeouts: Dict[str, float], failure_threshold: int = 5,
+                 reset_seconds: float = 30.0, turn_budget: float = DEFAULT_TURN_BUDGET_SECONDS,
+                 hedge=(), hedge_min_seconds: float = 0.5, queue_timeouts: Optional[Dict[str, float]] = None):
+        self.executor = executor
+        self.timeouts = dict(timeouts)
+        self.turn_budget = turn_budget
+        self.queue_timeouts = dict(queue_timeouts or {})
+        self.hedge = frozenset(hedge)
+        self.hedge_min_seconds = hedge_min_seconds
+        self.breakers = {
+            service: CircuitBreaker(service, failure_threshold, reset_seconds) for service in self.timeouts
+        }
+
+    @classmethod
+    def from_env(cls, executor: UpstreamExecutor) -> "Resilience":
+        """DEFAULT_TIMEOUTS overridden by *_TIMEOUT_SECONDS, plus BREAKER_*, TURN_BUDGET_SECONDS, TTS_HEDGE and QUEUE_TIMEOUT_SECONDS_*"""
+        return cls(
+            executor,
+            timeouts={
+                service: env_float(TIMEOUT_ENV_VARS[service], default)
+                for service, default in DEFAULT_TIMEOUTS.items()
+            },
+            failure_threshold=env_int("BREAKER_FAILURE_THRESHOLD", 5),
+            reset_seconds=env_float("BREAKER_RESET_SECONDS", 30.0),
+            turn_budget=env_float("TURN_BUDGET_SECONDS", DEFAULT_TURN_BUDGET_SECONDS),
+            hedge=("tts",) if os.getenv("TTS_HEDGE", "off") == "on" else (),
+            hedge_min_seconds=env_int("TTS_HEDGE_MIN_MS", 500) / 1000,
+            queue_timeouts={
+                priority: env_float(QUEUE_TIMEOUT_ENV_VARS[priority], default)
+                for priority, default in DEFAULT_QUEUE_TIMEOUTS.items()
+            },
+        )
+
+    def new_deadline(self) -> Deadline:
+        return Deadline(self.turn_budget)
+
+    def budgeted(self, fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """Decorator running each call of an async function (an endpoint) under a new turn deadline"""
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with deadline_scope(self.new_deadline()):
+                return await fn(*args, **kwargs)
+        return wrapper
+
+    async def call(self, service: str, fn: Callable[..., Any], *args: Any, hedge: bool = False, **kwargs: Any) -> Any:
+        """
+        Run a blocking callable on the service's pool, within its timeout and the turn deadline
+
+        - **service**: The upstream ("stt", "llm", "tts", "mongodb")
+        - **hedge**: The call is idempotent and may be sent twice (only for services configured to hedge)
+
+        Raises CircuitOpenError, UpstreamTimeout (QueueTimeout if no slot came in time), or whatever fn raised
+        """
+        breaker = self.breakers.get(service)
+        if breaker is None:
+            return await self.executor.run(service, fn, *args, **kwargs)
+
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired:
+            # Not the upstream's fault - the turn spent its budget elsewhere
+            UPSTREAM_TIMEOUTS.inc(upstream=service, reason="deadline")
+            raise UpstreamTimeout(service, 0.0)
+        if not breaker.allow():
+            CIRCUIT_REJECTIONS.inc(upstream=service)
+            raise CircuitOpenError(service, breaker.retry_in())
+
+        # Waiting for a pool slot says nothing about the upstream: the class's queue timeout
+        # and the turn deadline bound it, and running out of time here is never a breaker failure
+        priority = current_priority()
+        queue_timeout = self.queue_timeouts.get(priority) or None
+        deadline_first = deadline is not None and (queue_timeout is None or deadline.remaining() < queue_timeout)
+        try:
+            await self.executor.acquire(service, timeout=deadline.remaining() if deadline_first else queue_timeout)
+        except asyncio.TimeoutError:
+            breaker.release_probe()
+            if deadline_first:
+                UPSTREAM_TIMEOUTS.inc(upstream=service, reason="deadline")
+                raise UpstreamTimeout(service, deadline.seconds) from None
+            UPSTREAM_TIMEOUTS.inc(upstream=service, reason="queue")
+            raise QueueTimeout(service, queue_timeout, priority) from None
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+
+        timeout = self.timeouts[service]
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        token = _call_deadline.set(time.monotonic() + timeout)
+        first = self.executor.submit(service, fn, *args, **kwargs)
+        try:
+            if hedge and service in self.hedge:
+                result = await asyncio.wait_for(self._hedged(service, first, fn, args, kwargs), timeout)
+            else:
+                result = await asyncio.wait_for(first, timeout)
+        except asyncio.TimeoutError:
+            if timeout < self.timeouts[service]:
+                # Cut short by the turn deadline, not slower than the upstream's own timeout
+                breaker.release_probe()
+                UPSTREAM_TIMEOUTS.inc(upstream=service, reason="deadline")
+            else:
+                breaker.record_failure()
+                UPSTREAM_TIMEOUTS.inc(upstream=service, reason="timeout")
+            raise UpstreamTimeout(service, timeout) from None
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        finally:
+            first.cancel()  # no-op once done; frees the slot of a call that never started
+            _call_deadline.reset(token)
+        breaker.record_success()
+        return result
+
+    def _hedge_delay(self, service: str) -> float:
+        """Recent p95 of the upstream's call time, at least hedge_min_seconds"""
+        p95 = UPSTREAM_SECONDS.quantiles(upstream=service)[0.95]
+        return self.hedge_min_seconds if math.isnan(p95) else max(self.hedge_min_seconds, p95)
+
+    def _has_spare_worker(self, service: str) -> bool:
+        stats = self.executor.stats()[service]
+        return stats["in_flight"] < stats["limit"]
+
+    async def _hedged(self, service: str, first: "asyncio.Future[Any]", fn: Callable[..., Any], args, kwargs) -> Any:
+        """Wait for the first attempt, racing it against a second one once it is slower than the recent p95"""
+        attempts = [first]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=self._hedge_delay(service))
+            if not done and self._has_spare_worker(service):
+                HEDGED_REQUESTS.inc(upstream=service, event="sent")
+                attempts.append(asyncio.ensure_future(self.executor.run(service, fn, *args, **kwargs)))
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        if attempt is not first:
+                            HEDGED_REQUESTS.inc(upstream=service, event="won")
+                        return attempt.result()
+            raise first.exception()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    def breaker_states(self) -> Dict[str, Dict[str, Any]]:
+        """Circuit breaker state per upstream, for /api/health and metrics"""
+        return {service: breaker.snapshot() for service, breaker in self.breakers.items()}
@@ -0,0 +1,239 @@
+"""
+Priority scheduling of the upstream calls: interactive voice turns before manual TTS before bulk work
+
+Each upstream pool used to take calls first come, first served. Someone
+pasting 5000-character texts into the TTS page, or a batch narrating a
+chapter, filled the Murf pool and the provider quota, and the TTS step of
+live voice conversations waited behind them. `UpstreamExecutor.run` now asks
+the service's `ServiceScheduler` for a slot before handing a call to its pool:
+
+- every call has a priority class, taken from `priority_scope()` (a
+  contextvar, like the turn deadline) - agent turns run as "interactive",
+  the TTS page as "manual", batches and background summaries as "bulk";
+  calls outside any scope are "manual"
+- at most `limit` calls (the pool size) run; waiting calls are dispatched by
+  weighted fair queuing: each gets a virtual finish tag of
+  max(virtual time, its class's last tag) + 1 / weight, and the smallest tag
+  goes next. With weights 8:3:1 a backlog of bulk calls gets one slot in 12
+  while interactive calls wait, but is never starved
+- an optional token bucket per service (`*_RATE_PER_SECOND`) keeps dispatches
+  within the provider's quota; calls over it wait in the same queue
+
+A call that is cancelled while waiting (timeout, turn deadline) leaves the
+queue. A slot is freed when the call finishes on its worker thread, not when
+its caller stops waiting.
+"""
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+MANUAL = "manual"
+BULK = "bulk"
+
+# Default relative share of the slots while classes compete (overridable via environment)
+DEFAULT_WEIGHTS = {INTERACTIVE: 8, MANUAL: 3, BULK: 1}
+
+WEIGHT_ENV_VARS = {
+    INTERACTIVE: "PRIORITY_WEIGHT_INTERACTIVE",
+    MANUAL: "PRIORITY_WEIGHT_MANUAL",
+    BULK: "PRIORITY_WEIGHT_BULK",
+}
+
+# Provider quotas in calls per second, 0 = none (only the upstream APIs have one)
+RATE_ENV_VARS = {
+    "stt": "STT_RATE_PER_SECOND",
+    "llm": "LLM_RATE_PER_SECOND",
+    "tts": "TTS_RATE_PER_SECOND",
+}
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("upstream_priority", default=MANUAL)
+
+
+@contextmanager
+def priority_scope(priority: str) -> Iterator[str]:
+    """Upstream calls (and tasks created) inside the block are scheduled with this priority"""
+    if priority not in DEFAULT_WEIGHTS:
+        raise ValueError(f"Unknown priority: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield priority
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def prioritized(priority: str) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """Decorator running each call of an async function (an endpoint) in priority_scope(priority)"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with priority_scope(priority):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class TokenBucket:
+    """
+    Non-blocking token bucket
+
+    - **rate**: Tokens added per second (0: unlimited)
+    - **burst**: Bucket size
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self) -> bool:
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """Seconds until the next token"""
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class ServiceScheduler:
+    """
+    Slots of one upstream pool, handed out by weighted fair queuing within a rate limit
+
+    - **limit**: Calls running at once (the pool size)
+    - **weights**: Priority class -> share while classes compete
+    - **rate_per_second**: Provider quota (0: unlimited), with a burst of `limit`
+    """
+
+    def __init__(self, service: str, limit: int, weights: Dict[str, float], rate_per_second: float = 0.0):
+        self.service = service
+        self.limit = limit
+        self.weights = dict(weights)
+        self.bucket = TokenBucket(rate_per_second, burst=limit)
+        self.running = 0
+        self._virtual_time = 0.0
+        self._last_tag: Dict[str, float] = {priority: 0.0 for priority in self.weights}
+        # (finish tag, arrival order, priority, waiter)
+        self._queue: List[Tuple[float, int, str, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.queued = {priority: 0 for priority in self.weights}
+        self.dispatched = {priority: 0 for priority in self.weights}
+
+    async def acquire(self, priority: str) -> None:
+        """Wait for a slot; every acquire must be followed by exactly one release()"""
+        if self.running < self.limit and not self._queue and self.bucket.take():
+            self.running += 1
+            self.dispatched[priority] += 1
+            return
+        tag = max(self._virtual_time, self._last_tag[priority]) + 1 / self.weights[priority]
+        self._last_tag[priority] = tag
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (tag, next(self._arrivals), priority, waiter))
+        self.queued[priority] += 1
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # dispatched as the caller gave up - pass the slot on
+            else:
+                waiter.cancel()  # dropped lazily by _dispatch
+                self.queued[priority] -= 1
+            raise
+
+    def release(self) -> None:
+        self.running -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._queue and self.running < self.limit:
+            tag, _, priority, waiter = self._queue[0]
+            if waiter.cancelled():
+                heapq.heappop(self._queue)
+                continue
+            if not self.bucket.take():
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(self.bucket.wait_time(), self._on_timer)
+                return
+            heapq.heappop(self._queue)
+            self._virtual_time = tag
+            self.queued[priority] -= 1
+            self.dispatched[priority] += 1
+            self.running += 1
+            waiter.set_result(None)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "limit": self.limit,
+            "rate_per_second": self.bucket.rate,
+            "queued": dict(self.queued),
+            "dispatched": dict(self.dispatched),
+        }
+
+
+class UpstreamScheduler:
+    """
+    One ServiceScheduler per upstream pool
+
+    - **limits**: Service -> pool size
+    - **weights**: Priority class -> share (default DEFAULT_WEIGHTS)
+    - **rates**: Service -> provider quota in calls per second (default none)
+    """
+
+    def __init__(self, limits: Dict[str, int], weights: Optional[Dict[str, float]] = None,
+                 rates: Optional[Dict[str, float]] = None):
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.services = {
+            service: ServiceScheduler(service, limit, self.weights, (rates or {}).get(service, 0.0))
+            for service, limit in limits.items()
+        }
+
+    @classmethod
+    def from_env(cls, limits: Dict[str, int]) -> "UpstreamScheduler":
+        """Weights from PRIORITY_WEIGHT_*, quotas from STT/LLM/TTS_RATE_PER_SECOND"""
+        from executor import env_float, env_int  # executor.py imports this module
+
+        weights = {priority: env_int(WEIGHT_ENV_VARS[priority], default) for priority, default in DEFAULT_WEIGHTS.items()}
+        rates = {service: env_float(name, 0.0) for service, name in RATE_ENV_VARS.items()}
+        scheduler = cls(limits, weights, rates)
+        quotas = {service: rate for service, rate in rates.items() if rate > 0}
+        logger.info(f"⚙️ Upstream priority weights: {weights}" + (f", quotas per second: {quotas}" if quotas else ""))
+        return scheduler
+
+    async def acquire(self, service: str, priority: str) -> None:
+        await self.services[service].acquire(priority)
+
+    def release(self, service: str) -> None:
+        self.services[service].release()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {service: scheduler.stats() for service, scheduler in self.services.items()}
@@ -0,0 +1,195 @@
+"""
+Streaming speech-to-text for the /ws/agent/{session_id} WebSocket
+
+The multipart endpoints only start transcribing once the whole recording has
+been uploaded, so a long utterance costs its speaking time plus its
+transcription time. Over the WebSocket, audio chunks are forwarded to a
+streaming STT session while the user is still speaking; when the user stops,
+only the last few hundred milliseconds remain to be finalized before the agent
+turn starts.
+
+Every implementation has the same small async interface, so the WebSocket
+handler doesn't care which one it talks to and tests or benchmarks can plug in
+a local stub:
+
+- `start()` / `close()`
+- `send_audio(chunk)`: forward a chunk as soon as it was recorded
+- `end_utterance()`: the user stopped talking; finalize the transcript
+- `next_event()`: the next `TranscriptEvent` - partial text of the utterance
+  so far, then its final transcript (`end_of_utterance=True`)
+
+Implementations:
+
+- `AssemblyAIStreamingTranscription`: AssemblyAI's streaming API, for 16-bit
+  little-endian mono PCM (the page sends 16 kHz)
+- `BufferedTranscription`: collects the chunks and runs one batch
+  transcription at the end of the utterance; for audio the streaming API can't
+  take (e.g. MediaRecorder WebM chunks). Same protocol, no overlap.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, List, NamedTuple, Optional
+
+
+class TranscriptEvent(NamedTuple):
+    text: str
+    end_of_utterance: bool
+
+
+class StreamingTranscription:
+    """
+    Base class: implementations push events (from any thread) with _emit()/_fail()
+
+    Must be created on the event loop that reads next_event().
+    """
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._events: asyncio.Queue = asyncio.Queue()
+
+    def _emit(self, text: str, end_of_utterance: bool = False) -> None:
+        self._loop.call_soon_threadsafe(self._events.put_nowait, TranscriptEvent(text, end_of_utterance))
+
+    def _fail(self, error: Exception) -> None:
+        self._loop.call_soon_threadsafe(self._events.put_nowait, error)
+
+    async def next_event(self) -> TranscriptEvent:
+        """Wait for the next transcript event; raises if the STT session failed"""
+        event = await self._events.get()
+        if isinstance(event, Exception):
+            raise event
+        return event
+
+    async def start(self) -> None:
+        pass
+
+    async def send_audio(self, chunk: bytes) -> None:
+        raise NotImplementedError
+
+    async def end_utterance(self) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class AssemblyAIStreamingTranscription(StreamingTranscription):
+    """
+    AssemblyAI streaming session for one WebSocket connection
+
+    - **api_key**: AssemblyAI API key
+    - **run_blocking**: Async runner for the SDK's blocking connect/disconnect (the "stt" pool)
+    - **sample_rate**: Sample rate of the PCM the client sends
+    - **finalize_timeout**: Seconds to wait for the last turn after end_utterance()
+
+    AssemblyAI ends a turn at every pause; turns are collected and the utterance
+    is only final once the user stops recording, so a mid-sentence pause doesn't
+    start the LLM with half a question.
+    """
+
+    def __init__(self, api_key: str, run_blocking: Callable[..., Awaitable[Any]],
+                 sample_rate: int = 16000, finalize_timeout: float = 3.0):
+        super().__init__()
+        # Imported here so the batch-only path works with SDK versions without streaming v3
+        from assemblyai.streaming.v3 import StreamingClient, StreamingClientOptions, StreamingEvents
+
+        self._client = StreamingClient(StreamingClientOptions(api_key=api_key))
+        self._client.on(StreamingEvents.Turn, self._on_turn)
+        self._client.on(StreamingEvents.Error, self._on_error)
+        self._run_blocking = run_blocking
+        self.sample_rate = sample_rate
+        self.finalize_timeout = finalize_timeout
+        # Written by the SDK's reader thread, read on the loop via call_soon_threadsafe
+        self._turns: List[str] = []
+        self._partial = ""
+        self._finalizing = False
+        self._finalize_timer: Optional[asyncio.TimerHandle] = None
+
+    async def start(self) -> None:
+        from assemblyai.streaming.v3 import StreamingParameters
+
+        params = StreamingParameters(sample_rate=self.sample_rate, format_turns=True)
+        await self._run_blocking(self._client.connect, params)
+
+    async def send_audio(self, chunk: bytes) -> None:
+        # Only enqueues - the SDK's writer thread does the sending
+        self._client.stream(chunk)
+
+    async def end_utterance(self) -> None:
+        self._loop.call_soon_threadsafe(self._begin_finalize)
+
+    async def close(self) -> None:
+        if self._finalize_timer is not None:
+            self._finalize_timer.cancel()
+        await self._run_blocking(self._client.disconnect, True)
+
+    def _utterance(self, partial: str = "") -> str:
+        return " ".join(text for text in (*self._turns, partial) if text)
+
+    def _on_turn(self, client, event) -> None:
+        if event.end_of_turn and not event.turn_is_formatted:
+            return  # the formatted version of this turn follows
+        self._loop.call_soon_threadsafe(self._handle_turn, event.transcript, event.end_of_turn)
+
+    def _on_error(self, client, error) -> None:
+        self._fail(RuntimeError(f"AssemblyAI streaming error: {error}"))
+
+    def _handle_turn(self, transcript: str, end_of_turn: bool) -> None:
+        if end_of_turn:
+            self._turns.append(transcript)
+            self._partial = ""
+            if self._finalizing:
+                self._finish()
+                return
+        else:
+            self._partial = transcript
+        self._events.put_nowait(TranscriptEvent(self._utterance(self._partial), False))
+
+    def _begin_finalize(self) -> None:
+        if not self._partial:
+            # Nothing in flight - every turn is already final
+            self._finish()
+            return
+        self._finalizing = True
+        self._client.force_endpoint()
+        self._finalize_timer = self._loop.call_later(self.finalize_timeout, self._finish)
+
+    def _finish(self) -> None:
+        if self._finalize_timer is not None:
+            self._finalize_timer.cancel()
+            self._finalize_timer = None
+        # On timeout, the last partial is the best transcript there is
+        text = self._utterance(self._partial)
+        self._turns, self._partial, self._finalizing = [], "", False
+        self._events.put_nowait(TranscriptEvent(text, True))
+
+
+class BufferedTranscription(StreamingTranscription):
+    """
+    Buffer the utterance and transcribe it in one batch call at its end
+
+    - **transcribe**: Async callable turning the complete audio into text
+    """
+
+    def __init__(self, transcribe: Callable[[bytes], Awaitable[str]]):
+        super().__init__()
+        self._transcribe = transcribe
+        self._buffer = bytearray()
+        self._pending: Optional[asyncio.Task] = None
+
+    async def send_audio(self, chunk: bytes) -> None:
+        self._buffer.extend(chunk)
+
+    async def end_utterance(self) -> None:
+        audio, self._buffer = bytes(self._buffer), bytearray()
+        # Don't hold up the receiver while the batch call runs
+        self._pending = asyncio.create_task(self._finish(audio))
+
+    async def _finish(self, audio: bytes) -> None:
+        try:
+            self._emit(await self._transcribe(audio) if audio else "", True)
+        except Exception as e:
+            self._fail(e)
+
+    async def close(self) -> None:
+        if self._pending is not None:
+            self._pending.cancel()
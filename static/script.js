@@ -17,12 +17,86 @@ function initializeSession() {
         const newUrl = new URL(window.location);
         newUrl.searchParams.set('session_id', currentSessionId);
         window.history.pushState(null, '', newUrl.toString());
+    } else {
+        // Reloaded page: bring the conversation back
+        loadChatHistory();
     }
     
     console.log("🆔 Session ID:", currentSessionId);
     updateSessionDisplay();
 }
 
+// Chat history restore (newest page first, older pages on demand)
+const HISTORY_PAGE_SIZE = 20;
+
+async function loadChatHistory(before = null) {
+    const sessionId = currentSessionId;
+    const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE });
+    if (before !== null) params.set('before', before);
+    try {
+        // The browser revalidates with If-None-Match, so an unchanged page costs a 304
+        const response = await fetch(`/agent/history/${encodeURIComponent(sessionId)}?${params}`);
+        if (!response.ok) return;
+        const page = await response.json();
+        // The chat may have been cleared while the page was loading
+        if (sessionId === currentSessionId) {
+            renderHistoryPage(page, before !== null);
+        }
+    } catch (error) {
+        console.warn('Could not restore chat history:', error);
+    }
+}
+
+function renderHistoryPage(page, older) {
+    const chatMessages = document.getElementById('chatMessages');
+    if (!chatMessages || !page.messages || page.messages.length === 0) return;
+
+    const previousButton = document.getElementById('loadEarlierBtn');
+    if (previousButton) previousButton.remove();
+
+    const fragment = document.createDocumentFragment();
+    if (page.prev_cursor !== null) {
+        const button = document.createElement('button');
+        button.id = 'loadEarlierBtn';
+        button.className = 'btn btn-clear load-earlier';
+        button.textContent = 'Load earlier messages';
+        button.addEventListener('click', () => {
+            button.disabled = true;
+            loadChatHistory(page.prev_cursor);
+        });
+        fragment.appendChild(button);
+    }
+    page.messages.forEach(message => fragment.appendChild(createHistoryMessage(message)));
+
+    // Older pages go above the oldest message shown, the first page after the welcome message
+    const anchor = chatMessages.querySelector('.message.history') ||
+        (older ? null : chatMessages.querySelector('.welcome-message')?.nextSibling);
+    const scrollFromBottom = chatMessages.scrollHeight - chatMessages.scrollTop;
+    chatMessages.insertBefore(fragment, anchor || null);
+    if (older) {
+        chatMessages.scrollTop = chatMessages.scrollHeight - scrollFromBottom;
+    } else {
+        scrollToBottom();
+    }
+}
+
+function createHistoryMessage(message) {
+    const isUser = message.role === 'user';
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${isUser ? 'user' : 'ai'} history`;
+    const time = message.timestamp
+        ? new Date(message.timestamp).toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'})
+        : '';
+    messageDiv.innerHTML = `
+        <div class="${isUser ? 'user' : 'ai'}-avatar">${isUser ? '👤' : '🤖'}</div>
+        <div class="message-content">
+            <div class="message-text">${escapeHtml(message.content || '')}</div>
+            <div class="message-timestamp">${time}</div>
+        </div>
+    `;
+    return messageDiv;
+}
+
 function generateSessionId() {
     return 'sess_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
 }
@@ -116,6 +190,7 @@ let isProcessing = false;
 let recordingTimer = null;
 let recordingStartTime = 0;
 let currentAudio = null;
+let liveSession = null;
 
 // New Voice Chat Functions
 function handleMicClick() {
@@ -141,6 +216,9 @@ async function startRecording() {
             } 
         });
         
+        // Stream audio for live transcription; MediaRecorder's clip is the fallback
+        liveSession = openLiveSession(stream);
+        
         // Initialize MediaRecorder
         recordedChunks = [];
         mediaRecorder = new MediaRecorder(stream, {
@@ -159,7 +237,14 @@ async function startRecording() {
             const blob = new Blob(recordedChunks, { type: 'audio/webm' });
             
             // Start processing
-            processVoiceMessage(blob);
+            const session = liveSession;
+            liveSession = null;
+            if (session && session.isReady()) {
+                processLiveVoiceMessage(session, blob);
+            } else {
+                if (session) session.close();
+                processVoiceMessage(blob);
+            }
             
             // Stop all tracks to free up microphone
             stream.getTracks().forEach(track => track.stop());
@@ -366,21 +451,40 @@ async function processVoiceMessage(audioBlob) {
         
         let response, result;
         
-        try {
-            response = await fetch(`/agent/chat/${currentSessionId}`, {
-                method: 'POST',
-                body: formData
-            });
-            result = await response.json();
-        } catch (networkError) {
-            console.error('Network error:', networkError);
-            throw new Error('Unable to connect to the server. Please check your internet connection.');
+        // Preferred path: streamed reply, audio starts playing after the first sentence
+        result = await streamVoiceMessage(formData);
+        if (result && result.type === 'done') {
+            completeStreamedTurn(result);
+            return;
+        }
+        
+        // Streaming unavailable before anything arrived - use the single-response endpoint
+        if (!result) {
+            try {
+                response = await fetch(`/agent/chat/${currentSessionId}`, {
+                    method: 'POST',
+                    body: formData
+                });
+                result = await response.json();
+            } catch (networkError) {
+                console.error('Network error:', networkError);
+                throw new Error('Unable to connect to the server. Please check your internet connection.');
+            }
         }
         
         // Handle API errors with user-friendly messages
-        if (!response.ok || !result.success) {
+        if ((response && !response.ok) || !result.success) {
             const errorMessage = result.message || result.detail || 'Processing failed';
             
+            // Turn not admitted (429/503): nothing ran, wait as long as the server asked
+            if (result.retry_after) {
+                hideProgress();
+                addSystemMessage(`❌ ${errorMessage}`);
+                await playFallbackMessage(errorMessage);
+                holdMicFor(result.retry_after);
+                return;
+            }
+            
             // Play fallback audio if available or use text-to-speech fallback
             if (result.fallback_audio) {
                 await playFallbackAudio(result.fallback_audio);
@@ -452,6 +556,356 @@ async function processVoiceMessage(audioBlob) {
     }
 }
 
+// Streaming voice chat
+// Reads NDJSON events from /agent/chat/{id}/stream. Returns the "done" event when the
+// turn was streamed, the JSON error body if the server answered without streaming
+// (e.g. transcription failed, or the turn was not admitted - with retry_after), or
+// null if the request failed on the network or without an answer to show, so the
+// caller can fall back to /agent/chat.
+async function streamVoiceMessage(formData) {
+    let response;
+    try {
+        response = await fetch(`/agent/chat/${currentSessionId}/stream`, {
+            method: 'POST',
+            body: formData
+        });
+    } catch (networkError) {
+        console.warn('Streaming request failed, falling back:', networkError);
+        return null;
+    }
+    
+    const contentType = response.headers.get('content-type') || '';
+    if (!response.ok) {
+        // Rejections (429/503) and client errors are final: posting the same turn to
+        // /agent/chat would double the load on a busy server or run the turn twice
+        const body = await response.json().catch(() => null);
+        const final = response.status === 429 || response.status === 503 || response.status < 500;
+        if (!body && !final) {
+            return null;
+        }
+        return {
+            ...body,
+            success: false,
+            message: (body && (body.message || (typeof body.detail === 'string' && body.detail)))
+                || `The server answered ${response.status}. Please try again.`,
+            retry_after: retryAfterSeconds(response, body),
+        };
+    }
+    if (!response.body) {
+        return null;
+    }
+    if (!contentType.includes('application/x-ndjson')) {
+        return await response.json();
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const renderer = createTurnRenderer();
+    let buffer = '';
+    
+    try {
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const event = JSON.parse(line);
+                if (renderer.handle(event)) {
+                    return event;
+                }
+            }
+        }
+    } catch (streamError) {
+        console.error('Streaming error:', streamError);
+        if (renderer.eventsReceived() === 0) {
+            return null;
+        }
+    }
+    renderer.finish();
+    throw new Error('The response was interrupted. Please try again.');
+}
+
+// Seconds from a rejected turn's Retry-After header (or its retry_after field), null if neither
+function retryAfterSeconds(response, body) {
+    const header = parseInt(response.headers.get('retry-after'), 10);
+    if (!isNaN(header)) {
+        return header;
+    }
+    return (body && body.retry_after) || null;
+}
+
+// Keep the mic disabled until the server's Retry-After has passed
+function holdMicFor(seconds) {
+    let remaining = Math.max(1, Math.ceil(seconds));
+    isProcessing = true;
+    updateMicButton('processing');
+    updateMicStatus(`Server busy - try again in ${remaining}s`);
+    const timer = setInterval(() => {
+        remaining--;
+        if (remaining > 0) {
+            updateMicStatus(`Server busy - try again in ${remaining}s`);
+            return;
+        }
+        clearInterval(timer);
+        updateMicButton('ready');
+        updateMicStatus('Tap to start');
+        isProcessing = false;
+    }, 1000);
+}
+
+// Renders the events of one streamed turn (shared by the NDJSON stream and the WebSocket);
+// handle() returns true once the turn is done
+function createTurnRenderer() {
+    const player = createSegmentPlayer();
+    let aiMessage = null;
+    let received = 0;
+    
+    return {
+        handle(event) {
+            received++;
+            if (event.type === 'transcription') {
+                updateProgress('✅ Transcription complete', 50);
+                addUserMessage(event.user_message || "No speech detected");
+                updateProgress('🤖 AI is thinking...', 75);
+            } else if (event.type === 'segment') {
+                if (!aiMessage) {
+                    updateProgress('🎵 Speaking...', 90);
+                    aiMessage = addStreamingAiMessage();
+                }
+                aiMessage.append(event.text);
+                if (event.audio_file) {
+                    player.enqueue(event.audio_file);
+                }
+            } else if (event.type === 'done') {
+                player.finish();
+                return true;
+            }
+            return false;
+        },
+        eventsReceived() {
+            return received;
+        },
+        finish() {
+            player.finish();
+        }
+    };
+}
+
+function completeStreamedTurn(result) {
+    updateProgress('✅ Complete!', 100);
+    setTimeout(() => {
+        hideProgress();
+        updateMicButton('ready');
+        updateMicStatus('Tap to start');
+        isProcessing = false;
+    }, 1000);
+    console.log('🤖 Voice chat streamed successfully:', result);
+}
+
+// Live transcription: streams 16-bit PCM over /ws/agent/{id} while the user is still
+// talking, so only the end of the utterance is left to transcribe when they stop.
+// Returns null if the browser can't do it; MediaRecorder keeps recording as the fallback.
+function openLiveSession(stream) {
+    if (!('WebSocket' in window) || !window.AudioContext) {
+        return null;
+    }
+    
+    let audioContext, source, processor;
+    try {
+        audioContext = new AudioContext({ sampleRate: 16000 });
+        source = audioContext.createMediaStreamSource(stream);
+        processor = audioContext.createScriptProcessor(4096, 1, 1);
+    } catch (error) {
+        console.warn('Live transcription unavailable:', error);
+        if (audioContext) audioContext.close();
+        return null;
+    }
+    
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const socket = new WebSocket(`${protocol}//${window.location.host}/ws/agent/${currentSessionId}`);
+    socket.binaryType = 'arraybuffer';
+    const pendingAudio = [];  // captured before the server was ready
+    let ready = false;
+    let renderer = null;
+    let resolveTurn = null;
+    
+    function settle(result) {
+        if (resolveTurn) {
+            resolveTurn(result);
+            resolveTurn = null;
+        }
+    }
+    
+    function stopCapture() {
+        processor.onaudioprocess = null;
+        source.disconnect();
+        processor.disconnect();
+        audioContext.close();
+    }
+    
+    socket.onopen = () => {
+        socket.send(JSON.stringify({ type: 'start', format: 'pcm16', sample_rate: audioContext.sampleRate }));
+    };
+    
+    socket.onmessage = (message) => {
+        const event = JSON.parse(message.data);
+        if (event.type === 'ready') {
+            ready = true;
+            pendingAudio.splice(0).forEach(chunk => socket.send(chunk));
+        } else if (event.type === 'partial') {
+            if (isRecording) updateMicStatus(`Hearing: ${event.text}`);
+        } else if (event.type === 'error') {
+            settle(event);
+        } else if (renderer && renderer.handle(event)) {
+            settle(event);
+        }
+    };
+    
+    socket.onclose = () => {
+        ready = false;
+        if (!renderer || renderer.eventsReceived() === 0) {
+            settle(null);
+        } else {
+            renderer.finish();
+            settle({ type: 'error', message: 'The response was interrupted. Please try again.' });
+        }
+    };
+    
+    processor.onaudioprocess = (e) => {
+        const input = e.inputBuffer.getChannelData(0);
+        const pcm = new Int16Array(input.length);
+        for (let i = 0; i < input.length; i++) {
+            const sample = Math.max(-1, Math.min(1, input[i]));
+            pcm[i] = sample < 0 ? sample * 0x8000 : sample * 0x7fff;
+        }
+        if (ready) {
+            socket.send(pcm.buffer);
+        } else {
+            pendingAudio.push(pcm.buffer);
+        }
+    };
+    source.connect(processor);
+    processor.connect(audioContext.destination);
+    
+    return {
+        isReady() {
+            return ready && socket.readyState === WebSocket.OPEN;
+        },
+        // Stop capturing and end the utterance; resolves with the "done" or "error"
+        // event, or null if the socket failed before the turn started
+        finish() {
+            stopCapture();
+            renderer = createTurnRenderer();
+            return new Promise(resolve => {
+                resolveTurn = resolve;
+                socket.send(JSON.stringify({ type: 'end' }));
+            });
+        },
+        close() {
+            if (audioContext.state !== 'closed') stopCapture();
+            socket.close();
+        }
+    };
+}
+
+// Finish a recording that was streamed live; falls back to uploading the recording
+async function processLiveVoiceMessage(session, audioBlob) {
+    isProcessing = true;
+    updateMicButton('processing');
+    updateProgress('🎤 Finishing transcription...', 25);
+    
+    const result = await session.finish();
+    session.close();
+    
+    if (!result) {
+        console.warn('Live session dropped, uploading the recording instead');
+        await processVoiceMessage(audioBlob);
+    } else if (result.type === 'done') {
+        completeStreamedTurn(result);
+    } else {
+        const errorMessage = result.message || 'Processing failed';
+        console.error('Voice processing error:', errorMessage);
+        hideProgress();
+        addSystemMessage(`❌ ${errorMessage}`);
+        await playFallbackMessage(errorMessage);
+        if (result.retry_after) {
+            holdMicFor(result.retry_after);
+            return;
+        }
+        updateMicButton('ready');
+        updateMicStatus('Tap to start');
+        isProcessing = false;
+    }
+}
+
+// AI message bubble whose text grows as segments arrive
+function addStreamingAiMessage() {
+    const chatMessages = document.getElementById('chatMessages');
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message ai';
+    messageDiv.innerHTML = `
+        <div class="ai-avatar">🤖</div>
+        <div class="message-content">
+            <div class="message-text"></div>
+            <div class="message-timestamp">${getCurrentTime()}</div>
+        </div>
+    `;
+    if (chatMessages) {
+        chatMessages.appendChild(messageDiv);
+        scrollToBottom();
+    }
+    
+    const textDiv = messageDiv.querySelector('.message-text');
+    return {
+        append(text) {
+            textDiv.textContent = textDiv.textContent ? `${textDiv.textContent} ${text}` : text;
+            scrollToBottom();
+        }
+    };
+}
+
+// Plays segment audio one after another in arrival order; calls handleAudioEnd once
+// the stream is finished and the last segment has played
+function createSegmentPlayer() {
+    const queue = [];
+    let playing = false;
+    let finished = false;
+    
+    function playNext() {
+        if (queue.length === 0) {
+            playing = false;
+            if (finished) {
+                handleAudioEnd();
+            }
+            return;
+        }
+        playing = true;
+        const audio = new Audio(queue.shift());
+        currentAudio = audio;
+        audio.onended = playNext;
+        audio.onerror = playNext;
+        audio.play().catch(() => {
+            console.log('Autoplay prevented - skipping segment audio');
+            playNext();
+        });
+    }
+    
+    return {
+        enqueue(audioUrl) {
+            queue.push(audioUrl);
+            if (!playing) playNext();
+        },
+        finish() {
+            finished = true;
+            if (!playing) handleAudioEnd();
+        }
+    };
+}
+
 // Handle audio playback end for auto-recording
 function handleAudioEnd() {
     if (!isProcessing && !isRecording) {
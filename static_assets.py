@@ -0,0 +1,172 @@
+"""
+Static asset delivery: precompressed, fingerprinted files and a prerendered index page
+
+`/static` used to be a plain StaticFiles mount and `/` rendered index.html
+through Jinja2 on every request: no compression, no cache headers beyond
+Last-Modified, so every page load downloaded script.js and style.css again.
+At startup, `StaticAssets.build()` now reads every file under the static
+directory once and keeps in memory:
+
+- the file, plus gzip and (with the `brotli` package) brotli variants when
+  they are smaller - the response carries the best one the request's
+  Accept-Encoding allows, with `Vary: Accept-Encoding`
+- a content fingerprint: templates link `{{ asset('script.js') }}`, which
+  becomes `/static/script.<fingerprint>.js`, served with immutable cache
+  headers (a changed file gets a new URL). The plain name still works, with
+  `Cache-Control: no-cache` and ETag revalidation.
+
+Files not found at startup fall through to StaticFiles. `render_page()`
+renders a template that has no per-request data (index.html) once, with the
+same variants and an ETag.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# Below this, compression doesn't pay for the Content-Encoding header
+MIN_COMPRESS_BYTES = 256
+# Preference order among the encodings a client accepts
+ENCODINGS = ("br", "gzip")
+
+
+def _accepted_encodings(header: Optional[str]) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}"""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class Asset:
+    """
+    One response body in every encoding worth sending
+
+    - **body**: The uncompressed bytes
+    - **media_type**: Content-Type
+    """
+
+    def __init__(self, body: bytes, media_type: str):
+        self.media_type = media_type
+        self.fingerprint = hashlib.sha256(body).hexdigest()[:12]
+        self.variants: Dict[str, bytes] = {"identity": body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            compressed = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(body, quality=11)
+            for encoding, data in compressed.items():
+                if len(data) < len(body):
+                    self.variants[encoding] = data
+
+    def encoding_for(self, accept_encoding: Optional[str]) -> str:
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ENCODINGS:
+            if encoding in self.variants and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+                return encoding
+        return "identity"
+
+    def response(self, scope: Scope, cache_control: str) -> Response:
+        """The variant for the request's Accept-Encoding, or 304 if its ETag is current"""
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        encoding = self.encoding_for(headers.get("accept-encoding"))
+        etag = f'"{self.fingerprint}-{encoding}"'
+        response_headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))):
+            return Response(status_code=304, headers=response_headers)
+        body = self.variants[encoding]
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        if scope.get("method") == "HEAD":
+            response_headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(body, media_type=self.media_type, headers=response_headers)
+
+
+class StaticAssets:
+    """
+    ASGI app for the /static mount, serving the files as of build()
+
+    - **directory**: The static directory
+    - **url_prefix**: Where the app is mounted
+    """
+
+    def __init__(self, directory: Path, url_prefix: str = "/static/"):
+        self.directory = Path(directory)
+        self.url_prefix = url_prefix
+        self.fallback = StaticFiles(directory=str(directory))
+        # Request path (plain and fingerprinted) -> (asset, immutable)
+        self._routes: Dict[str, Any] = {}
+        # Plain path -> fingerprinted path
+        self.manifest: Dict[str, str] = {}
+
+    def build(self) -> None:
+        """Read, fingerprint and compress every file (blocking - run it off the event loop)"""
+        routes, manifest = {}, {}
+        raw_bytes = sent_bytes = 0
+        for path in sorted(self.directory.rglob("*")):
+            if not path.is_file() or path.name.startswith("."):
+                continue
+            name = path.relative_to(self.directory).as_posix()
+            media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if media_type.startswith("text/") or media_type in ("application/javascript", "image/svg+xml"):
+                media_type += "; charset=utf-8"
+            asset = Asset(path.read_bytes(), media_type)
+            stem, dot, suffix = name.rpartition(".")
+            hashed = f"{stem}.{asset.fingerprint}.{suffix}" if dot else f"{name}.{asset.fingerprint}"
+            routes[name] = (asset, False)
+            routes[hashed] = (asset, True)
+            manifest[name] = hashed
+            raw_bytes += len(asset.variants["identity"])
+            sent_bytes += min(len(data) for data in asset.variants.values())
+        self._routes, self.manifest = routes, manifest
+        logger.info(f"📦 {len(manifest)} static assets fingerprinted, {raw_bytes // 1024}KB -> "
+                    f"{sent_bytes // 1024}KB compressed ({'brotli + gzip' if brotli is not None else 'gzip'})")
+
+    def url(self, name: str) -> str:
+        """URL of a static file (the templates' `asset()`): fingerprinted once built, the plain one before"""
+        return self.url_prefix + self.manifest.get(name, name)
+
+    def render_page(self, templates, name: str) -> Asset:
+        """
+        Render a template once, for pages without per-request data
+
+        - **templates**: The Jinja2Templates instance
+        """
+        html = templates.get_template(name).render()
+        return Asset(html.encode("utf-8"), "text/html; charset=utf-8")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope.get("method") in ("GET", "HEAD"):
+            route = self._routes.get(self.fallback.get_path(scope).lstrip("/"))
+            if route is not None:
+                asset, immutable = route
+                await asset.response(scope, IMMUTABLE if immutable else REVALIDATE)(scope, receive, send)
+                return
+        await self.fallback(scope, receive, send)
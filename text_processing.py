@@ -0,0 +1,145 @@
+"""
+Text helpers for the TTS side of the pipeline
+
+- `trim_text_for_tts`: cut a full response down to Murf's character limit
+- `chunk_text_for_tts`: split a long document into chunks within that limit,
+  cut where `trim_text_for_tts` would cut (bulk narration, /api/tts/batch)
+- `SentenceSplitter`: split a streamed LLM response into sentences as it arrives,
+  so each sentence can go to TTS before the response is complete
+
+Both use the same sentence-boundary heuristic (`is_sentence_end`).
+"""
+from typing import List, Tuple
+
+SENTENCE_ENDINGS = ('.', '!', '?')
+
+
+def is_sentence_end(text: str, i: int) -> bool:
+    """
+    Whether text[i] ends a sentence
+
+    Simple heuristic to skip abbreviations: a sentence ending (. ! ?) followed
+    by a space and a capital letter is likely a sentence end. Needs two
+    characters of lookahead, so a streaming caller must wait for them.
+    """
+    return (
+        text[i] in SENTENCE_ENDINGS
+        and i + 2 < len(text)
+        and text[i + 1] == ' '
+        and text[i + 2].isupper()
+    )
+
+
+def find_tts_break(text: str, max_chars: int) -> Tuple[int, str]:
+    """
+    Where to cut text that is longer than max_chars
+
+    Returns (end, kind): text[:end] is the part to keep and kind is "sentence",
+    "paragraph", "word" or "hard", in order of preference. Only breaks in the
+    second half of the window that keep more than 50 characters are used.
+    """
+    # Find the last complete sentence within the limit
+    # Start from the max_chars position and work backwards
+    for i in range(max_chars - 1, max_chars // 2, -1):
+        if is_sentence_end(text, i) and len(text[:i + 1].strip()) > 50:
+            return i + 1, "sentence"
+
+    # If no good sentence break found, look for paragraph breaks
+    for i in range(max_chars - 1, max_chars // 2, -1):
+        if text[i] == '\n' and len(text[:i].strip()) > 50:
+            return i, "paragraph"
+
+    # If no good break found, just cut at word boundary
+    # Find the last space before the limit
+    for i in range(max_chars - 1, max_chars // 2, -1):
+        if text[i] == ' ' and len(text[:i].strip()) > 50:
+            return i, "word"
+
+    return max_chars, "hard"
+
+
+def trim_text_for_tts(text: str, max_chars: int = 3000) -> str:
+    """
+    Trim text to fit within Murf TTS character limits while preserving sentence structure
+
+    - **text**: The text to trim
+    - **max_chars**: Maximum character limit (default: 3000 for Murf)
+
+    Returns trimmed text that ends at a complete sentence when possible
+    """
+    if len(text) <= max_chars:
+        return text
+
+    end, kind = find_tts_break(text, max_chars)
+    if kind == "word":
+        return text[:end].strip() + "..."
+    if kind == "hard":
+        # Last resort: hard cut with ellipsis
+        return text[:max_chars - 3].strip() + "..."
+    return text[:end].strip()
+
+
+def chunk_text_for_tts(text: str, max_chars: int = 3000) -> List[str]:
+    """
+    Split text into chunks of at most max_chars, nothing dropped
+
+    - **text**: The text to split (a chapter, a prompt set, ...)
+    - **max_chars**: Longest chunk (Murf's per-request limit is 3000)
+
+    Each chunk ends where trim_text_for_tts would have cut - at a sentence end
+    when possible - so the pieces can be synthesized separately and played in order.
+    """
+    chunks = []
+    rest = text.strip()
+    while len(rest) > max_chars:
+        end, _ = find_tts_break(rest, max_chars)
+        chunks.append(rest[:end].strip())
+        rest = rest[end:].strip()
+    if rest:
+        chunks.append(rest)
+    return chunks
+
+
+class SentenceSplitter:
+    """
+    Incrementally split streamed text into sentences
+
+    - **min_chars**: Sentences shorter than this are merged with the next one
+      (one TTS call for "Sure. Here's how." instead of two)
+    - **max_chars**: Longest segment handed out; longer runs without a sentence
+      end are cut at a word boundary (Murf's per-request limit is 3000)
+    """
+
+    def __init__(self, min_chars: int = 20, max_chars: int = 3000):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+        self._scan_from = 0
+
+    def feed(self, chunk: str) -> List[str]:
+        """Add streamed text; returns the sentences completed by it"""
+        self._buffer += chunk
+        sentences = []
+        start = 0
+        i = self._scan_from
+        while i < len(self._buffer):
+            if is_sentence_end(self._buffer, i) and len(self._buffer[start:i + 1].strip()) >= self.min_chars:
+                sentences.append(self._buffer[start:i + 1].strip())
+                start = i + 1
+            elif i + 1 - start >= self.max_chars:
+                cut = self._buffer.rfind(' ', start, i + 1)
+                end = cut if cut > start else i + 1
+                sentences.append(self._buffer[start:end].strip())
+                start = end
+            i += 1
+        self._buffer = self._buffer[start:]
+        # The last two characters may still turn out to be a boundary once more text arrives
+        self._scan_from = max(0, len(self._buffer) - 2)
+        return [sentence for sentence in sentences if sentence]
+
+    def flush(self) -> List[str]:
+        """End of stream: return whatever text is left as the final sentence"""
+        remainder = self._buffer.strip()
+        self._buffer = ""
+        self._scan_from = 0
+        return [remainder] if remainder else []
@@ -0,0 +1,209 @@
+"""
+Bulk narration behind /api/tts/batch
+
+Audiobook chapters and IVR prompt sets used to go through /api/tts one HTTP
+request per snippet, each capped at 5000 characters. A batch takes many
+items or one long document:
+
+- every item is split at sentence boundaries (`chunk_text_for_tts`) instead
+  of being rejected or truncated
+- identical chunks (same text and voice, e.g. a repeated IVR prompt) are
+  synthesized once per batch; across batches the audio store / TTS cache
+  answers them without a Murf call
+- chunks are synthesized concurrently, but Murf calls go through `slot()`:
+  at most `concurrency` at once (cache hits skip it). Batch work is not hedged
+  and leaves room on the "tts" pool for interactive turns; the provider quota
+  is the "tts" scheduler's (TTS_RATE_PER_SECOND, see scheduler.py), shared
+  with every other Murf call rather than a second token bucket here.
+- a batch either answers with the ordered results or runs as a job whose
+  status and results are polled; jobs live in this process's memory for
+  `job_ttl` seconds after they finish
+"""
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from executor import env_float, env_int
+from resilience import QueueTimeout
+from text_processing import chunk_text_for_tts
+
+logger = logging.getLogger(__name__)
+
+# synthesize(text, voice_id, slot) -> (audio URL or None, already cached)
+Synthesize = Callable[[str, str, Callable[[], Any]], Awaitable[Tuple[Optional[str], bool]]]
+
+
+class BatchJob:
+    """
+    One batch: its items split into chunks, and the result of each chunk
+
+    - **items**: [(item id, text, voice_id)]
+    """
+
+    def __init__(self, items: List[Tuple[Optional[str], str, str]], chunk_chars: int):
+        self.job_id = uuid.uuid4().hex
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.items = [
+            {"id": item_id, "voice_id": voice_id, "chunks": chunk_text_for_tts(text, chunk_chars)}
+            for item_id, text, voice_id in items
+        ]
+        # (item index, chunk index) -> {"audio_file", "cached", "error"}
+        self.results: Dict[Tuple[int, int], Dict[str, Any]] = {}
+
+    @property
+    def total_chunks(self) -> int:
+        return sum(len(item["chunks"]) for item in self.items)
+
+    def to_dict(self, include_results: bool = True) -> Dict[str, Any]:
+        failed = sum(1 for result in self.results.values() if not result["audio_file"])
+        response = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "progress": {"done": len(self.results), "total": self.total_chunks, "failed": failed},
+        }
+        if include_results and self.status == "done":
+            response["items"] = [
+                {
+                    "id": item["id"],
+                    "success": all(self.results[(i, c)]["audio_file"] for c in range(len(item["chunks"]))),
+                    "segments": [
+                        {"text": chunk, **self.results[(i, c)]} for c, chunk in enumerate(item["chunks"])
+                    ],
+                }
+                for i, item in enumerate(self.items)
+            ]
+        return response
+
+
+class TTSBatchRunner:
+    """
+    Synthesizes batches with bounded Murf concurrency and keeps their jobs
+
+    - **synthesize**: Async (text, voice_id, slot) -> (URL or None, cached); must enter
+      `slot()` around the upstream call only
+    - **concurrency**: Murf calls in flight for all batches together
+    - **chunk_chars**: Longest chunk sent to Murf
+    - **max_items** / **max_chars**: Largest batch accepted (items, characters over all items)
+    - **max_jobs** / **job_ttl**: Jobs kept for polling, and for how long after they finish
+    """
+
+    def __init__(self, synthesize: Synthesize, concurrency: int = 4, chunk_chars: int = 1000, max_items: int = 200, max_chars: int = 200_000,
+                 max_jobs: int = 100, job_ttl: float = 3600.0):
+        self._synthesize = synthesize
+        self.concurrency = concurrency
+        self.chunk_chars = chunk_chars
+        self.max_items = max_items
+        self.max_chars = max_chars
+        self.max_jobs = max_jobs
+        self.job_ttl = job_ttl
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._jobs: Dict[str, BatchJob] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.counters = {
+            "batches": 0,
+            "chunks": 0,
+            "deduplicated": 0,
+            "cached": 0,
+            "synthesized": 0,
+            "failed": 0,
+        }
+
+    @classmethod
+    def from_env(cls, synthesize: Synthesize) -> "TTSBatchRunner":
+        """Limits from the TTS_BATCH_* variables (see .env.example)"""
+        return cls(
+            synthesize,
+            concurrency=env_int("TTS_BATCH_CONCURRENCY", 4),
+            chunk_chars=env_int("TTS_BATCH_CHUNK_CHARS", 1000),
+            max_items=env_int("TTS_BATCH_MAX_ITEMS", 200),
+            max_chars=env_int("TTS_BATCH_MAX_CHARS", 200_000),
+            max_jobs=env_int("TTS_BATCH_MAX_JOBS", 100),
+            job_ttl=env_float("TTS_BATCH_JOB_TTL_SECONDS", 3600.0),
+        )
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Held around each batch Murf call"""
+        async with self._semaphore:
+            yield
+
+    def plan(self, items: List[Tuple[Optional[str], str, str]]) -> BatchJob:
+        return BatchJob(items, self.chunk_chars)
+
+    async def run(self, job: BatchJob) -> BatchJob:
+        """Synthesize every chunk of job; failures are recorded per chunk"""
+        job.status = "running"
+        self.counters["batches"] += 1
+        # Identical chunks are synthesized once and fanned out
+        positions: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        for i, item in enumerate(job.items):
+            for c, chunk in enumerate(item["chunks"]):
+                positions.setdefault((chunk, item["voice_id"]), []).append((i, c))
+        self.counters["chunks"] += job.total_chunks
+        self.counters["deduplicated"] += job.total_chunks - len(positions)
+
+        async def synthesize(text: str, voice_id: str, targets: List[Tuple[int, int]]) -> None:
+            try:
+                audio_file, cached = await self._synthesize(text, voice_id, self.slot)
+                result = {"audio_file": audio_file, "cached": cached, "error": None if audio_file else "no_audio"}
+            except QueueTimeout as e:
+                logger.warning(f"⚠️ Batch TTS chunk not sent: {e}")
+                result = {"audio_file": None, "cached": False, "error": "queue_timeout"}
+            except Exception as e:
+                logger.warning(f"⚠️ Batch TTS chunk failed: {type(e).__name__}: {e}")
+                result = {"audio_file": None, "cached": False, "error": "service_error"}
+            if not result["audio_file"]:
+                self.counters["failed"] += 1
+            else:
+                self.counters["cached" if result["cached"] else "synthesized"] += 1
+            for target in targets:
+                job.results[target] = result
+
+        try:
+            await asyncio.gather(*(synthesize(text, voice_id, targets)
+                                   for (text, voice_id), targets in positions.items()))
+            job.status = "done"
+        except BaseException:
+            job.status = "failed"
+            raise
+        finally:
+            job.finished_at = time.time()
+        logger.info(f"🗣️ Batch {job.job_id[:8]}: {job.total_chunks} chunks, {len(positions)} unique, "
+                    f"{sum(1 for r in job.results.values() if not r['audio_file'])} failed")
+        return job
+
+    def submit(self, job: BatchJob) -> bool:
+        """Run job in the background for polling; False if max_jobs are already kept"""
+        self._prune()
+        if len(self._jobs) >= self.max_jobs:
+            return False
+        self._jobs[job.job_id] = job
+        task = asyncio.create_task(self.run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        self._prune()
+        return self._jobs.get(job_id)
+
+    def _prune(self) -> None:
+        expired = time.time() - self.job_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < expired:
+                del self._jobs[job_id]
+
+    async def stop(self) -> None:
+        """Cancel running jobs (called from the lifespan on shutdown)"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        running = sum(1 for job in self._jobs.values() if job.finished_at is None)
+        return {**self.counters, "jobs_kept": len(self._jobs), "jobs_running": running}
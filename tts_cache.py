@@ -0,0 +1,211 @@
+"""
+Content-addressed cache for Murf TTS results
+
+Identical text + voice combinations (fallback lines, common assistant replies)
+used to go to Murf every time. Results are cached under a hash of the
+normalized text and voice_id:
+
+- an in-memory LRU tier per worker
+- an optional MongoDB tier shared by all workers (TTS_CACHE_BACKEND=mongodb)
+- entries expire before Murf's 72-hour audio link does
+- concurrent identical requests share a single upstream call (in-flight dedup)
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ASCENDING
+
+logger = logging.getLogger(__name__)
+
+# Murf audio links are valid for 72 hours; stop serving them an hour early so a
+# cached link never expires while the browser is still fetching it
+MURF_LINK_TTL_SECONDS = 72 * 3600
+DEFAULT_TTL_SECONDS = MURF_LINK_TTL_SECONDS - 3600
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace runs and trim - differences Murf doesn't voice anyway"""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def cache_key(text: str, voice_id: str) -> str:
+    """Content address of a TTS request"""
+    payload = f"{voice_id}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class MongoTTSCacheBackend:
+    """
+    Shared second tier in the tts_cache collection, expired by a TTL index
+
+    Blocking - the cache runs these calls on the "mongodb" upstream pool.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        # The TTL monitor only runs once a minute, so check expiry here too
+        return self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.utcnow()}},
+            {"_id": 0, "audio_file": 1, "expires_at": 1},
+        )
+
+    def put(self, key: str, audio_file: str, expires_at: datetime) -> None:
+        self.collection.replace_one(
+            {"_id": key},
+            {"_id": key, "audio_file": audio_file, "expires_at": expires_at},
+            upsert=True,
+        )
+
+
+class TTSCache:
+    """
+    LRU + TTL cache of generated audio URLs with in-flight deduplication
+
+    - **max_entries**: In-memory LRU capacity
+    - **ttl_seconds**: Lifetime of an entry (defaults to Murf's link lifetime minus an hour)
+    - **backend**: Optional shared tier (e.g. MongoTTSCacheBackend)
+    - **run_blocking**: Async runner for the backend's blocking calls
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 backend: Optional[MongoTTSCacheBackend] = None,
+                 run_blocking: Optional[Callable[..., Awaitable[Any]]] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = min(ttl_seconds, MURF_LINK_TTL_SECONDS)
+        self.backend = backend
+        self._run_blocking = run_blocking
+        # key -> (audio_file, monotonic expiry)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.counters = {
+            "hits": 0,
+            "backend_hits": 0,
+            "misses": 0,
+            "deduplicated": 0,
+            "evictions": 0,
+            "backend_errors": 0,
+        }
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        audio_file, expires = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return audio_file
+
+    def _put_local(self, key: str, audio_file: str, ttl_seconds: float) -> None:
+        self._entries[key] = (audio_file, time.monotonic() + ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    async def get_or_generate(self, text: str, voice_id: str,
+                              generate: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """
+        Return the cached audio URL for (text, voice_id), calling generate() on a miss
+
+        - **generate**: Async callable performing the upstream TTS call; returns the
+          audio URL or None. None results and exceptions are never cached.
+
+        Callers waiting for another caller's generate() get its upstream errors,
+        but not its cancellation (client gone, turn deadline): they then generate
+        the audio themselves.
+        """
+        key = cache_key(text, voice_id)
+        while True:
+            audio_file = self._get_local(key)
+            if audio_file is not None:
+                self.counters["hits"] += 1
+                return audio_file
+
+            # Someone is already generating this exact audio - wait for their result
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            self.counters["deduplicated"] += 1
+            try:
+                return await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                if not in_flight.cancelled():
+                    raise  # this caller was cancelled, not the one generating
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            audio_file = await self._lookup_backend(key)
+            if audio_file is None:
+                self.counters["misses"] += 1
+                audio_file = await generate()
+                if audio_file:
+                    self._put_local(key, audio_file, self.ttl_seconds)
+                    await self._store_backend(key, audio_file)
+            future.set_result(audio_file)
+            return audio_file
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so waiter-less failures don't log "exception never retrieved"
+            future.exception()
+            raise
+        except BaseException:
+            # Cancelled: waiting callers take over rather than inherit the cancellation
+            future.cancel()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def _lookup_backend(self, key: str) -> Optional[str]:
+        if self.backend is None:
+            return None
+        try:
+            entry = await self._run_blocking(self.backend.get, key)
+        except Exception as e:
+            self.counters["backend_errors"] += 1
+            logger.warning(f"⚠️ TTS cache backend read failed: {type(e).__name__}: {e}")
+            return None
+        if not entry:
+            return None
+        self.counters["backend_hits"] += 1
+        remaining = (entry["expires_at"] - datetime.utcnow()).total_seconds()
+        self._put_local(key, entry["audio_file"], remaining)
+        return entry["audio_file"]
+
+    async def _store_backend(self, key: str, audio_file: str) -> None:
+        if self.backend is None:
+            return
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        try:
+            await self._run_blocking(self.backend.put, key, audio_file, expires_at)
+        except Exception as e:
+            self.counters["backend_errors"] += 1
+            logger.warning(f"⚠️ TTS cache backend write failed: {type(e).__name__}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus current size, for /api/tts/cache and metrics"""
+        lookups = self.counters["hits"] + self.counters["backend_hits"] + self.counters["misses"]
+        hits = self.counters["hits"] + self.counters["backend_hits"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "in_flight": len(self._in_flight),
+            "backend": "mongodb" if self.backend is not None else "memory",
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,206 @@
+"""
+Streamed, size-bounded audio uploads
+
+The upload endpoints used to take an `UploadFile`, check `audio_file.size`
+(not always set) and `content_type` (whatever the client claims), then
+`read()` the whole file into memory before handing the bytes to AssemblyAI.
+With concurrent uploads, worker memory grew by up to 25 MB per request.
+
+`receive_audio_upload()` parses the multipart request body as it arrives:
+
+- a Content-Length that is already over the limit is rejected before reading
+- the audio part is counted while it streams, and reading stops as soon as it
+  passes `max_bytes`
+- the format is sniffed from the file's magic bytes; the declared
+  content type is ignored
+- the data goes into a `SpooledTemporaryFile` (in memory up to
+  `SPOOL_MEMORY_BYTES`, then on disk), which the transcriber reads as a file
+  object instead of getting a bytes copy
+"""
+import tempfile
+from typing import BinaryIO, Dict, Optional
+
+from fastapi import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+MAX_AUDIO_BYTES = 25 * 1024 * 1024
+SPOOL_MEMORY_BYTES = 1024 * 1024
+# Allowance for multipart boundaries and part headers when checking Content-Length
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Formats transcribe_file has always accepted, by their magic bytes
+SUPPORTED_FORMATS = ("webm", "wav", "mp3", "ogg")
+
+# OpenAPI request body for endpoints that parse the upload themselves
+AUDIO_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["audio_file"],
+                    "properties": {"audio_file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+class UploadError(Exception):
+    """A rejected upload; `error` and `message` go straight into the endpoint's response"""
+
+    def __init__(self, error: str, message: str):
+        super().__init__(message)
+        self.error = error
+        self.message = message
+
+
+def sniff_audio_format(head: bytes) -> Optional[str]:
+    """Container/codec from the first bytes of a file, or None if not a supported audio format"""
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "webm"  # EBML header (WebM/Matroska)
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head.startswith(b"OggS"):
+        return "ogg"
+    if head.startswith(b"ID3") or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"  # ID3 tag or a bare MPEG audio frame sync
+    return None
+
+
+class AudioUpload:
+    """
+    An uploaded audio file, spooled to memory or disk
+
+    - **file**: Binary file object positioned at the start of the audio
+    - **size**: Bytes received
+    - **format**: Sniffed format (one of SUPPORTED_FORMATS)
+    """
+
+    def __init__(self, file: BinaryIO, size: int, format: str, filename: Optional[str]):
+        self.file = file
+        self.size = size
+        self.format = format
+        self.filename = filename
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _AudioPartReader:
+    """Multipart callbacks that spool one named file part and count its bytes"""
+
+    def __init__(self, field: str, max_bytes: int):
+        self.field = field
+        self.max_bytes = max_bytes
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        self.size = 0
+        self.head = b""
+        self.filename: Optional[str] = None
+        self.found = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._capturing = False
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        self._capturing = not self.found and options.get(b"name", b"").decode("latin-1") == self.field
+        if self._capturing:
+            self.found = True
+            filename = options.get(b"filename")
+            self.filename = filename.decode("utf-8", "replace") if filename is not None else None
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self._capturing:
+            return
+        self.size += end - start
+        if self.size > self.max_bytes:
+            raise UploadError("validation_error", _too_large_message(self.max_bytes))
+        if len(self.head) < 12:
+            self.head += data[start:min(end, start + 12)]
+        self.file.write(data[start:end])
+
+    def _on_part_end(self) -> None:
+        self._capturing = False
+
+
+def _too_large_message(max_bytes: int) -> str:
+    return f"Audio file is too large. Please use files under {max_bytes // (1024 * 1024)}MB."
+
+
+def audio_too_large(max_bytes: int = MAX_AUDIO_BYTES) -> UploadError:
+    """The error for audio over max_bytes that didn't come as a multipart upload (WebSocket utterances)"""
+    return UploadError("validation_error", _too_large_message(max_bytes))
+
+
+async def receive_audio_upload(request: Request, field: str = "audio_file",
+                               max_bytes: int = MAX_AUDIO_BYTES) -> AudioUpload:
+    """
+    Stream the multipart body of request and spool the `field` file part
+
+    Raises UploadError (validation_error) for a missing, empty, oversized or
+    non-audio upload. The caller owns the returned upload and must close() it.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError("validation_error", "Please upload the audio as multipart/form-data.")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise UploadError("validation_error", _too_large_message(max_bytes))
+
+    reader = _AudioPartReader(field, max_bytes)
+    parser = MultipartParser(boundary, reader.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except BaseException:
+        reader.file.close()
+        raise
+
+    if not reader.found:
+        reader.file.close()
+        raise UploadError("validation_error", f"No {field} file in the upload.")
+    if reader.size == 0:
+        reader.file.close()
+        raise UploadError("validation_error", "The audio file appears to be empty. Please try recording again.")
+    audio_format = sniff_audio_format(reader.head)
+    if audio_format is None:
+        reader.file.close()
+        raise UploadError("validation_error", "Unsupported file type. Please use WebM, WAV, MP3, or OGG format.")
+
+    reader.file.seek(0)
+    return AudioUpload(reader.file, reader.size, audio_format, reader.filename)